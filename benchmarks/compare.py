@@ -0,0 +1,81 @@
+"""
+Compare two benchmark results:
+
+    python -m benchmarks.compare                     # two latest runs
+    python -m benchmarks.compare base.json new.json
+
+Lower is better for everything except throughput.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+from benchmarks.run import BENCHMARKS_DIR
+
+METRICS = [
+    ("throughput_rps", lambda r: r["throughput_rps"], True),
+    ("p50 ms", lambda r: r["latency_ms"]["p50"], False),
+    ("p95 ms", lambda r: r["latency_ms"]["p95"], False),
+    ("p99 ms", lambda r: r["latency_ms"]["p99"], False),
+    ("sql/req", lambda r: r["db_queries_per_request"], False),
+    ("api/req", lambda r: r["api_calls_per_request"], False),
+    ("errors", lambda r: r["errors"], False),
+    # sync scenario
+    ("bookings/s", lambda r: r["bookings_per_s"], True),
+    ("sql/booking", lambda r: r["db_queries_per_booking"], False),
+    ("incr. bookings/s", lambda r: r["incremental"]["bookings_per_s"], True),
+]
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(base: dict, new: dict):
+    print(f"base: {base['commit']}{' (dirty)' if base['dirty'] else ''}  {base['timestamp']}")
+    print(f"new:  {new['commit']}{' (dirty)' if new['dirty'] else ''}  {new['timestamp']}")
+    if base["config"] != new["config"]:
+        print(f"warning: different configs\n  base: {base['config']}\n  new:  {new['config']}")
+
+    for scenario, new_result in new["scenarios"].items():
+        base_result = base["scenarios"].get(scenario)
+        if base_result is None:
+            continue
+        print(f"\n{scenario}")
+        for name, value, higher_is_better in METRICS:
+            try:
+                before, after = value(base_result), value(new_result)
+            except KeyError:
+                # Metric of another kind of scenario
+                continue
+            if before:
+                change = (after - before) / before * 100
+                better = change > 0 if higher_is_better else change < 0
+                mark = "" if abs(change) < 5 else (" +" if better else " -")
+                delta = f"{change:+.1f}%{mark}"
+            else:
+                delta = ""
+            print(f"  {name:<15} {before:>10} {after:>10}  {delta}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--results-dir", default=os.path.join(BENCHMARKS_DIR, "results"))
+    args = parser.parse_args(argv)
+
+    files = args.files
+    if not files:
+        files = sorted(glob.glob(os.path.join(args.results_dir, "*.json")))[-2:]
+    if len(files) != 2:
+        print("Need two result files (or at least two runs in the results directory)")
+        return 1
+    compare(load(files[0]), load(files[1]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Local stand-in for the Bukza API.
+
+Keeps bookings in memory and serves the paged changes feed used by the
+reconciliation sync (`GET /bookings/changes`) plus booking cancellation.
+Point the client at it with `bukza_client.api_url = server.url`.
+"""
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+
+from aiohttp import web
+
+
+class FakeBukzaAPI:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        change_interval: timedelta = timedelta(minutes=1),
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        self.latency = latency
+        self.change_interval = change_interval
+        self.host = host
+        self.port = port
+        self.calls: Counter = Counter()
+        # code -> booking in the format of the changes feed
+        self.bookings: dict[str, dict] = {}
+        self._sequence = itertools.count(1)
+        # Changes are spaced `change_interval` apart starting two weeks ago
+        self._clock = datetime.utcnow() - timedelta(days=14)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/bookings/changes", self._changes)
+        app.router.add_post("/bookings/{code}/cancel", self._cancel)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Resolve the port picked by the OS
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _touch(self, booking: dict):
+        self._clock += self.change_interval
+        booking["updated_at"] = self._clock.isoformat() + "Z"
+        booking["_sequence"] = next(self._sequence)
+
+    def put(self, data: dict, status: str = "active") -> dict:
+        """Create or replace a booking from webhook-shaped `data`"""
+        booking = {**data, "code": str(data["code"]), "status": status}
+        self._touch(booking)
+        self.bookings[booking["code"]] = booking
+        return booking
+
+    def cancel(self, code: str):
+        booking = self.bookings[code]
+        booking["status"] = "cancelled"
+        self._touch(booking)
+
+    async def _changes(self, request: web.Request) -> web.Response:
+        self.calls["changes"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        since = request.query.get("since", "")
+        limit = int(request.query.get("limit", "100"))
+        after = int(request.query.get("cursor", "0"))
+
+        # The cursor is the change sequence of the last item returned
+        changed = sorted(
+            (b for b in self.bookings.values() if b["_sequence"] > after and b["updated_at"][:19] >= since),
+            key=lambda b: b["_sequence"]
+        )
+        page = changed[:limit]
+        items = [{k: v for k, v in b.items() if not k.startswith("_")} for b in page]
+        next_cursor = str(page[-1]["_sequence"]) if len(changed) > limit else None
+        return web.json_response({"items": items, "next_cursor": next_cursor})
+
+    async def _cancel(self, request: web.Request) -> web.Response:
+        self.calls["cancel"] += 1
+        code = request.match_info["code"]
+        if code not in self.bookings:
+            return web.Response(status=404, text="Not found")
+        self.cancel(code)
+        return web.json_response({"ok": True})
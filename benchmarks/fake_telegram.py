@@ -0,0 +1,102 @@
+"""
+Local stand-in for the Telegram Bot API.
+
+Answers every `/bot<token>/<method>` call with a plausible result, counts
+calls per method and can add an artificial latency to emulate the network.
+Point a Bot at it with `fake_bot(server.url)`.
+"""
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+BOT_ID = 123456
+BOT_USER = {
+    "id": BOT_ID,
+    "is_bot": True,
+    "first_name": "Benchmark Bot",
+    "username": "benchmark_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+# Methods whose result is the sent / edited Message
+MESSAGE_METHODS = {"sendmessage", "editmessagetext", "editmessagereplymarkup", "sendphoto", "senddocument"}
+
+
+class FakeTelegramAPI:
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Resolve the port picked by the OS
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _message(self, chat_id: str, text: Optional[str]) -> dict:
+        chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0
+        chat = {"id": chat_id, "type": "channel" if chat_id < 0 else "private"}
+        if chat_id >= 0:
+            chat["first_name"] = "Client"
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": chat,
+            "from": BOT_USER,
+            "text": text or "",
+        }
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        params = dict(await request.post()) if request.can_read_body else {}
+        name = method.lower()
+        if name == "getme":
+            result = BOT_USER
+        elif name in MESSAGE_METHODS:
+            result = self._message(params.get("chat_id", "0"), params.get("text"))
+        elif name == "getwebhookinfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        else:
+            # setWebhook, answerCallbackQuery, setMyCommands, deleteMessage, ...
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+def fake_bot(api_url: str, token: str) -> Bot:
+    """Bot whose requests go to the local fake API"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+    return Bot(token=token, session=session)
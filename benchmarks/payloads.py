@@ -0,0 +1,129 @@
+"""
+Generators of realistic Bukza webhooks and Telegram updates.
+
+A workload is a list of `Request`s (path, query, JSON body) that is built
+up front from a seeded RNG, so the same seed replays exactly the same
+requests against every commit.
+"""
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+SERVICES = [
+    "VR Арена",
+    "VR Зоны",
+    "Лаунж",
+    "Пакет S",
+    "Пакет M",
+    "Пакет L",
+]
+DURATIONS = [60, 105, 120, 180]
+NAMES = ["Иван", "Мария", "Алексей", "Анна", "Дмитрий", "Елена", "-", ""]
+
+# Text messages a registered client typically sends
+TELEGRAM_TEXTS = ["/start", "/bookings", "📅 Мои записи", "/help", "📍 Адрес", "📞 Контакты"]
+
+
+@dataclass
+class Request:
+    kind: str
+    path: str
+    body: dict
+    query: dict = field(default_factory=dict)
+
+
+def user_telegram_id(index: int) -> int:
+    return 700_000_000 + index
+
+
+def user_phone(index: int) -> str:
+    return f"+7900{index:07d}"
+
+
+class WorkloadGenerator:
+    def __init__(self, users: int, seed: int = 1, webhook_path: str = "/webhook/bukza"):
+        self.users = users
+        self.random = random.Random(seed)
+        self.webhook_path = webhook_path
+        self._codes = itertools.count(100_000)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        # Bookings that can still be cancelled: (code, duration, start, phone)
+        self._open_codes: list[tuple[str, int, datetime, str]] = []
+
+    def _phone_for_booking(self) -> str:
+        """70% of bookings come from clients registered in the bot"""
+        if self.random.random() < 0.7:
+            phone = user_phone(self.random.randrange(self.users))
+            # Bukza sends phones in whatever format the client typed
+            digits = phone[2:]
+            return self.random.choice([phone, "8" + digits, f"+7 ({digits[:3]}) {digits[3:6]}-{digits[6:8]}-{digits[8:]}"])
+        return f"+7911{self.random.randrange(10_000_000):07d}"
+
+    def newrega(self) -> Request:
+        code = str(next(self._codes))
+        phone = self._phone_for_booking()
+        start = datetime.now().replace(second=0, microsecond=0) + timedelta(
+            days=self.random.randint(0, 30), hours=self.random.randint(0, 12)
+        )
+        duration = self.random.choice(DURATIONS)
+        service = self.random.choice(SERVICES)
+        name = self.random.choice(NAMES)
+        self._open_codes.append((code, duration, start, phone))
+        return self._bukza("newrega", code, service, start, duration, phone, name)
+
+    def cancel(self) -> Request:
+        if not self._open_codes:
+            return self.newrega()
+        code, duration, start, phone = self._open_codes.pop(self.random.randrange(len(self._open_codes)))
+        return self._bukza("cancel", code, self.random.choice(SERVICES), start, duration, phone, "")
+
+    def _bukza(self, message: str, code: str, service: str, start: datetime, duration: int,
+               phone: str, name: str) -> Request:
+        end = start + timedelta(minutes=duration)
+        body = {
+            "code": code,
+            "resource": service,
+            "start": start.strftime("%d.%m.%Y %H:%M"),
+            "end": end.strftime("%d.%m.%Y %H:%M"),
+            "total_sum": str(self.random.choice([1500, 2500, 4000, 6000])),
+            "name": name or "{client_name}",
+            "fields": [{"name": "Телефон", "value": phone}],
+        }
+        return Request(f"bukza_{message}", self.webhook_path, body, {"message": message, "phone": phone, "name": name})
+
+    def telegram_text(self, text: Optional[str] = None) -> Request:
+        text = text or self.random.choice(TELEGRAM_TEXTS)
+        user_id = user_telegram_id(self.random.randrange(self.users))
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Client"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Client", "language_code": "ru"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        kind = "telegram_" + text[1:].split()[0] if text.startswith("/") else "telegram_button"
+        return Request(kind, "/webhook/telegram", {"update_id": next(self._update_ids), "message": message})
+
+    def bukza_mix(self, count: int, cancel_ratio: float = 0.2) -> list[Request]:
+        return [
+            self.cancel() if self._open_codes and self.random.random() < cancel_ratio else self.newrega()
+            for _ in range(count)
+        ]
+
+    def telegram_mix(self, count: int) -> list[Request]:
+        return [self.telegram_text() for _ in range(count)]
+
+    def with_retries(self, requests: list[Request], retry_ratio: float = 0.1) -> list[Request]:
+        """Bukza re-delivers some webhooks; replay a share of them later in the run"""
+        result = list(requests)
+        for request in requests:
+            if request.kind.startswith("bukza") and self.random.random() < retry_ratio:
+                after = result.index(request) + 1
+                result.insert(self.random.randint(after, len(result)), request)
+        return result
@@ -0,0 +1,378 @@
+"""
+Webhook benchmark.
+
+Starts the real aiohttp app from `main.create_app` with its bot pointed at
+a local fake Bot API (benchmarks/fake_telegram.py), seeds registered
+users and replays generated Bukza webhooks and Telegram updates at it:
+
+    python -m benchmarks.run                       # all scenarios, SQLite
+    python -m benchmarks.run --scenario bukza --requests 2000 --concurrency 50
+    python -m benchmarks.run --database-url postgresql://bench@localhost/bench_db
+    python -m benchmarks.run --scenario sync --requests 5000   # Bukza reconciliation sync
+
+For every scenario it reports throughput, client-side latency
+percentiles, SQL statements and Bot API calls per request (including the
+asynchronous inbox processing a Bukza webhook triggers). Replies returned
+in the webhook response body are counted separately as inline replies.
+The sync scenario instead fills a local stand-in Bukza API
+(benchmarks/fake_bukza.py) with `--requests` bookings and times a full and
+an incremental reconciliation sync (bookings/s, SQL per booking). Results are
+written to benchmarks/results/<time>_<commit>.json; compare two runs with
+`python -m benchmarks.compare`.
+
+The database must be disposable: the default is a fresh SQLite file in a
+temporary directory. Telegram send limits are lifted unless `--real-limits`
+is given, so the numbers show the bot's own overhead.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCHMARKS_DIR)
+TOKEN = "123456:BENCHMARK"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", choices=["all", "bukza", "telegram", "mixed", "sync"], default="all")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200, help="registered users to seed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="fake Bot API latency, seconds")
+    parser.add_argument("--database-url", help="disposable database (default: temporary SQLite file)")
+    parser.add_argument("--real-limits", action="store_true", help="keep Telegram send rate limits")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--output-dir", default=os.path.join(BENCHMARKS_DIR, "results"))
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--log-level", default="ERROR")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, workdir: str):
+    """Settings are read at import time, so this runs before importing the app"""
+    database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.update({
+        "BOT_TOKEN": TOKEN,
+        "DATABASE_URL": database_url,
+        "BUKZA_API_URL": "http://127.0.0.1:9",
+        "BUKZA_API_KEY": "benchmark",
+        "WEBHOOK_HOST": "https://benchmark.local",
+        "WEBHOOK_PATH": "/webhook/bukza",
+        "LINK_2GIS": "https://2gis.ru",
+        "LINK_YANDEX_MAPS": "https://yandex.ru/maps",
+        "SUPPORT_CHANNEL_ID": "-1001234567890",
+        "DATABASE_ECHO": "false",
+    })
+    if not args.real_limits:
+        os.environ.update({
+            "TELEGRAM_GLOBAL_RATE": "1000000",
+            "TELEGRAM_CHAT_RATE": "1000000",
+            "TELEGRAM_CHANNEL_RATE_PER_MINUTE": "60000000",
+        })
+
+
+def git_revision() -> tuple[str, bool]:
+    def git(*cmd):
+        return subprocess.run(["git", *cmd], cwd=PROJECT_ROOT, capture_output=True, text=True).stdout.strip()
+    try:
+        return git("rev-parse", "--short", "HEAD") or "unknown", bool(git("status", "--porcelain", "--untracked-files=no"))
+    except OSError:
+        return "unknown", False
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Counters:
+    """Snapshot of the app's own counters, to compute per-scenario deltas"""
+
+    def __init__(self, api, sql_instrumentation, inbox, sender, bukza_webhooks, updates):
+        self.api = api
+        self.sql = sql_instrumentation
+        self.inbox = inbox
+        self.sender = sender
+        self.updates = updates
+        self.bukza_webhooks = bukza_webhooks
+
+    def snapshot(self) -> dict:
+        accepted = sum(v for (message, result), v in self.bukza_webhooks._values.items() if result == "accepted")
+        inbox = self.inbox.stats()
+        return {
+            "sql": sum(s.count for s in self.sql.statements.values()),
+            "api": dict(self.api.calls),
+            "accepted": accepted,
+            "inbox_done": inbox["processed"] + inbox["dead"],
+        }
+
+    async def drain(self, before: dict, timeout: float) -> bool:
+        """Wait until queued updates, inbox events and outgoing messages are handled"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            now = self.snapshot()
+            inbox_done = now["inbox_done"] - before["inbox_done"] >= now["accepted"] - before["accepted"]
+            updates = self.updates.stats()
+            updates_done = not updates["backlog"] and not updates["in_flight"]
+            sender_done = self.sender.queue_depth() == 0 and not self.sender.stats()["in_flight"]
+            if inbox_done and updates_done and sender_done:
+                return True
+            self.inbox.notify()
+            await asyncio.sleep(0.05)
+        return False
+
+
+async def fire(session, base_url: str, requests, concurrency: int) -> tuple[list[float], dict, int, int]:
+    latencies: list[float] = []
+    by_kind: dict[str, list[float]] = {}
+    errors = 0
+    # Bot API calls answered in the webhook response body instead
+    inline_replies = 0
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def worker():
+        nonlocal errors, inline_replies
+        while not queue.empty():
+            request = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                async with session.post(base_url + request.path, params=request.query, json=request.body) as response:
+                    body = await response.read()
+                    if response.status >= 400:
+                        errors += 1
+                    elif body and response.content_type == "application/json":
+                        inline_replies += 1
+            except Exception:
+                errors += 1
+            elapsed = (time.perf_counter() - started) * 1000
+            latencies.append(elapsed)
+            by_kind.setdefault(request.kind, []).append(elapsed)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, by_kind, errors, inline_replies
+
+
+async def run_scenario(requests, args, session, base_url, counters) -> dict:
+    before = counters.snapshot()
+    started = time.perf_counter()
+    latencies, by_kind, errors, inline_replies = await fire(session, base_url, requests, args.concurrency)
+    http_duration = time.perf_counter() - started
+    drained = await counters.drain(before, args.drain_timeout)
+    total_duration = time.perf_counter() - started
+    after = counters.snapshot()
+
+    api_calls = {
+        method: after["api"].get(method, 0) - before["api"].get(method, 0)
+        for method in after["api"]
+        if after["api"].get(method, 0) - before["api"].get(method, 0)
+    }
+    count = len(requests)
+    latencies.sort()
+    return {
+        "requests": count,
+        "errors": errors,
+        "drained": drained,
+        "http_duration_s": round(http_duration, 3),
+        "total_duration_s": round(total_duration, 3),
+        "throughput_rps": round(count / http_duration, 1) if http_duration else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+            "mean": round(sum(latencies) / count, 2) if count else 0.0,
+        },
+        "latency_p50_ms_by_kind": {
+            kind: round(percentile(sorted(values), 0.5), 2) for kind, values in sorted(by_kind.items())
+        },
+        "db_queries_per_request": round((after["sql"] - before["sql"]) / count, 2) if count else 0.0,
+        "api_calls_per_request": round(sum(api_calls.values()) / count, 2) if count else 0.0,
+        "api_calls": api_calls,
+        "inline_replies": inline_replies,
+    }
+
+
+async def timed_sync(counters) -> dict:
+    from services.bukza_sync import sync_bookings
+
+    before = counters.snapshot()
+    started = time.perf_counter()
+    counts = await sync_bookings()
+    duration = time.perf_counter() - started
+    after = counters.snapshot()
+
+    bookings = sum(counts.get(result, 0) for result in ("inserted", "updated", "unchanged", "invalid"))
+    return {
+        "bookings": bookings,
+        "pages": counts.get("pages", 0),
+        "errors": counts.get("errors", 0),
+        "duration_s": round(duration, 3),
+        "bookings_per_s": round(bookings / duration, 1) if duration else 0.0,
+        "db_queries_per_booking": round((after["sql"] - before["sql"]) / bookings, 3) if bookings else 0.0,
+        # Must stay 0: the sync never notifies clients
+        "telegram_api_calls": sum(after["api"].values()) - sum(before["api"].values()),
+        "results": {k: v for k, v in counts.items() if k not in ("pages", "errors")},
+    }
+
+
+async def run_sync_scenario(n: int, generator, bukza, counters) -> dict:
+    """Full sync of `n` new bookings, then an incremental one after a tenth changed and a tenth added"""
+    for _ in range(n):
+        bukza.put(generator.newrega().body)
+    full = await timed_sync(counters)
+
+    for code in generator.random.sample(sorted(bukza.bookings), n // 10):
+        bukza.cancel(code)
+    for _ in range(n // 10):
+        bukza.put(generator.newrega().body)
+    incremental = await timed_sync(counters)
+    return {**full, "incremental": incremental}
+
+
+def print_report(results: dict):
+    header = f"{'scenario':<10} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>5} {'sql/req':>8} {'api/req':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results["scenarios"].items():
+        if name == "sync":
+            continue
+        lat = r["latency_ms"]
+        print(
+            f"{name:<10} {r['throughput_rps']:>8} {lat['p50']:>8} {lat['p95']:>8} {lat['p99']:>8} "
+            f"{r['errors']:>5} {r['db_queries_per_request']:>8} {r['api_calls_per_request']:>8}"
+            + ("" if r["drained"] else "  (not drained)")
+        )
+    sync = results["scenarios"].get("sync")
+    if sync:
+        for name, r in (("full", sync), ("incremental", sync["incremental"])):
+            print(
+                f"sync {name}: {r['bookings']} bookings in {r['duration_s']}s, {r['bookings_per_s']} bookings/s, "
+                f"{r['db_queries_per_booking']} sql/booking, {r['telegram_api_calls']} Bot API calls"
+            )
+
+
+async def main(args) -> dict:
+    # Imported here: settings must see the benchmark environment
+    from aiohttp import ClientSession
+    from aiohttp.test_utils import TestServer
+
+    import main as app_main
+    from benchmarks.fake_bukza import FakeBukzaAPI
+    from benchmarks.fake_telegram import FakeTelegramAPI, fake_bot
+    from benchmarks.payloads import WorkloadGenerator, user_phone, user_telegram_id
+    from database import engine, sql_instrumentation
+    from database.unit_of_work import UnitOfWork
+    from services.bukza_client import bukza_client
+    from services.metrics import bukza_webhooks
+    from services.scheduler import pause_scheduler
+    from services.telegram_sender import telegram_sender
+    from services.update_dispatcher import update_dispatcher
+    from services.webhook_inbox import inbox_processor
+
+    # main.py configures INFO logging on import
+    logging.getLogger().setLevel(args.log_level)
+
+    api = FakeTelegramAPI(latency=args.api_latency)
+    await api.start()
+    bukza = FakeBukzaAPI()
+    await bukza.start()
+    bot = fake_bot(api.url, TOKEN)
+    app = app_main.create_app(bot=bot)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        # Keep scheduled sweeps out of the measurements
+        await app["leader"].stop()
+        pause_scheduler()
+
+        async with UnitOfWork() as uow:
+            for index in range(args.users):
+                if await uow.users.get_by_telegram_id(user_telegram_id(index)) is None:
+                    await uow.users.create(user_telegram_id(index), user_phone(index))
+            await uow.commit()
+
+        generator = WorkloadGenerator(args.users, seed=args.seed)
+        n = args.requests
+        workloads = {
+            "bukza": lambda: generator.with_retries(generator.bukza_mix(n))[:n],
+            "telegram": lambda: generator.telegram_mix(n),
+            "mixed": lambda: [
+                generator.newrega() if i % 2 else generator.telegram_text() for i in range(n)
+            ],
+        }
+        names = list(workloads) + ["sync"] if args.scenario == "all" else [args.scenario]
+
+        counters = Counters(api, sql_instrumentation, inbox_processor, telegram_sender, bukza_webhooks,
+                            update_dispatcher)
+        commit, dirty = git_revision()
+        results = {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "config": {
+                "requests": n,
+                "concurrency": args.concurrency,
+                "users": args.users,
+                "seed": args.seed,
+                "api_latency_s": args.api_latency,
+                "database": engine.dialect.name,
+                "real_limits": args.real_limits,
+                "python": sys.version.split()[0],
+            },
+            "scenarios": {},
+        }
+        base_url = str(server.make_url(""))
+        async with ClientSession() as session:
+            for name in names:
+                if name == "sync":
+                    continue
+                results["scenarios"][name] = await run_scenario(
+                    workloads[name](), args, session, base_url, counters
+                )
+        if "sync" in names:
+            bukza_client.api_url = bukza.url
+            results["scenarios"]["sync"] = await run_sync_scenario(n, generator, bukza, counters)
+        return results
+    finally:
+        await server.close()
+        await api.stop()
+        await bukza.stop()
+
+
+def save(results: dict, output_dir: str) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    suffix = "-dirty" if results["dirty"] else ""
+    path = os.path.join(output_dir, f"{stamp}_{results['commit']}{suffix}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def cli(argv: Optional[list] = None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="bot-bench-") as workdir:
+        configure_environment(args, workdir)
+        sys.path.insert(0, PROJECT_ROOT)
+        results = asyncio.run(main(args))
+    print_report(results)
+    if not args.no_save:
+        print(f"\nSaved to {save(results, args.output_dir)}")
+
+
+if __name__ == "__main__":
+    cli()
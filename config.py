@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import field_validator
-from typing import Optional
+from typing import Any, Optional
 
 
 class Settings(BaseSettings):
@@ -11,14 +11,32 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str
+    user_cache_size: int = 10000  # 0 disables the user cache
+    user_cache_ttl: int = 300
+    database_echo: bool = False  # log every statement (debugging only)
+    database_profile: str = "default"  # engine profile, see database/profiles.py
+    database_engine_options: dict[str, Any] = {}  # overrides of profile values, e.g. {"pool_size": 10}
+    slow_query_ms: float = 200.0
+    explain_slow_queries: bool = False
+    debug_token: Optional[str] = None  # /debug/* need "Authorization: Bearer <token>", off when unset
+    retention_interval: int = 3600  # seconds between archival runs, 0 disables
+    retention_messages_days: int = 90  # messages older than this go to messages_archive
+    retention_bookings_days: int = 365  # past visits older than this go to bookings_archive
+    retention_batch_size: int = 500  # rows moved per transaction
     
     # Bukza API
     bukza_api_url: str
     bukza_api_key: str
+    bukza_timeout: float = 10.0
+    bukza_pool_size: int = 10
+    bukza_sync_interval: int = 900  # seconds between reconciliation syncs, 0 disables
+    bukza_sync_initial_days: int = 30  # how far back the first sync looks
+    bukza_sync_page_size: int = 200
     
     # Webhook
     webhook_host: str
     webhook_path: str
+    web_workers: int = 1  # >1 forks worker processes sharing port 8080
     
     # Review Links
     link_2gis: str
@@ -26,6 +44,10 @@ class Settings(BaseSettings):
     
     # Support (optional)
     support_channel_id: Optional[str] = None
+    daily_digest_hour: int = 22  # local hour of the daily figures post to the support channel, -1 disables
+    
+    # Telegram user ids allowed to run admin commands, e.g. [123456789]
+    admin_user_ids: list[int] = []
     
     # Company Info (optional)
     company_address: Optional[str] = "г. Москва, ул. Примерная, д. 1"
@@ -36,6 +58,20 @@ class Settings(BaseSettings):
     company_hours: Optional[str] = "Пн-Вс: 10:00 - 22:00"
     bukza_booking_url: Optional[str] = "https://1emesto.ru/#BukzaContainer24018"
     
+    # Telegram send limits (messages per second unless stated otherwise)
+    telegram_global_rate: float = 25.0
+    telegram_chat_rate: float = 1.0
+    telegram_channel_rate_per_minute: float = 20.0
+    
+    # Bukza webhook inbox
+    inbox_workers: int = 4
+    webhook_dedup_cache_size: int = 10000
+    
+    # Telegram webhook updates
+    telegram_updates_in_flight: int = 64  # handlers running at once
+    telegram_updates_backlog: int = 10000  # queued updates before answering 503
+    telegram_inline_reply_timeout: float = 0.1  # seconds to wait for a reply in the webhook response
+    
     @field_validator('database_url')
     @classmethod
     def convert_database_url(cls, v: str) -> str:
@@ -44,6 +80,14 @@ class Settings(BaseSettings):
             return v.replace('postgresql://', 'postgresql+asyncpg://', 1)
         return v
 
+    @field_validator('admin_user_ids', mode='before')
+    @classmethod
+    def single_admin_id(cls, v):
+        """Accept a single id as well as a list"""
+        if isinstance(v, (int, str)) and str(v).strip().lstrip('-').isdigit():
+            return [int(v)]
+        return v
+
     @field_validator('webhook_host')
     @classmethod
     def ensure_https(cls, v: str) -> str:
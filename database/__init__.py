@@ -1,26 +1,77 @@
+import os
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from config import settings
 from database.models import Base
+from database.instrumentation import SQLInstrumentation, PoolMonitor
+from database.profiles import resolve_profile, engine_options, install_sqlite_pragmas
+from database.sqlite_writer import SQLiteWriter
 
-# Create engine with appropriate settings
-if settings.database_url.startswith('sqlite'):
-    # SQLite specific settings
-    engine = create_async_engine(
-        settings.database_url,
-        echo=True,
-        connect_args={"check_same_thread": False}
-    )
-else:
-    # PostgreSQL settings
-    engine = create_async_engine(settings.database_url, echo=True)
+# Pool, statement cache and SQLite pragmas come from the engine profile
+# (DATABASE_PROFILE, see database/profiles.py)
+engine_profile = resolve_profile(settings.database_profile, settings.database_engine_options)
+engine = create_async_engine(
+    settings.database_url,
+    echo=settings.database_echo,
+    **engine_options(settings.database_url, engine_profile)
+)
+if engine.dialect.name == "sqlite":
+    install_sqlite_pragmas(engine, engine_profile)
+
+# Statement timing, slow query log (see /debug/sql)
+sql_instrumentation = SQLInstrumentation(
+    slow_query_ms=settings.slow_query_ms,
+    explain_slow=settings.explain_slow_queries
+)
+sql_instrumentation.install(engine)
+
+# Connection pool usage (see /debug/pool)
+pool_monitor = PoolMonitor()
+pool_monitor.install(engine)
 
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# All writes through one task on SQLite with `sqlite_single_writer`
+sqlite_writer = SQLiteWriter(
+    async_session_maker,
+    enabled=engine.dialect.name == "sqlite" and engine_profile["sqlite_single_writer"],
+    max_batch=engine_profile["sqlite_writer_max_batch"]
+)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Arbitrary key for the PostgreSQL advisory lock held while migrating
+MIGRATION_LOCK_ID = 7_412_001
+
+
+def alembic_config() -> Config:
+    config = Config(os.path.join(PROJECT_ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(PROJECT_ROOT, "migrations"))
+    return config
+
+
+def _upgrade(connection, config: Config):
+    config.attributes["connection"] = connection
+    command.upgrade(config, "head")
+
 
 async def init_db():
-    """Initialize database tables"""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Bring the database schema up to date (alembic upgrade head)"""
+    config = alembic_config()
+    async with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            # Several instances may start at once; only one migrates
+            await conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            await conn.commit()
+        try:
+            await conn.run_sync(_upgrade, config)
+        finally:
+            if postgres:
+                await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+                await conn.commit()
 
 
 async def get_session() -> AsyncSession:
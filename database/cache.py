@@ -0,0 +1,130 @@
+"""In-process read-through caches for hot repository lookups"""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from config import settings
+from database.models import User
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class UserCache:
+    """
+    Cache of users by telegram_id and by phone number.
+
+    Entries are plain column snapshots, so a hit never touches a session;
+    `get_*` returns a detached `User` built from the snapshot.
+    """
+    _columns = ("id", "telegram_id", "phone_number", "is_blocked", "created_at")
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize, ttl)
+        self._keys_by_user: dict[int, set[tuple]] = {}
+
+    def _get(self, key: tuple) -> Optional[User]:
+        snapshot = self._cache.get(key)
+        if snapshot is None:
+            return None
+        return User(**snapshot)
+
+    def get_by_telegram_id(self, telegram_id: int) -> Optional[User]:
+        return self._get(("telegram_id", telegram_id))
+
+    def get_by_phone(self, phone_number: str) -> Optional[User]:
+        return self._get(("phone", phone_number))
+
+    def put(self, user: User):
+        if self._cache.maxsize <= 0:
+            return
+        snapshot = {column: getattr(user, column) for column in self._columns}
+        keys = {("telegram_id", user.telegram_id)}
+        if user.phone_number:
+            keys.add(("phone", user.phone_number))
+        for key in keys:
+            self._cache.set(key, snapshot)
+        self._keys_by_user.setdefault(user.id, set()).update(keys)
+        if len(self._keys_by_user) > self._cache.maxsize:
+            self._keys_by_user = {
+                user_id: {k for k in user_keys if k in self._cache}
+                for user_id, user_keys in self._keys_by_user.items()
+                if any(k in self._cache for k in user_keys)
+            }
+
+    def invalidate(self, user_id: Optional[int] = None, telegram_id: Optional[int] = None,
+                   phone_number: Optional[str] = None):
+        keys = set(self._keys_by_user.pop(user_id, set())) if user_id is not None else set()
+        if telegram_id is not None:
+            keys.add(("telegram_id", telegram_id))
+        if phone_number:
+            keys.add(("phone", phone_number))
+        for key in keys:
+            self._cache.pop(key)
+
+    def set_process_count(self, processes: int):
+        """
+        Invalidation only reaches this process, so with several processes
+        serving the same users the cache is turned off: another process
+        would keep a stale phone or block flag for up to `ttl`.
+        """
+        if processes > 1:
+            self._cache.maxsize = 0
+            self.clear()
+
+    def clear(self):
+        self._cache.clear()
+        self._keys_by_user.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "hits": self._cache.hits,
+            "misses": self._cache.misses,
+        }
+
+
+user_cache = UserCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
@@ -0,0 +1,19 @@
+"""
+Time bases of the stored timestamps.
+
+Visit times (`booking_datetime`) are the venue's wall clock as Bukza sends
+them and are compared with `datetime.now()`: the bot runs in the venue's
+time zone. Bookkeeping timestamps (`created_at`, `sent_at`, `locked_at`,
+...) are naive UTC. Anything comparing the two converts first.
+"""
+from datetime import datetime, timedelta
+
+
+def utc_offset() -> timedelta:
+    """Local time minus UTC, now"""
+    return datetime.now().astimezone().utcoffset()
+
+
+def utc_to_local(value: datetime) -> datetime:
+    """A naive UTC timestamp on the visit-time clock"""
+    return value + utc_offset()
@@ -0,0 +1,174 @@
+"""
+aiogram FSM storage backed by the application database.
+
+Lets several bot processes share registration / link-booking / support
+states and keeps them across restarts. Writes are buffered for
+`flush_interval` seconds and written in one transaction; recently used
+keys are served from a small in-memory cache. States that were not touched
+for `state_ttl` are treated as abandoned and purged.
+
+With `shared=True` (several web workers, where updates of one chat may
+land on different processes) the cache and the buffer are bypassed:
+every read goes to the database and every change is written before the
+handler goes on, so no worker acts on a state another one has replaced.
+"""
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from database import async_session_maker
+from database.repository import FSMRepository
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("state", "data", "loaded_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], loaded_at: float):
+        self.state = state
+        self.data = data
+        self.loaded_at = loaded_at
+
+
+class SQLStorage(BaseStorage):
+    def __init__(
+        self,
+        state_ttl: timedelta = timedelta(hours=24),
+        flush_interval: float = 0.05,
+        cache_ttl: float = 2.0,
+        cache_size: int = 10000,
+        purge_interval: timedelta = timedelta(minutes=10),
+        shared: bool = False
+    ):
+        self.state_ttl = state_ttl
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.purge_interval = purge_interval
+        self.shared = shared
+
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._last_purge = datetime.utcnow()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def _load(self, key: str) -> _Entry:
+        loop = asyncio.get_running_loop()
+        entry = self._cache.get(key)
+        if entry is not None:
+            # Unflushed entries are always authoritative; shared storage trusts nothing else
+            fresh = not self.shared and loop.time() - entry.loaded_at < self.cache_ttl
+            if key in self._dirty or fresh:
+                self._cache.move_to_end(key)
+                return entry
+
+        async with async_session_maker() as session:
+            record = await FSMRepository(session).get(key, datetime.utcnow())
+
+        if record is None:
+            entry = _Entry(None, {}, loop.time())
+        else:
+            entry = _Entry(record.state, json.loads(record.data), loop.time())
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: str, entry: _Entry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            oldest = next(iter(self._cache))
+            if oldest in self._dirty:
+                break
+            self._cache.popitem(last=False)
+
+    async def _mark_dirty(self, key: str):
+        self._dirty.add(key)
+        if self.shared:
+            await self.flush()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        delay = self.flush_interval
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.flush()
+                # Keys written while we were flushing need another round
+                if not self._dirty:
+                    return
+                delay = self.flush_interval
+            except Exception as e:
+                # The keys stay dirty; retry with a growing delay
+                logger.error(f"Failed to flush FSM states: {e}", exc_info=True)
+                delay = min(30.0, max(1.0, delay * 2))
+
+    async def flush(self):
+        """Write all buffered changes in one transaction"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            now = datetime.utcnow()
+            expires_at = now + self.state_ttl
+            records, deleted = [], []
+            for key in keys:
+                entry = self._cache.get(key)
+                if entry is None or (entry.state is None and not entry.data):
+                    deleted.append(key)
+                else:
+                    records.append({
+                        "key": key,
+                        "state": entry.state,
+                        "data": json.dumps(entry.data, ensure_ascii=False),
+                        "updated_at": now,
+                        "expires_at": expires_at,
+                    })
+            try:
+                async with async_session_maker() as session:
+                    repo = FSMRepository(session)
+                    await repo.save_many(records, deleted)
+                    if now - self._last_purge > self.purge_interval:
+                        self._last_purge = now
+                        purged = await repo.purge_expired(now)
+                        if purged:
+                            logger.info(f"Purged {purged} abandoned FSM states")
+            except Exception:
+                self._dirty |= keys
+                raise
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._key(key)
+        entry = await self._load(storage_key)
+        entry.state = state.state if isinstance(state, State) else state
+        await self._mark_dirty(storage_key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self._key(key))).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self._key(key)
+        entry = await self._load(storage_key)
+        entry.data = data.copy()
+        await self._mark_dirty(storage_key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(self._key(key))).data.copy()
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
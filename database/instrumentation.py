@@ -0,0 +1,302 @@
+"""
+Per-statement SQL timing instead of `echo=True`.
+
+Cursor execute events time every statement and add it to a latency
+histogram keyed by the normalized SQL text (literals, placeholders and IN
+lists collapsed, so the same query with different parameters shares one
+entry). Statements slower than `slow_query_ms` are logged; with
+`explain_slow_queries` their EXPLAIN plan is captured in the background
+on a separate connection and kept with the entry. The plan is the
+generic one, made without the statement's parameter values.
+
+The collected stats are served as JSON at /debug/sql (see main.py);
+connection pool usage (`PoolMonitor`) at /debug/pool.
+"""
+import asyncio
+import logging
+import re
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds, milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s|:\w+|\?")
+_PG_PARAMETER = re.compile(r"\$(\d+)")
+_IN_LIST = re.compile(r"\bIN \((?:\?|__\[POSTCOMPILE_\w+\])(?:, ?\?)*\)", re.IGNORECASE)
+
+
+def _nulls(parameters):
+    """The parameters with every value replaced by NULL"""
+    if isinstance(parameters, dict):
+        return {name: None for name in parameters}
+    return tuple(None for _ in parameters or ())
+
+
+async def _generic_plan(conn, statement: str) -> list:
+    """
+    PostgreSQL plan of `statement` for any parameter values: prepared with
+    the generic plan forced and executed under EXPLAIN with NULLs.
+    """
+    count = max((int(n) for n in _PG_PARAMETER.findall(statement)), default=0)
+    arguments = f"({', '.join(['NULL'] * count)})" if count else ""
+    try:
+        await conn.exec_driver_sql("SET LOCAL plan_cache_mode = force_generic_plan")
+        await conn.exec_driver_sql(f"PREPARE slow_query_plan AS {statement}")
+        result = await conn.exec_driver_sql(f"EXPLAIN EXECUTE slow_query_plan{arguments}")
+        rows = result.all()
+    except Exception:
+        # A prepared statement left behind dies with the connection
+        await conn.invalidate()
+        raise
+    await conn.exec_driver_sql("DEALLOCATE slow_query_plan")
+    return rows
+
+
+def normalize_sql(statement: str) -> str:
+    sql = _WHITESPACE.sub(" ", statement).strip()
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+class StatementStats:
+    __slots__ = ("count", "total_ms", "max_ms", "buckets", "slow", "plan", "explained_at")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        # One counter per bucket plus the overflow bucket
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.slow = 0
+        self.plan: Optional[str] = None
+        self.explained_at: Optional[float] = None
+
+    def record(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return float(bound)
+        return self.max_ms
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "slow": self.slow,
+            "buckets_ms": dict(zip([*map(str, BUCKETS_MS), "inf"], self.buckets)),
+            "plan": self.plan,
+        }
+
+
+class SQLInstrumentation:
+    def __init__(
+        self,
+        slow_query_ms: float = 200.0,
+        explain_slow: bool = False,
+        explain_interval: float = 600.0,
+        max_statements: int = 500
+    ):
+        self.slow_query_ms = slow_query_ms
+        self.explain_slow = explain_slow
+        # The same statement is explained at most once per interval
+        self.explain_interval = explain_interval
+        self.max_statements = max_statements
+        self.statements: Dict[str, StatementStats] = {}
+        self._engine: Optional[AsyncEngine] = None
+        self._explains: set[asyncio.Task] = set()
+
+    def install(self, engine: AsyncEngine):
+        self._engine = engine
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - context._query_started) * 1000
+
+        key = normalize_sql(statement)
+        stats = self.statements.get(key)
+        if stats is None:
+            if len(self.statements) >= self.max_statements:
+                # Unbounded dynamic SQL must not grow the table forever
+                key = "<other>"
+                stats = self.statements.setdefault(key, StatementStats())
+            else:
+                stats = self.statements[key] = StatementStats()
+        stats.record(elapsed_ms)
+
+        if elapsed_ms >= self.slow_query_ms:
+            stats.slow += 1
+            logger.warning(f"Slow query ({elapsed_ms:.1f} ms): {key}")
+            if self.explain_slow and not executemany and key != "<other>":
+                self._schedule_explain(key, stats, statement, parameters)
+
+    def _schedule_explain(self, key: str, stats: StatementStats, statement: str, parameters):
+        # The plan is made without the live values: they may hold personal
+        # data (phones, names) and would end up in the log and /debug/sql
+        now = time.monotonic()
+        if stats.explained_at is not None and now - stats.explained_at < self.explain_interval:
+            return
+        if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        stats.explained_at = now
+        # Run after the current statement's transaction is done with the cursor
+        task = loop.create_task(self._explain(key, stats, statement, _nulls(parameters)))
+        self._explains.add(task)
+        task.add_done_callback(self._explains.discard)
+
+    async def _explain(self, key: str, stats: StatementStats, statement: str, nulls):
+        try:
+            async with self._engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    rows = await _generic_plan(conn, statement)
+                else:
+                    # SQLite plans do not depend on the values
+                    result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", nulls)
+                    rows = result.all()
+                await conn.rollback()
+            stats.plan = "\n".join(str(row[-1]) for row in rows)
+            logger.warning(f"Plan for slow query {key}:\n{stats.plan}")
+        except Exception as e:
+            logger.warning(f"Could not EXPLAIN slow query: {e!r}")
+
+    def snapshot(self, limit: int = 50, order_by: str = "total_ms") -> Dict[str, Any]:
+        """Top `limit` statements by `order_by` (total_ms, count, max_ms or slow)"""
+        if order_by not in ("total_ms", "count", "max_ms", "slow"):
+            order_by = "total_ms"
+        ranked = sorted(
+            self.statements.items(),
+            key=lambda item: getattr(item[1], order_by),
+            reverse=True
+        )[:limit]
+        return {
+            "slow_query_ms": self.slow_query_ms,
+            "statements": len(self.statements),
+            "queries": sum(s.count for s in self.statements.values()),
+            "top": [{"sql": sql, **stats.as_dict()} for sql, stats in ranked],
+        }
+
+    def reset(self):
+        self.statements.clear()
+
+
+class PoolMonitor:
+    """
+    Connection pool usage from pool events: connections in use (now and
+    peak), how long they are held, how much time every connection was in
+    use (callers wait for one then), new connections and invalidations
+    (dropped or failed pre-ping). Served at /debug/pool and /metrics.
+    """
+    def __init__(self, saturation_log_interval: float = 60.0):
+        self.saturation_log_interval = saturation_log_interval
+        self.capacity: Optional[int] = None
+        self.checked_out = 0
+        self.peak = 0
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.held = StatementStats()
+        self.saturated_seconds = 0.0
+        self._saturated_since: Optional[float] = None
+        self._last_saturation_log = 0.0
+        self._pool = None
+
+    def install(self, engine: AsyncEngine):
+        pool = engine.pool
+        self._pool = pool
+        size = getattr(pool, "size", None)
+        overflow = getattr(pool, "_max_overflow", None)
+        if size is not None and overflow is not None and overflow >= 0:
+            self.capacity = size() + overflow
+        event.listen(engine.sync_engine, "checkout", self._checkout)
+        event.listen(engine.sync_engine, "checkin", self._checkin)
+        event.listen(engine.sync_engine, "connect", self._connect)
+        event.listen(engine.sync_engine, "invalidate", self._invalidate)
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        self.checked_out += 1
+        self.checkouts += 1
+        self.peak = max(self.peak, self.checked_out)
+        if self.capacity is not None and self.checked_out >= self.capacity and self._saturated_since is None:
+            now = time.monotonic()
+            self._saturated_since = now
+            if now - self._last_saturation_log >= self.saturation_log_interval:
+                self._last_saturation_log = now
+                logger.warning(f"Database pool saturated: all {self.capacity} connections in use")
+
+    def _checkin(self, dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is None:
+            return
+        self.checked_out -= 1
+        self.held.record((time.perf_counter() - started) * 1000)
+        if self._saturated_since is not None:
+            self.saturated_seconds += time.monotonic() - self._saturated_since
+            self._saturated_since = None
+
+    def _connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidations += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        saturated = self.saturated_seconds
+        if self._saturated_since is not None:
+            saturated += time.monotonic() - self._saturated_since
+        held = self.held.as_dict()
+        return {
+            "status": self._pool.status() if self._pool is not None else None,
+            "capacity": self.capacity,
+            "checked_out": self.checked_out,
+            "peak_checked_out": self.peak,
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "saturated_s": round(saturated, 3),
+            "held_ms": {key: held[key] for key in ("count", "avg_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")},
+        }
+
+    def reset(self):
+        """Start a new measurement window (connections in use are kept)"""
+        self.peak = self.checked_out
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.held = StatementStats()
+        self.saturated_seconds = 0.0
+        if self._saturated_since is not None:
+            self._saturated_since = time.monotonic()
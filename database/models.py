@@ -1,5 +1,6 @@
-from datetime import datetime
-from sqlalchemy import BigInteger, String, DateTime, Integer, ForeignKey, Enum as SQLEnum
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import BigInteger, Boolean, String, Text, Date, DateTime, Integer, Numeric, ForeignKey, UniqueConstraint, Index, Enum as SQLEnum, false, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from typing import Optional
 import enum
@@ -20,6 +21,21 @@ class MessageType(enum.Enum):
     BOOKING_CANCELLED = "booking_cancelled"
     REMINDER = "reminder"
     FEEDBACK_REQUEST = "feedback_request"
+    BROADCAST = "broadcast"
+
+
+class InboxStatus(enum.Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    DEAD = "dead"
+
+
+class BroadcastStatus(enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
 
 
 class User(Base):
@@ -28,6 +44,8 @@ class User(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True, index=True)
     phone_number: Mapped[Optional[str]] = mapped_column(String(20), unique=True, index=True)
+    # Set when a send fails because the user blocked the bot
+    is_blocked: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false())
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     
     bookings: Mapped[list["Booking"]] = relationship(back_populates="user")
@@ -36,6 +54,15 @@ class User(Base):
 
 class Booking(Base):
     __tablename__ = "bookings"
+    # Indexes are created by migrations (migrations/versions/0002_*)
+    __table_args__ = (
+        Index("ix_bookings_user_status_datetime", "user_id", "status", "booking_datetime"),
+        Index(
+            "ix_bookings_unlinked_phone", "client_phone",
+            postgresql_where=text("user_id IS NULL"),
+            sqlite_where=text("user_id IS NULL")
+        ),
+    )
     
     id: Mapped[int] = mapped_column(primary_key=True)
     bukza_booking_id: Mapped[str] = mapped_column(String(100), unique=True, index=True)
@@ -44,9 +71,11 @@ class Booking(Base):
     service_name: Mapped[str] = mapped_column(String(255))
     client_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     client_phone: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
-    booking_datetime: Mapped[datetime] = mapped_column(DateTime)
+    booking_datetime: Mapped[datetime] = mapped_column(DateTime, index=True)
     duration_minutes: Mapped[int] = mapped_column(Integer)
     status: Mapped[BookingStatus] = mapped_column(SQLEnum(BookingStatus), default=BookingStatus.ACTIVE)
+    # Price from Bukza, rubles
+    total_sum: Mapped[Optional[Decimal]] = mapped_column(Numeric(12, 2), nullable=True)
     
     rating: Mapped[Optional[int]] = mapped_column(Integer)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -58,13 +87,149 @@ class Booking(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_booking_type", "booking_id", "message_type"),
+        # One delivery record per broadcast and recipient
+        Index("uq_messages_broadcast_user", "broadcast_id", "user_id", unique=True),
+        # Oldest first for the retention job
+        Index("ix_messages_sent_at", "sent_at"),
+    )
     
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     booking_id: Mapped[Optional[int]] = mapped_column(ForeignKey("bookings.id"))
+    broadcast_id: Mapped[Optional[int]] = mapped_column(ForeignKey("broadcasts.id"))
     
     message_type: Mapped[MessageType] = mapped_column(SQLEnum(MessageType))
     sent_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     
     user: Mapped["User"] = relationship(back_populates="messages")
     booking: Mapped[Optional["Booking"]] = relationship(back_populates="messages")
+
+
+class Broadcast(Base):
+    """Announcement sent to every user; `last_user_id` is the resume cursor"""
+    __tablename__ = "broadcasts"
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    text: Mapped[str] = mapped_column(Text)
+    status: Mapped[BroadcastStatus] = mapped_column(SQLEnum(BroadcastStatus), default=BroadcastStatus.PENDING, index=True)
+    created_by: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    
+    last_user_id: Mapped[int] = mapped_column(Integer, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, default=0)
+    
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+class WebhookInbox(Base):
+    """Raw Bukza webhook waiting to be processed by the inbox workers"""
+    __tablename__ = "webhook_inbox"
+    # A retried delivery of the same webhook is rejected by this constraint
+    __table_args__ = (
+        UniqueConstraint("booking_code", "message_type", "payload_hash", name="uq_webhook_inbox_dedup"),
+    )
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    booking_code: Mapped[str] = mapped_column(String(100), index=True)
+    message_type: Mapped[str] = mapped_column(String(50))
+    payload: Mapped[str] = mapped_column(Text)
+    payload_hash: Mapped[str] = mapped_column(String(64))
+    
+    status: Mapped[InboxStatus] = mapped_column(SQLEnum(InboxStatus), default=InboxStatus.PENDING, index=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    locked_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+class FSMRecord(Base):
+    """aiogram FSM state and data for one storage key"""
+    __tablename__ = "fsm_states"
+    
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    data: Mapped[str] = mapped_column(Text, default="{}")
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+class Lease(Base):
+    """Named lease used to elect a single leader among worker processes"""
+    __tablename__ = "leases"
+    
+    name: Mapped[str] = mapped_column(String(100), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(255))
+    expires_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+class SyncState(Base):
+    """High-water mark of a periodic pull from an external system"""
+    __tablename__ = "sync_state"
+    
+    name: Mapped[str] = mapped_column(String(100), primary_key=True)
+    cursor: Mapped[datetime] = mapped_column(DateTime)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class ArchivedBooking(Base):
+    """Past booking moved out of `bookings` by the retention job (services/retention.py)"""
+    __tablename__ = "bookings_archive"
+    
+    # Same id as in `bookings`; no foreign keys, users are never archived
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    # The sync checks codes here so archived visits are not inserted again
+    bukza_booking_id: Mapped[str] = mapped_column(String(100), index=True)
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    
+    service_name: Mapped[str] = mapped_column(String(255))
+    client_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    client_phone: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    booking_datetime: Mapped[datetime] = mapped_column(DateTime, index=True)
+    duration_minutes: Mapped[int] = mapped_column(Integer)
+    status: Mapped[BookingStatus] = mapped_column(SQLEnum(BookingStatus))
+    total_sum: Mapped[Optional[Decimal]] = mapped_column(Numeric(12, 2), nullable=True)
+    
+    rating: Mapped[Optional[int]] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+    archived_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+class ArchivedMessage(Base):
+    """Old message record moved out of `messages` by the retention job"""
+    __tablename__ = "messages_archive"
+    
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    user_id: Mapped[int] = mapped_column(Integer)
+    booking_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    broadcast_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    
+    message_type: Mapped[MessageType] = mapped_column(SQLEnum(MessageType))
+    sent_at: Mapped[datetime] = mapped_column(DateTime)
+    archived_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+class DailyRollup(Base):
+    """
+    Booking figures of one visit day and service. Kept up to date by the
+    BookingRepository writes in the same transaction as the booking change.
+    """
+    __tablename__ = "daily_rollups"
+    
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    service_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # All bookings for the day, cancelled ones included
+    bookings: Mapped[int] = mapped_column(Integer, default=0)
+    cancellations: Mapped[int] = mapped_column(Integer, default=0)
+    # total_sum of the bookings that are not cancelled
+    revenue: Mapped[Decimal] = mapped_column(Numeric(12, 2), default=0)
+    rating_sum: Mapped[int] = mapped_column(Integer, default=0)
+    rating_count: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
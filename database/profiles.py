@@ -0,0 +1,127 @@
+"""
+Named database engine profiles.
+
+A profile is picked with DATABASE_PROFILE and single values can be
+overridden with DATABASE_ENGINE_OPTIONS (JSON), e.g.
+
+    DATABASE_PROFILE=railway
+    DATABASE_ENGINE_OPTIONS={"pool_size": 10}
+
+Pool values apply to both backends. `pool_pre_ping`, `pool_recycle` and
+the statement caches only matter for PostgreSQL, the `sqlite_*` pragmas
+only for SQLite, where they are set on every new connection.
+`sqlite_single_writer` sends all writes through one writer task (see
+database/sqlite_writer.py).
+"""
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+SQLITE_PRAGMAS = {
+    "sqlite_journal_mode": "journal_mode",
+    "sqlite_synchronous": "synchronous",
+    "sqlite_busy_timeout_ms": "busy_timeout",
+    "sqlite_mmap_size": "mmap_size",
+}
+
+_BASE = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_timeout": 30.0,
+    "pool_pre_ping": False,
+    "pool_recycle": -1,
+    # asyncpg's own cache and SQLAlchemy's cache of asyncpg prepared statements
+    "statement_cache_size": 100,
+    "prepared_statement_cache_size": 100,
+    # WAL lets readers run next to the writer; NORMAL only syncs at checkpoints
+    "sqlite_journal_mode": "WAL",
+    "sqlite_synchronous": "NORMAL",
+    "sqlite_busy_timeout_ms": 5000,
+    "sqlite_mmap_size": 256 * 1024 * 1024,
+    "sqlite_single_writer": False,
+    "sqlite_writer_max_batch": 100,
+}
+
+PROFILES: dict[str, dict[str, Any]] = {
+    "default": _BASE,
+    # Managed PostgreSQL behind a proxy that drops idle connections (Railway)
+    "railway": {
+        **_BASE,
+        "max_overflow": 5,
+        "pool_pre_ping": True,
+        "pool_recycle": 240,
+    },
+    # PgBouncer in transaction mode: prepared statements don't survive
+    # between transactions, and PgBouncer does the pooling
+    "pgbouncer": {
+        **_BASE,
+        "pool_size": 10,
+        "max_overflow": 0,
+        "pool_pre_ping": True,
+        "pool_recycle": 600,
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+    },
+    # One process with many concurrent updates and inbox workers
+    "high_concurrency": {
+        **_BASE,
+        "pool_size": 20,
+        "max_overflow": 20,
+        "pool_timeout": 10.0,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+        "statement_cache_size": 500,
+        "prepared_statement_cache_size": 500,
+    },
+    # Small venue on SQLite: writes queue for one writer instead of the file lock
+    "sqlite_single_writer": {
+        **_BASE,
+        "sqlite_single_writer": True,
+    },
+}
+
+
+def resolve_profile(name: str, overrides: dict[str, Any]) -> dict[str, Any]:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown DATABASE_PROFILE {name!r}, expected one of: {', '.join(PROFILES)}")
+    unknown = set(overrides) - set(_BASE)
+    if unknown:
+        raise ValueError(f"Unknown DATABASE_ENGINE_OPTIONS keys: {', '.join(sorted(unknown))}")
+    return {**PROFILES[name], **overrides}
+
+
+def engine_options(url: str, profile: dict[str, Any]) -> dict[str, Any]:
+    """Keyword arguments of create_async_engine for `url`"""
+    options = {
+        "pool_size": profile["pool_size"],
+        "max_overflow": profile["max_overflow"],
+        "pool_timeout": profile["pool_timeout"],
+    }
+    if url.startswith("sqlite"):
+        # Pooled instead of a new connection (and pragmas) per session
+        options["poolclass"] = AsyncAdaptedQueuePool
+        options["connect_args"] = {"check_same_thread": False}
+        return options
+
+    options["pool_pre_ping"] = profile["pool_pre_ping"]
+    options["pool_recycle"] = profile["pool_recycle"]
+    if "+asyncpg" in url:
+        options["connect_args"] = {
+            "statement_cache_size": profile["statement_cache_size"],
+            "prepared_statement_cache_size": profile["prepared_statement_cache_size"],
+        }
+    return options
+
+
+def install_sqlite_pragmas(engine: AsyncEngine, profile: dict[str, Any]):
+    pragmas = [(pragma, profile[key]) for key, pragma in SQLITE_PRAGMAS.items() if profile.get(key) is not None]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+    event.listen(engine.sync_engine, "connect", set_pragmas)
@@ -0,0 +1,194 @@
+"""
+Check that repository queries are served by indexes.
+
+Runs the repository read/write paths against the configured database
+inside a transaction that is rolled back, captures every SQL statement
+they send and EXPLAINs it. Exits with status 1 if any statement would do
+a full table scan:
+
+    python -m database.query_plans
+
+On PostgreSQL sequential scans are disabled for the check (`SET LOCAL
+enable_seqscan = off`), so on a small or empty database the planner still
+reports whether an index path exists at all.
+"""
+import asyncio
+import json
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import engine, init_db
+from database.cache import user_cache
+from database.models import Base, MessageType, BookingStatus, Booking, Message, ArchivedBooking, ArchivedMessage
+from database.repository import (
+    UserRepository, BookingRepository, MessageRepository,
+    InboxRepository, FSMRepository, LeaseRepository, BroadcastRepository, SyncStateRepository,
+    ArchiveRepository, RollupRepository
+)
+
+# Tables whose full scans are expected and harmless
+IGNORED_TABLES = {"alembic_version"}
+
+
+async def _exercise(session: AsyncSession):
+    """Call every repository query the bot runs regularly"""
+    now = datetime.utcnow()
+    users = UserRepository(session, autocommit=False)
+    bookings = BookingRepository(session, autocommit=False)
+    messages = MessageRepository(session, autocommit=False)
+    inbox = InboxRepository(session, autocommit=False)
+    fsm = FSMRepository(session, autocommit=False)
+    leases = LeaseRepository(session, autocommit=False)
+    broadcasts = BroadcastRepository(session, autocommit=False)
+    sync_state = SyncStateRepository(session, autocommit=False)
+    archive = ArchiveRepository(session, autocommit=False)
+    rollups = RollupRepository(session, autocommit=False)
+
+    user_cache.clear()
+    await users.get_by_telegram_id(-1)
+    await users.get_by_phone("+70000000000")
+    await users.set_blocked([-1])
+    await users.get_ids_by_phones(["+70000000000", "+70000000001"])
+
+    await bookings.get_by_bukza_id("query-plan-check")
+    await bookings.get_unlinked_by_code("query-plan-check")
+    await bookings.link_orphans_by_phone(-1, "+70000000000")
+    await bookings.get_active_by_user(-1)
+    await bookings.get_all_by_user(-1)
+    await bookings.count_by_status(-1)
+    await bookings.get_page_by_user(-1, BookingStatus.ACTIVE, 6)
+    await bookings.get_page_by_user(-1, BookingStatus.COMPLETED, 6, cursor=(now, 1), descending=True)
+    await bookings.get_page_by_user(-1, BookingStatus.COMPLETED, 6, cursor=(now, 1), backward=True, descending=True)
+    await bookings.get_due_without_message(
+        now, now + timedelta(hours=1), MessageType.REMINDER, made_ahead=timedelta(hours=24)
+    )
+    await bookings.get_due_without_message(
+        now - timedelta(hours=36), now, MessageType.FEEDBACK_REQUEST,
+        statuses=(BookingStatus.ACTIVE, BookingStatus.COMPLETED), ending_in=(now - timedelta(hours=12), now)
+    )
+    await bookings.update_status(-1, BookingStatus.CANCELLED)
+    booking = await bookings.upsert("query-plan-check", "check", now, 60)
+    await bookings.upsert_many([
+        {"bukza_booking_id": "query-plan-check", "service_name": "check", "booking_datetime": now,
+         "duration_minutes": 60, "client_name": None, "client_phone": None, "user_id": None},
+    ])
+    # Rollups move only when the booking exists
+    await bookings.save_rating(booking.id, 5)
+    await bookings.update_status(booking.id, BookingStatus.CANCELLED)
+    await bookings.rating_counts(now - timedelta(days=30), now)
+    await rollups.get_range(date.today() - timedelta(days=30), date.today())
+    await messages.delete(-1)
+
+    await inbox.claim_ready(now, 50, set())
+    await inbox.renew_claims([-1], now)
+    await inbox.release_stale(now)
+
+    await fsm.get("query-plan-check", now)
+    await fsm.purge_expired(now)
+
+    await leases.try_acquire("query-plan-check", "check", now, now)
+
+    await broadcasts.get_next_runnable()
+    async for _ in broadcasts.stream_recipients(-1, 0, 50, 50):
+        pass
+    await broadcasts.record_results(-1, 0, 0, 0, [-1])
+
+    await sync_state.get_cursor("query-plan-check")
+    await sync_state.save_cursor("query-plan-check", now)
+
+    await archive.complete_past(now - timedelta(days=2), 500)
+    await archive.archive_bookings(now - timedelta(days=365), 500)
+    await archive.archive_messages(now - timedelta(days=90), 500)
+    # The moves themselves, skipped above when nothing qualifies
+    await archive._move(Message, ArchivedMessage, [-1], now)
+    await archive._move(Booking, ArchivedBooking, [-1], now)
+
+
+def _full_scans_postgres(plan) -> list[str]:
+    found = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") not in IGNORED_TABLES:
+            found.append(f"Seq Scan on {node.get('Relation Name')}")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    for entry in plan:
+        walk(entry["Plan"])
+    return found
+
+
+def _full_scans_sqlite(rows) -> list[str]:
+    found = []
+    for row in rows:
+        detail = row[-1]
+        # "SCAN t" and "SCAN t USING INDEX i" (a walk over the whole index,
+        # e.g. to satisfy ORDER BY) read every row; "SEARCH t ..." doesn't.
+        # A scan of a subquery only reads the rows its own plan produced
+        if detail.startswith("SCAN "):
+            table = detail.split()[1]
+            if table in Base.metadata.tables and table not in IGNORED_TABLES:
+                found.append(detail)
+    return found
+
+
+async def check() -> list[tuple[str, list[str]]]:
+    """Return (statement, full scans) for every offending statement"""
+    statements: list[tuple[str, object]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT")):
+            statements.append((statement, parameters))
+
+    problems = []
+    async with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        await conn.begin()
+        if postgres:
+            await conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+
+        session = AsyncSession(bind=conn, expire_on_commit=False)
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            await _exercise(session)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+        seen = set()
+        for statement, parameters in statements:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            if postgres:
+                result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                plan = result.scalar()
+                scans = _full_scans_postgres(json.loads(plan) if isinstance(plan, str) else plan)
+            else:
+                result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                scans = _full_scans_sqlite(result.all())
+            if scans:
+                problems.append((statement, scans))
+
+        await session.close()
+        await conn.rollback()
+    return problems
+
+
+async def main() -> int:
+    engine.echo = False
+    await init_db()
+    problems = await check()
+    await engine.dispose()
+    if not problems:
+        print("OK: all repository queries use indexes")
+        return 0
+    for statement, scans in problems:
+        print(f"FULL SCAN ({', '.join(scans)}):\n{statement}\n")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,46 +1,206 @@
-from sqlalchemy import select, update
+import functools
+
+from sqlalchemy import select, insert, update, delete, exists, func, or_, and_, case, literal, union_all, DateTime
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import User, Booking, Message, BookingStatus, MessageType
-from typing import Optional
-from datetime import datetime
+from database import sqlite_writer
+from database.clock import utc_offset, utc_to_local
+from database.cache import user_cache
+from database.models import (
+    User, Booking, Message, BookingStatus, MessageType, WebhookInbox, InboxStatus, FSMRecord, Lease,
+    Broadcast, BroadcastStatus, SyncState, ArchivedBooking, ArchivedMessage, DailyRollup
+)
+from typing import AsyncIterator, Optional
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+
+def _dialect_insert(session: AsyncSession, model):
+    """INSERT construct with ON CONFLICT support for the current backend"""
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def _add_minutes(session: AsyncSession, value, minutes):
+    """SQL for `value` plus `minutes` minutes; either may be a column"""
+    if session.bind.dialect.name == "postgresql":
+        return value + func.make_interval(0, 0, 0, 0, 0, minutes)
+    return func.datetime(value, func.printf("%+d minutes", minutes), type_=DateTime)
+
+
+def writes(method):
+    """
+    Marks a repository method that writes. With the SQLite single writer
+    (database/sqlite_writer.py) a standalone call runs in the writer's next
+    batch instead of on the caller's session and returns the same result
+    once that batch is committed.
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if not (self.autocommit and sqlite_writer.enabled):
+            return await method(self, *args, **kwargs)
+        repository = None
+        
+        async def job(session: AsyncSession):
+            nonlocal repository
+            # Runs again alone if another write of the batch fails
+            repository = type(self)(session, autocommit=False)
+            return await method(repository, *args, **kwargs)
+        
+        result = await sqlite_writer.run(job)
+        repository.after_commit()
+        return result
+    return wrapper
 
 
-class UserRepository:
-    def __init__(self, session: AsyncSession):
+# What a booking adds to the rollup of its day (see `_add_rollup_share`)
+ROLLUP_COLUMNS = (Booking.booking_datetime, Booking.service_name, Booking.status, Booking.total_sum, Booking.rating)
+
+
+def _add_rollup_share(deltas: dict, row, sign: int = 1):
+    """
+    Add one booking's share of its day's figures to `deltas`, or remove it
+    with `sign=-1`. `row` holds the ROLLUP_COLUMNS values of the booking.
+    """
+    booking_datetime, service_name, status, total_sum, rating = row
+    delta = deltas.setdefault(
+        (booking_datetime.date(), service_name),
+        {"bookings": 0, "cancellations": 0, "revenue": Decimal(0), "rating_sum": 0, "rating_count": 0}
+    )
+    cancelled = status == BookingStatus.CANCELLED
+    delta["bookings"] += sign
+    delta["cancellations"] += sign * cancelled
+    if total_sum is not None and not cancelled:
+        delta["revenue"] += sign * total_sum
+    if rating is not None:
+        delta["rating_sum"] += sign * rating
+        delta["rating_count"] += sign
+
+
+class BaseRepository:
+    """
+    Repositories commit after every write by default. Created with
+    `autocommit=False` (see database/unit_of_work.py) they only flush, so
+    several writes share one transaction that the caller commits.
+    """
+    def __init__(self, session: AsyncSession, autocommit: bool = True):
         self.session = session
+        self.autocommit = autocommit
+    
+    async def _commit(self):
+        if self.autocommit:
+            await self.session.commit()
+        else:
+            # Sends pending INSERTs so generated primary keys are available
+            await self.session.flush()
+    
+    def after_commit(self):
+        """Called by whoever committed the writes made with `autocommit=False`"""
+    
+    def after_rollback(self):
+        pass
+
+
+class UserRepository(BaseRepository):
+    """User lookups go through the in-process `user_cache` (see database/cache.py)"""
+    def __init__(self, session: AsyncSession, autocommit: bool = True):
+        super().__init__(session, autocommit)
+        # Replayed by the unit of work after commit, when other sessions
+        # may have cached the old row in the meantime
+        self.pending_invalidations: list[dict] = []
+    
+    def _invalidate(self, **keys):
+        user_cache.invalidate(**keys)
+        if not self.autocommit:
+            self.pending_invalidations.append(keys)
+    
+    def after_commit(self):
+        for keys in self.pending_invalidations:
+            user_cache.invalidate(**keys)
+        self.pending_invalidations.clear()
+    
+    def after_rollback(self):
+        self.pending_invalidations.clear()
     
     async def get_by_telegram_id(self, telegram_id: int) -> Optional[User]:
+        cached = user_cache.get_by_telegram_id(telegram_id)
+        if cached is not None:
+            return cached
         result = await self.session.execute(
             select(User).where(User.telegram_id == telegram_id)
         )
-        return result.scalar_one_or_none()
+        user = result.scalar_one_or_none()
+        if user:
+            user_cache.put(user)
+        return user
     
     async def get_by_phone(self, phone_number: str) -> Optional[User]:
+        cached = user_cache.get_by_phone(phone_number)
+        if cached is not None:
+            return cached
         result = await self.session.execute(
             select(User).where(User.phone_number == phone_number)
         )
-        return result.scalar_one_or_none()
+        user = result.scalar_one_or_none()
+        if user:
+            user_cache.put(user)
+        return user
     
+    @writes
     async def create(self, telegram_id: int, phone_number: Optional[str] = None) -> User:
         user = User(telegram_id=telegram_id, phone_number=phone_number)
         self.session.add(user)
-        await self.session.commit()
-        await self.session.refresh(user)
+        await self._commit()
+        self._invalidate(user_id=user.id, telegram_id=telegram_id, phone_number=phone_number)
         return user
     
+    @writes
     async def update_phone(self, user_id: int, phone_number: str) -> User:
         await self.session.execute(
             update(User).where(User.id == user_id).values(phone_number=phone_number)
         )
-        await self.session.commit()
+        await self._commit()
+        self._invalidate(user_id=user_id, phone_number=phone_number)
         result = await self.session.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one()
+        self._invalidate(user_id=user_id, telegram_id=user.telegram_id)
+        return user
+    
+    @writes
+    async def set_blocked(self, telegram_ids: list[int], blocked: bool = True) -> int:
+        """Mark users who blocked (or unblocked) the bot"""
+        if not telegram_ids:
+            return 0
+        result = await self.session.execute(
+            update(User)
+            .where(User.telegram_id.in_(telegram_ids))
+            .where(User.is_blocked != blocked)
+            .values(is_blocked=blocked)
+        )
+        await self._commit()
+        for telegram_id in telegram_ids:
+            self._invalidate(telegram_id=telegram_id)
+        return result.rowcount
+    
+    async def get_ids_by_phones(self, phone_numbers: list[str]) -> dict[str, int]:
+        """Map normalized phones to user ids in one query (users without a match are left out)"""
+        if not phone_numbers:
+            return {}
+        result = await self.session.execute(
+            select(User.phone_number, User.id).where(User.phone_number.in_(phone_numbers))
+        )
+        return {phone_number: user_id for phone_number, user_id in result.all()}
+    
+    async def count_reachable(self) -> int:
+        result = await self.session.execute(
+            select(func.count()).select_from(User).where(User.is_blocked == False)
+        )
         return result.scalar_one()
 
 
-class BookingRepository:
-    def __init__(self, session: AsyncSession):
-        self.session = session
-    
+class BookingRepository(BaseRepository):
     async def get_by_bukza_id(self, bukza_booking_id: str) -> Optional[Booking]:
         result = await self.session.execute(
             select(Booking).where(Booking.bukza_booking_id == bukza_booking_id)
@@ -65,6 +225,106 @@ class BookingRepository:
         )
         return list(result.scalars().all())
     
+    async def get_page_by_user(
+        self,
+        user_id: int,
+        status: BookingStatus,
+        limit: int,
+        cursor: Optional[tuple[datetime, int]] = None,
+        backward: bool = False,
+        descending: bool = False
+    ) -> list[Booking]:
+        """
+        One page of a user's bookings with `status`, keyset-paginated on
+        (booking_datetime, id).
+        
+        `cursor` is the (booking_datetime, id) of the last row of the
+        previous page, or of the first row of the current page when paging
+        `backward`. Rows are always returned in display order.
+        """
+        query = (
+            select(Booking)
+            .where(Booking.user_id == user_id)
+            .where(Booking.status == status)
+        )
+        ascending = descending == backward
+        if cursor is not None:
+            cursor_datetime, cursor_id = cursor
+            # The first condition alone is an index range on
+            # (user_id, status, booking_datetime); the second breaks ties
+            if ascending:
+                query = query.where(
+                    Booking.booking_datetime >= cursor_datetime,
+                    or_(Booking.booking_datetime > cursor_datetime, Booking.id > cursor_id)
+                )
+            else:
+                query = query.where(
+                    Booking.booking_datetime <= cursor_datetime,
+                    or_(Booking.booking_datetime < cursor_datetime, Booking.id < cursor_id)
+                )
+        if ascending:
+            query = query.order_by(Booking.booking_datetime, Booking.id)
+        else:
+            query = query.order_by(Booking.booking_datetime.desc(), Booking.id.desc())
+        
+        result = await self.session.execute(query.limit(limit))
+        bookings = list(result.scalars().all())
+        if backward:
+            bookings.reverse()
+        return bookings
+    
+    async def count_by_status(self, user_id: int) -> dict[BookingStatus, int]:
+        result = await self.session.execute(
+            select(Booking.status, func.count())
+            .where(Booking.user_id == user_id)
+            .group_by(Booking.status)
+        )
+        return {status: count for status, count in result.all()}
+    
+    async def get_due_without_message(
+        self,
+        start: datetime,
+        end: datetime,
+        message_type: MessageType,
+        statuses: tuple[BookingStatus, ...] = (BookingStatus.ACTIVE,),
+        limit: int = 500,
+        made_ahead: Optional[timedelta] = None,
+        ending_in: Optional[tuple[datetime, datetime]] = None
+    ) -> list[tuple[Booking, User]]:
+        """
+        Get linked bookings starting in (start, end] together with their user,
+        skipping bookings that already have a message of `message_type`.
+        
+        `made_ahead` keeps only bookings made at least that long before
+        the visit, `ending_in` only visits ending in (from, to]. Both are
+        applied in SQL, so `limit` counts only bookings that qualify.
+        Times are visit times (local, see database/clock.py).
+        """
+        already_sent = exists().where(
+            Message.booking_id == Booking.id,
+            Message.message_type == message_type
+        )
+        query = (
+            select(Booking, User)
+            .join(User, Booking.user_id == User.id)
+            .where(Booking.status.in_(statuses))
+            .where(Booking.booking_datetime > start)
+            .where(Booking.booking_datetime <= end)
+            .where(~already_sent)
+        )
+        if made_ahead is not None:
+            # created_at is UTC: move the visit time back by the UTC offset too
+            lead_minutes = int((made_ahead + utc_offset()).total_seconds() // 60)
+            query = query.where(
+                Booking.created_at < _add_minutes(self.session, Booking.booking_datetime, -lead_minutes)
+            )
+        if ending_in is not None:
+            ends_at = _add_minutes(self.session, Booking.booking_datetime, Booking.duration_minutes)
+            query = query.where(ends_at > ending_in[0], ends_at <= ending_in[1])
+        result = await self.session.execute(query.order_by(Booking.booking_datetime).limit(limit))
+        return [(booking, user) for booking, user in result.all()]
+    
+    @writes
     async def create(
         self,
         bukza_booking_id: str,
@@ -73,7 +333,8 @@ class BookingRepository:
         duration_minutes: int,
         user_id: Optional[int] = None,
         client_name: Optional[str] = None,
-        client_phone: Optional[str] = None
+        client_phone: Optional[str] = None,
+        total_sum: Optional[Decimal] = None
     ) -> Booking:
         booking = Booking(
             bukza_booking_id=bukza_booking_id,
@@ -82,21 +343,214 @@ class BookingRepository:
             client_name=client_name,
             client_phone=client_phone,
             booking_datetime=booking_datetime,
-            duration_minutes=duration_minutes
+            duration_minutes=duration_minutes,
+            total_sum=total_sum
         )
         self.session.add(booking)
-        await self.session.commit()
-        await self.session.refresh(booking)
+        deltas = {}
+        _add_rollup_share(deltas, (booking_datetime, service_name, BookingStatus.ACTIVE, total_sum, None))
+        await self._apply_rollups(deltas)
+        await self._commit()
         return booking
     
+    async def _apply_rollups(self, deltas: dict):
+        """Add `deltas` ({(day, service): {column: delta}}) to daily_rollups in one statement"""
+        rows = [
+            {"day": day, "service_name": service_name, **delta, "updated_at": datetime.utcnow()}
+            for (day, service_name), delta in deltas.items() if any(delta.values())
+        ]
+        if not rows:
+            return
+        table = DailyRollup.__table__
+        stmt = _dialect_insert(self.session, table)
+        await self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.c.day, table.c.service_name],
+                set_={
+                    **{
+                        column: table.c[column] + stmt.excluded[column]
+                        for column in ("bookings", "cancellations", "revenue", "rating_sum", "rating_count")
+                    },
+                    "updated_at": stmt.excluded.updated_at,
+                }
+            ),
+            rows
+        )
+    
+    def _upsert_statement(self, refresh: bool):
+        """
+        INSERT ... ON CONFLICT (bukza_booking_id) DO UPDATE.
+        
+        On conflict the stored booking is linked to the user if it has
+        none; a linked user is never replaced. With `refresh` it also takes
+        the new service, time, name, phone and status, except that a
+        COMPLETED visit is not reopened and a name or phone is not erased
+        by an empty one. Stored rows that would not change are then left
+        alone and not returned.
+        
+        The batch variant is built on the Core table: the ORM bulk path
+        splits an executemany into many small INSERTs whenever rows differ
+        in which values are NULL.
+        """
+        stmt = _dialect_insert(self.session, Booking.__table__ if refresh else Booking)
+        new = stmt.excluded
+        set_ = {"user_id": func.coalesce(Booking.user_id, new.user_id)}
+        if not refresh:
+            return stmt.on_conflict_do_update(index_elements=[Booking.bukza_booking_id], set_=set_)
+        
+        set_.update({
+            "service_name": new.service_name,
+            "booking_datetime": new.booking_datetime,
+            "duration_minutes": new.duration_minutes,
+            "client_name": func.coalesce(new.client_name, Booking.client_name),
+            "client_phone": func.coalesce(new.client_phone, Booking.client_phone),
+            "total_sum": func.coalesce(new.total_sum, Booking.total_sum),
+            "status": case(
+                (and_(Booking.status == BookingStatus.COMPLETED, new.status == BookingStatus.ACTIVE), Booking.status),
+                else_=new.status
+            ),
+        })
+        changed = or_(*[value.is_distinct_from(getattr(Booking, column)) for column, value in set_.items()])
+        return stmt.on_conflict_do_update(
+            index_elements=[Booking.bukza_booking_id],
+            set_={**set_, "updated_at": new.updated_at},
+            where=changed
+        )
+    
+    @writes
+    async def upsert(
+        self,
+        bukza_booking_id: str,
+        service_name: str,
+        booking_datetime: datetime,
+        duration_minutes: int,
+        user_id: Optional[int] = None,
+        client_name: Optional[str] = None,
+        client_phone: Optional[str] = None,
+        total_sum: Optional[Decimal] = None
+    ) -> Optional[Booking]:
+        """
+        Save a booking, or link the already stored one with this code to
+        `user_id`, in one statement. Concurrent deliveries of the same
+        booking can't both insert it. Returns the stored row; a new one is
+        added to its day's rollup.
+        
+        Returns None for a booking already moved to `bookings_archive`
+        (a late redelivery of an old visit), as `upsert_many` skips them.
+        """
+        archived = await self.session.scalar(
+            select(exists().where(ArchivedBooking.bukza_booking_id == bukza_booking_id))
+        )
+        if archived:
+            return None
+        now = datetime.utcnow()
+        result = await self.session.execute(
+            self._upsert_statement(refresh=False)
+            .values(
+                bukza_booking_id=bukza_booking_id,
+                user_id=user_id,
+                service_name=service_name,
+                client_name=client_name,
+                client_phone=client_phone,
+                booking_datetime=booking_datetime,
+                duration_minutes=duration_minutes,
+                status=BookingStatus.ACTIVE,
+                total_sum=total_sum,
+                created_at=now,
+                updated_at=now
+            )
+            .returning(Booking),
+            execution_options={"populate_existing": True}
+        )
+        booking = result.scalar_one()
+        # created_at is not touched on conflict: only a new row carries this call's time
+        if booking.created_at == now:
+            deltas = {}
+            _add_rollup_share(deltas, [getattr(booking, column.key) for column in ROLLUP_COLUMNS])
+            await self._apply_rollups(deltas)
+        await self._commit()
+        return booking
+    
+    @writes
+    async def upsert_many(self, rows: list[dict]) -> dict[str, bool]:
+        """
+        Insert or refresh many bookings in one statement (see
+        `_upsert_statement`). Rows are dicts of Booking columns; `status`
+        defaults to ACTIVE. Returns {code: inserted} for the bookings that
+        were inserted or changed; unchanged ones are left out.
+        
+        The rollups are moved from the stored version of each changed
+        booking to the new one, read with one query before the upsert.
+        The stored rows stay locked until commit, as in
+        `_update_with_rollups`, so a status change or rating can't slip in
+        between and leave a stale share behind.
+        
+        Bookings already moved to `bookings_archive` by retention are
+        skipped (and left out of the result): inserting them again would
+        count them twice in the rollups.
+        """
+        if not rows:
+            return {}
+        result = await self.session.execute(
+            select(ArchivedBooking.bukza_booking_id)
+            .where(ArchivedBooking.bukza_booking_id.in_([row["bukza_booking_id"] for row in rows]))
+        )
+        archived = set(result.scalars().all())
+        rows = [row for row in rows if row["bukza_booking_id"] not in archived]
+        if not rows:
+            return {}
+        result = await self.session.execute(
+            select(Booking.bukza_booking_id, *ROLLUP_COLUMNS)
+            .where(Booking.bukza_booking_id.in_([row["bukza_booking_id"] for row in rows]))
+            .with_for_update()
+        )
+        stored = {code: values for code, *values in result.all()}
+        
+        now = datetime.utcnow()
+        result = await self.session.execute(
+            self._upsert_statement(refresh=True)
+            .returning(Booking.bukza_booking_id, Booking.created_at, *ROLLUP_COLUMNS),
+            [{"status": BookingStatus.ACTIVE, "total_sum": None, **row, "created_at": now, "updated_at": now} for row in rows]
+        )
+        saved = {}
+        deltas = {}
+        for code, created_at, *values in result.all():
+            # created_at is not touched on conflict: only new rows carry this run's time
+            saved[code] = created_at == now
+            if code in stored:
+                _add_rollup_share(deltas, stored[code], sign=-1)
+            _add_rollup_share(deltas, values)
+        await self._apply_rollups(deltas)
+        await self._commit()
+        return saved
+    
+    @writes
     async def link_to_user(self, booking_id: int, user_id: int) -> bool:
         """Link booking to user"""
         await self.session.execute(
             update(Booking).where(Booking.id == booking_id).values(user_id=user_id)
         )
-        await self.session.commit()
+        await self._commit()
         return True
     
+    @writes
+    async def link_orphans_by_phone(self, user_id: int, phone_number: str) -> list[tuple[int, datetime, BookingStatus]]:
+        """
+        Link every booking made with this phone before its client
+        registered, in one UPDATE over the partial index on unlinked
+        phones. Returns (id, booking_datetime, status) of the linked bookings.
+        """
+        result = await self.session.execute(
+            update(Booking)
+            .where(Booking.client_phone == phone_number, Booking.user_id == None)
+            .values(user_id=user_id, updated_at=datetime.utcnow())
+            .returning(Booking.id, Booking.booking_datetime, Booking.status)
+            .execution_options(synchronize_session=False)
+        )
+        linked = [tuple(row) for row in result.all()]
+        await self._commit()
+        return linked
+    
     async def get_unlinked_by_code(self, bukza_booking_id: str) -> Optional[Booking]:
         """Get booking by code that is not linked to any user"""
         result = await self.session.execute(
@@ -107,23 +561,47 @@ class BookingRepository:
         )
         return result.scalar_one_or_none()
     
+    @writes
     async def update_status(self, booking_id: int, status: BookingStatus):
-        await self.session.execute(
-            update(Booking).where(Booking.id == booking_id).values(status=status)
-        )
-        await self.session.commit()
+        await self._update_with_rollups(booking_id, status=status)
+        await self._commit()
     
+    @writes
     async def save_rating(self, booking_id: int, rating: int):
-        await self.session.execute(
-            update(Booking).where(Booking.id == booking_id).values(rating=rating)
+        await self._update_with_rollups(booking_id, rating=rating)
+        await self._commit()
+    
+    async def _update_with_rollups(self, booking_id: int, **values):
+        """Update one booking and move its share of the rollups from the old values to the new"""
+        result = await self.session.execute(
+            select(*ROLLUP_COLUMNS).where(Booking.id == booking_id).with_for_update()
+        )
+        old = result.one_or_none()
+        if old is None:
+            return
+        await self.session.execute(update(Booking).where(Booking.id == booking_id).values(**values))
+        new = [values.get(column.key, value) for column, value in zip(ROLLUP_COLUMNS, old)]
+        deltas = {}
+        _add_rollup_share(deltas, old, sign=-1)
+        _add_rollup_share(deltas, new)
+        await self._apply_rollups(deltas)
+    
+    async def rating_counts(self, since: datetime, until: datetime) -> dict[int, int]:
+        """Number of each rating for visits in [since, until), archived visits included"""
+        ratings = union_all(*[
+            select(model.rating)
+            .where(model.booking_datetime >= since, model.booking_datetime < until)
+            .where(model.rating.isnot(None))
+            for model in (Booking, ArchivedBooking)
+        ]).subquery()
+        result = await self.session.execute(
+            select(ratings.c.rating, func.count()).group_by(ratings.c.rating)
         )
-        await self.session.commit()
+        return {rating: count for rating, count in result.all()}
 
 
-class MessageRepository:
-    def __init__(self, session: AsyncSession):
-        self.session = session
-    
+class MessageRepository(BaseRepository):
+    @writes
     async def create(
         self,
         user_id: int,
@@ -136,6 +614,431 @@ class MessageRepository:
             message_type=message_type
         )
         self.session.add(message)
-        await self.session.commit()
-        await self.session.refresh(message)
+        await self._commit()
         return message
+    
+    @writes
+    async def create_many(self, messages: list[Message]):
+        """Insert several message records in one commit"""
+        self.session.add_all(messages)
+        await self._commit()
+    
+    @writes
+    async def delete(self, message_id: int):
+        await self.session.execute(delete(Message).where(Message.id == message_id))
+        await self._commit()
+
+
+class BroadcastRepository(BaseRepository):
+    @writes
+    async def create(self, text: str, created_by: Optional[int] = None) -> Broadcast:
+        broadcast = Broadcast(text=text, created_by=created_by)
+        self.session.add(broadcast)
+        await self._commit()
+        return broadcast
+    
+    async def get(self, broadcast_id: int) -> Optional[Broadcast]:
+        result = await self.session.execute(select(Broadcast).where(Broadcast.id == broadcast_id))
+        return result.scalar_one_or_none()
+    
+    async def get_next_runnable(self) -> Optional[Broadcast]:
+        """Oldest broadcast that is pending or was interrupted while running"""
+        result = await self.session.execute(
+            select(Broadcast)
+            .where(Broadcast.status.in_((BroadcastStatus.PENDING, BroadcastStatus.RUNNING)))
+            .order_by(Broadcast.id)
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+    
+    async def get_recent(self, limit: int = 5) -> list[Broadcast]:
+        result = await self.session.execute(
+            select(Broadcast).order_by(Broadcast.id.desc()).limit(limit)
+        )
+        return list(result.scalars().all())
+    
+    async def stream_recipients(
+        self,
+        broadcast_id: int,
+        after_user_id: int,
+        limit: int,
+        batch_size: int
+    ) -> AsyncIterator[list[tuple[int, int]]]:
+        """
+        Yield batches of (user_id, telegram_id) after the cursor, in id
+        order, through a server-side cursor. Blocked users and users who
+        already have a delivery record for the broadcast are skipped.
+        """
+        delivered = exists().where(
+            Message.broadcast_id == broadcast_id,
+            Message.user_id == User.id
+        )
+        result = await self.session.stream(
+            select(User.id, User.telegram_id)
+            .where(User.id > after_user_id)
+            .where(User.is_blocked == False)
+            .where(~delivered)
+            .order_by(User.id)
+            .limit(limit)
+            .execution_options(yield_per=batch_size)
+        )
+        async for partition in result.partitions():
+            yield [(user_id, telegram_id) for user_id, telegram_id in partition]
+    
+    @writes
+    async def claim_batch(self, broadcast_id: int, user_ids: list[int], last_user_id: int):
+        """
+        Record deliveries before sending and move the cursor past them, in
+        one transaction: after a crash these users are not messaged twice.
+        """
+        now = datetime.utcnow()
+        self.session.add_all([
+            Message(user_id=user_id, broadcast_id=broadcast_id, message_type=MessageType.BROADCAST, sent_at=now)
+            for user_id in user_ids
+        ])
+        await self.session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(last_user_id=last_user_id)
+        )
+        await self._commit()
+    
+    @writes
+    async def record_results(
+        self,
+        broadcast_id: int,
+        sent: int,
+        failed: int,
+        blocked: int,
+        undelivered_user_ids: list[int]
+    ):
+        """Add batch outcomes and drop the delivery records of failed sends"""
+        if undelivered_user_ids:
+            await self.session.execute(
+                delete(Message).where(
+                    Message.broadcast_id == broadcast_id,
+                    Message.user_id.in_(undelivered_user_ids)
+                )
+            )
+        await self.session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(
+                sent=Broadcast.sent + sent,
+                failed=Broadcast.failed + failed,
+                blocked=Broadcast.blocked + blocked
+            )
+        )
+        await self._commit()
+    
+    @writes
+    async def set_status(self, broadcast_id: int, status: BroadcastStatus, **values):
+        await self.session.execute(
+            update(Broadcast).where(Broadcast.id == broadcast_id).values(status=status, **values)
+        )
+        await self._commit()
+
+
+class RollupRepository(BaseRepository):
+    async def get_range(self, since: date, until: date) -> list[DailyRollup]:
+        """Rollups of the days from `since` to `until` inclusive, by day and service"""
+        result = await self.session.execute(
+            select(DailyRollup)
+            .where(DailyRollup.day >= since, DailyRollup.day <= until)
+            .order_by(DailyRollup.day, DailyRollup.service_name)
+        )
+        return list(result.scalars().all())
+
+
+class SyncStateRepository(BaseRepository):
+    async def get_cursor(self, name: str) -> Optional[datetime]:
+        result = await self.session.execute(select(SyncState.cursor).where(SyncState.name == name))
+        return result.scalar_one_or_none()
+    
+    @writes
+    async def save_cursor(self, name: str, cursor: datetime):
+        now = datetime.utcnow()
+        stmt = _dialect_insert(self.session, SyncState).values(name=name, cursor=cursor, updated_at=now)
+        await self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["name"],
+                set_={"cursor": stmt.excluded.cursor, "updated_at": stmt.excluded.updated_at}
+            )
+        )
+        await self._commit()
+
+
+class InboxRepository(BaseRepository):
+    @writes
+    async def add(
+        self,
+        booking_code: str,
+        message_type: str,
+        payload: str,
+        payload_hash: str
+    ) -> Optional[int]:
+        """Store an event; returns None if the same event is already stored"""
+        result = await self.session.execute(
+            _dialect_insert(self.session, WebhookInbox)
+            .values(
+                booking_code=booking_code,
+                message_type=message_type,
+                payload=payload,
+                payload_hash=payload_hash
+            )
+            .on_conflict_do_nothing(
+                index_elements=["booking_code", "message_type", "payload_hash"]
+            )
+            .returning(WebhookInbox.id)
+        )
+        await self._commit()
+        return result.scalar_one_or_none()
+    
+    @writes
+    async def claim_ready(self, now: datetime, limit: int, exclude_codes: set[str]) -> list[WebhookInbox]:
+        """
+        Atomically move ready events to PROCESSING and return them.
+        
+        An event is ready when its backoff has elapsed and no earlier event
+        for the same booking code is still pending or processing, so events
+        of one booking are always handled in arrival order.
+        """
+        earlier = aliased(WebhookInbox)
+        blocked = exists().where(
+            earlier.booking_code == WebhookInbox.booking_code,
+            earlier.id < WebhookInbox.id,
+            earlier.status.in_((InboxStatus.PENDING, InboxStatus.PROCESSING))
+        )
+        result = await self.session.execute(
+            select(WebhookInbox.id, WebhookInbox.booking_code)
+            .where(WebhookInbox.status == InboxStatus.PENDING)
+            .where(WebhookInbox.next_attempt_at <= now)
+            .where(~blocked)
+            .order_by(WebhookInbox.id)
+            .limit(limit)
+        )
+        ids = [event_id for event_id, code in result.all() if code not in exclude_codes]
+        if not ids:
+            return []
+        
+        result = await self.session.execute(
+            update(WebhookInbox)
+            .where(WebhookInbox.id.in_(ids))
+            .where(WebhookInbox.status == InboxStatus.PENDING)
+            .values(
+                status=InboxStatus.PROCESSING,
+                attempts=WebhookInbox.attempts + 1,
+                locked_at=now
+            )
+            .returning(WebhookInbox)
+        )
+        events = sorted(result.scalars().all(), key=lambda e: e.id)
+        await self._commit()
+        return events
+    
+    @writes
+    async def mark_done(self, event_id: int):
+        await self.session.execute(
+            update(WebhookInbox)
+            .where(WebhookInbox.id == event_id)
+            .values(status=InboxStatus.DONE, processed_at=datetime.utcnow(), locked_at=None, last_error=None)
+        )
+        await self._commit()
+    
+    @writes
+    async def mark_failed(self, event_id: int, error: str, next_attempt_at: Optional[datetime]):
+        """Schedule a retry, or move the event to DEAD when `next_attempt_at` is None"""
+        values = {"last_error": error, "locked_at": None}
+        if next_attempt_at is None:
+            values.update(status=InboxStatus.DEAD, processed_at=datetime.utcnow())
+        else:
+            values.update(status=InboxStatus.PENDING, next_attempt_at=next_attempt_at)
+        await self.session.execute(
+            update(WebhookInbox).where(WebhookInbox.id == event_id).values(**values)
+        )
+        await self._commit()
+    
+    @writes
+    async def renew_claims(self, event_ids: list[int], now: datetime):
+        """Move `locked_at` of events still being processed here to `now`"""
+        if not event_ids:
+            return
+        await self.session.execute(
+            update(WebhookInbox)
+            .where(WebhookInbox.id.in_(event_ids))
+            .where(WebhookInbox.status == InboxStatus.PROCESSING)
+            .values(locked_at=now)
+        )
+        await self._commit()
+    
+    @writes
+    async def release_stale(self, locked_before: datetime) -> int:
+        """Return events stuck in PROCESSING (their worker died) to the queue"""
+        result = await self.session.execute(
+            update(WebhookInbox)
+            .where(WebhookInbox.status == InboxStatus.PROCESSING)
+            .where(WebhookInbox.locked_at < locked_before)
+            .values(status=InboxStatus.PENDING, locked_at=None)
+        )
+        await self._commit()
+        return result.rowcount
+
+
+class FSMRepository(BaseRepository):
+    async def get(self, key: str, now: datetime) -> Optional[FSMRecord]:
+        result = await self.session.execute(
+            select(FSMRecord).where(FSMRecord.key == key, FSMRecord.expires_at > now)
+        )
+        return result.scalar_one_or_none()
+    
+    @writes
+    async def save_many(self, records: list[dict], delete_keys: list[str]):
+        """Upsert and delete several keys in one transaction"""
+        if records:
+            stmt = _dialect_insert(self.session, FSMRecord)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[FSMRecord.key],
+                set_={
+                    "state": stmt.excluded.state,
+                    "data": stmt.excluded.data,
+                    "updated_at": stmt.excluded.updated_at,
+                    "expires_at": stmt.excluded.expires_at,
+                }
+            )
+            await self.session.execute(stmt, records)
+        if delete_keys:
+            await self.session.execute(delete(FSMRecord).where(FSMRecord.key.in_(delete_keys)))
+        await self._commit()
+    
+    @writes
+    async def purge_expired(self, now: datetime) -> int:
+        result = await self.session.execute(delete(FSMRecord).where(FSMRecord.expires_at <= now))
+        await self._commit()
+        return result.rowcount
+
+
+class LeaseRepository(BaseRepository):
+    @writes
+    async def try_acquire(self, name: str, holder: str, expires_at: datetime, now: datetime) -> bool:
+        """Take or renew the lease if it is free, expired or already ours"""
+        result = await self.session.execute(
+            update(Lease)
+            .where(Lease.name == name)
+            .where((Lease.holder == holder) | (Lease.expires_at < now))
+            .values(holder=holder, expires_at=expires_at)
+        )
+        if result.rowcount:
+            await self._commit()
+            return True
+        
+        result = await self.session.execute(
+            _dialect_insert(self.session, Lease)
+            .values(name=name, holder=holder, expires_at=expires_at)
+            .on_conflict_do_nothing(index_elements=["name"])
+            .returning(Lease.name)
+        )
+        acquired = result.scalar_one_or_none() is not None
+        await self._commit()
+        return acquired
+    
+    @writes
+    async def release(self, name: str, holder: str):
+        await self.session.execute(
+            delete(Lease).where(Lease.name == name, Lease.holder == holder)
+        )
+        await self._commit()
+
+
+class ArchiveRepository(BaseRepository):
+    """
+    Moves old rows to the archive tables (see services/retention.py). Each
+    call handles at most `limit` rows, so one commit never holds locks on
+    many rows; candidates are locked with SKIP LOCKED on PostgreSQL, so a
+    row being written by the bot is left for the next batch.
+    """
+    async def _move(self, model, archive, ids: list[int], now: datetime) -> int:
+        columns = [column.name for column in model.__table__.columns]
+        await self.session.execute(
+            insert(archive.__table__).from_select(
+                columns + ["archived_at"],
+                select(*model.__table__.columns, literal(now, DateTime)).where(model.id.in_(ids))
+            )
+        )
+        result = await self.session.execute(delete(model.__table__).where(model.id.in_(ids)))
+        return result.rowcount
+    
+    @writes
+    async def complete_past(self, started_before: datetime, limit: int) -> int:
+        """Mark ACTIVE bookings that started before `started_before` COMPLETED"""
+        ids = (
+            select(Booking.id)
+            .where(Booking.status == BookingStatus.ACTIVE)
+            .where(Booking.booking_datetime < started_before)
+            .limit(limit)
+            .scalar_subquery()
+        )
+        result = await self.session.execute(
+            update(Booking).where(Booking.id.in_(ids)).values(status=BookingStatus.COMPLETED)
+        )
+        await self._commit()
+        return result.rowcount
+    
+    @writes
+    async def archive_bookings(self, started_before: datetime, limit: int) -> tuple[int, int]:
+        """
+        Move COMPLETED and CANCELLED bookings that started before
+        `started_before`, together with their messages. Returns the number
+        of bookings and of messages moved.
+        """
+        result = await self.session.execute(
+            select(Booking.id)
+            .where(Booking.status.in_((BookingStatus.COMPLETED, BookingStatus.CANCELLED)))
+            .where(Booking.booking_datetime < started_before)
+            .order_by(Booking.booking_datetime)
+            .limit(limit)
+            .with_for_update(of=Booking, skip_locked=True)
+        )
+        booking_ids = result.scalars().all()
+        if not booking_ids:
+            return 0, 0
+        
+        now = datetime.utcnow()
+        result = await self.session.execute(
+            select(Message.id).where(Message.booking_id.in_(booking_ids)).with_for_update(of=Message)
+        )
+        message_ids = result.scalars().all()
+        messages = await self._move(Message, ArchivedMessage, message_ids, now) if message_ids else 0
+        bookings = await self._move(Booking, ArchivedBooking, booking_ids, now)
+        await self._commit()
+        return bookings, messages
+    
+    @writes
+    async def archive_messages(self, sent_before: datetime, limit: int) -> int:
+        """
+        Move messages sent before `sent_before` (UTC). Messages of a
+        booking that starts after that moment stay (the sweeper checks them
+        before sending), as do the delivery records of unfinished broadcasts.
+        """
+        upcoming_booking = exists().where(
+            Booking.id == Message.booking_id,
+            Booking.booking_datetime >= utc_to_local(sent_before)
+        )
+        open_broadcast = exists().where(
+            Broadcast.id == Message.broadcast_id,
+            Broadcast.status.in_((BroadcastStatus.PENDING, BroadcastStatus.RUNNING))
+        )
+        result = await self.session.execute(
+            select(Message.id)
+            .where(Message.sent_at < sent_before)
+            .where(~upcoming_booking)
+            .where(~open_broadcast)
+            .order_by(Message.sent_at)
+            .limit(limit)
+            .with_for_update(of=Message, skip_locked=True)
+        )
+        message_ids = result.scalars().all()
+        if not message_ids:
+            return 0
+        moved = await self._move(Message, ArchivedMessage, message_ids, datetime.utcnow())
+        await self._commit()
+        return moved
@@ -0,0 +1,223 @@
+"""
+Single writer for SQLite deployments.
+
+SQLite lets one connection write at a time. With several pooled
+connections, a webhook storing a booking and a handler storing a message
+race for the file lock, and the loser waits out `busy_timeout` or fails
+with "database is locked". With the `sqlite_single_writer` profile option
+(see database/profiles.py) every write goes through `sqlite_writer`
+instead:
+
+- a standalone repository write (`autocommit=True`, see `writes` in
+  database/repository.py) is queued as a job. One writer task takes all
+  jobs queued at that moment and runs them in a single transaction with
+  a single commit, then wakes their callers;
+- a unit of work holds the write slot from start to end, so the writer
+  and other units wait for it instead of for the file lock;
+- reads don't touch the writer and keep running on their own pooled
+  connections (WAL lets them read while the writer writes).
+
+If a job in a batch fails, the batch is rolled back and its jobs are run
+again one by one, so only the failing caller gets the error.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+WriteJob = Callable[[AsyncSession], Awaitable[Any]]
+
+
+@dataclass
+class _QueuedWrite:
+    job: WriteJob
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class SQLiteWriter:
+    """Serializes writes of this process and batches standalone ones"""
+
+    def __init__(self, session_factory: async_sessionmaker, enabled: bool = False, max_batch: int = 100):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._slot: Optional[asyncio.Lock] = None
+        self._slot_owner: Optional[asyncio.Task] = None
+        self._slot_depth = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.batches = 0
+        self.writes = 0
+        self.largest_batch = 0
+        self.isolated = 0
+        self.failed = 0
+        self.max_queue_wait = 0.0
+        self.max_slot_hold = 0.0
+        self._slot_acquired_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _bind_loop(self):
+        # Queue and lock belong to one event loop; CLI tools and benchmarks
+        # may run several loops one after another in the same process
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slot = asyncio.Lock()
+            self._slot_owner = None
+            self._slot_depth = 0
+            self._task = None
+
+    def start(self):
+        """Start the writer task on the running event loop"""
+        self._bind_loop()
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run(), name="sqlite-writer")
+        logger.info("SQLite writer started")
+
+    async def stop(self, timeout: float = 10.0):
+        """Finish queued writes (up to `timeout` seconds) and stop"""
+        if not self.running:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.qsize() or self._slot.locked():
+            if time.monotonic() >= deadline:
+                logger.warning(f"SQLite writer stopped with {self._queue.qsize()} writes queued")
+                break
+            await asyncio.sleep(0.05)
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        while not self._queue.empty():
+            queued = self._queue.get_nowait()
+            if not queued.future.done():
+                queued.future.set_exception(RuntimeError("SQLite writer stopped"))
+        logger.info("SQLite writer stopped")
+
+    async def acquire(self):
+        """
+        Take the write slot. Re-entrant within one task, so code inside a
+        unit of work can open another unit without deadlocking itself.
+        """
+        self._bind_loop()
+        task = asyncio.current_task()
+        if self._slot_owner is task:
+            self._slot_depth += 1
+            return
+        await self._slot.acquire()
+        self._slot_owner = task
+        self._slot_depth = 1
+        self._slot_acquired_at = time.monotonic()
+
+    def release(self):
+        self._slot_depth -= 1
+        if self._slot_depth == 0:
+            self.max_slot_hold = max(self.max_slot_hold, time.monotonic() - self._slot_acquired_at)
+            self._slot_owner = None
+            self._slot.release()
+
+    async def run(self, job: WriteJob) -> Any:
+        """
+        Run `job(session)` in the writer's next transaction and return its
+        result once that transaction is committed. The job must not commit.
+        """
+        self._bind_loop()
+        if self._slot_owner is asyncio.current_task():
+            # Called inside a unit of work: queuing would wait for ourselves.
+            # Like any second connection, this fails with "database is
+            # locked" once the unit has written; use the unit's repositories
+            return await self._run_batch([_QueuedWrite(job, self._loop.create_future())], direct=True)
+        if not self.running:
+            self.start()
+        queued = _QueuedWrite(job, self._loop.create_future())
+        self._queue.put_nowait(queued)
+        return await queued.future
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queue_depth": self.queue_depth(),
+            "batches": self.batches,
+            "writes": self.writes,
+            "avg_batch": round(self.writes / self.batches, 2) if self.batches else 0,
+            "largest_batch": self.largest_batch,
+            "isolated_batches": self.isolated,
+            "failed_writes": self.failed,
+            "max_queue_wait_ms": round(self.max_queue_wait * 1000, 2),
+            "max_slot_hold_ms": round(self.max_slot_hold * 1000, 2),
+        }
+
+    def reset(self):
+        self.batches = self.writes = self.largest_batch = self.isolated = self.failed = 0
+        self.max_queue_wait = self.max_slot_hold = 0.0
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            batch = [queued for queued in batch if not queued.future.done()]
+            if not batch:
+                continue
+
+            await self.acquire()
+            try:
+                now = time.monotonic()
+                self.max_queue_wait = max(self.max_queue_wait, max(now - q.enqueued_at for q in batch))
+                await self._run_batch(batch)
+            except Exception:
+                logger.exception("SQLite writer batch failed")
+            finally:
+                self.release()
+
+    async def _run_batch(self, batch: list[_QueuedWrite], direct: bool = False) -> Any:
+        """One transaction for the whole batch; with `direct` the single job's result is returned"""
+        try:
+            async with self.session_factory() as session:
+                results = [await queued.job(session) for queued in batch]
+                await session.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                self.failed += 1
+                if direct:
+                    raise
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(e)
+                return None
+            # Nothing of the batch is committed: retry alone, so only the failing job errors
+            self.isolated += 1
+            logger.warning(f"SQLite writer batch of {len(batch)} failed ({e!r}), retrying writes one by one")
+            for queued in batch:
+                await self._run_batch([queued])
+            return None
+
+        self.batches += 1
+        self.writes += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        if direct:
+            return results[0]
+        for queued, result in zip(batch, results):
+            if not queued.future.done():
+                queued.future.set_result(result)
+        return None
@@ -0,0 +1,56 @@
+"""
+Unit of work: several repository writes in one transaction.
+
+    async with UnitOfWork() as uow:
+        booking = await uow.bookings.create(...)
+        await uow.messages.create(user.id, MessageType.BOOKING_CREATED, booking.id)
+        await uow.commit()
+
+Repositories here are created with `autocommit=False`: writes are flushed
+(so primary keys are filled in) but only `commit()` makes them durable.
+Leaving the block without committing rolls everything back.
+
+With the SQLite single writer (database/sqlite_writer.py) a unit holds
+the write slot for the whole block, so keep network calls out of it.
+"""
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import async_session_maker, sqlite_writer
+from database.repository import UserRepository, BookingRepository, MessageRepository, SyncStateRepository
+
+
+class UnitOfWork:
+    def __init__(self, session_factory: async_sessionmaker = async_session_maker):
+        self._session_factory = session_factory
+        self.session: Optional[AsyncSession] = None
+
+    async def __aenter__(self) -> "UnitOfWork":
+        self._holds_slot = sqlite_writer.enabled
+        if self._holds_slot:
+            await sqlite_writer.acquire()
+        self.session = self._session_factory()
+        self.users = UserRepository(self.session, autocommit=False)
+        self.bookings = BookingRepository(self.session, autocommit=False)
+        self.messages = MessageRepository(self.session, autocommit=False)
+        self.sync_state = SyncStateRepository(self.session, autocommit=False)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if self.session.in_transaction():
+                await self.session.rollback()
+        finally:
+            await self.session.close()
+            self.session = None
+            if self._holds_slot:
+                sqlite_writer.release()
+
+    async def commit(self):
+        await self.session.commit()
+        self.users.after_commit()
+
+    async def rollback(self):
+        await self.session.rollback()
+        self.users.after_rollback()
@@ -0,0 +1,73 @@
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from config import settings
+from database import async_session_maker
+from database.repository import BroadcastRepository
+from services.broadcast import create_broadcast, cancel_broadcast, describe
+from services.rollups import parse_range, load_rollups, format_rollups
+from services.scheduler import trigger_broadcasts
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+# Everything here is for the users listed in ADMIN_USER_IDS only
+router.message.filter(F.from_user.id.in_(settings.admin_user_ids))
+
+
+@router.message(Command("broadcast"))
+async def cmd_broadcast(message: Message, command: CommandObject):
+    """Queue an announcement to all users: /broadcast <текст>"""
+    if not command.args:
+        async with async_session_maker() as session:
+            recent = await BroadcastRepository(session).get_recent()
+        history = "\n".join(describe(broadcast) for broadcast in recent) or "Рассылок ещё не было"
+        await message.answer(
+            "📣 Рассылка всем пользователям:\n"
+            "/broadcast <текст объявления>\n\n"
+            "Отменить: /broadcast_cancel <номер>\n\n"
+            f"Последние рассылки:\n{history}"
+        )
+        return
+
+    broadcast, recipients = await create_broadcast(command.args, created_by=message.from_user.id)
+    logger.info(f"Broadcast {broadcast.id} created by {message.from_user.id}")
+    trigger_broadcasts()
+    await message.answer(
+        f"📣 Рассылка #{broadcast.id} поставлена в очередь\n"
+        f"Получателей: {recipients}\n\n"
+        f"Статус: /broadcast, отмена: /broadcast_cancel {broadcast.id}"
+    )
+
+
+@router.message(Command("broadcast_cancel"))
+async def cmd_broadcast_cancel(message: Message, command: CommandObject):
+    """Stop a queued or running broadcast"""
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer("Укажите номер рассылки: /broadcast_cancel <номер>")
+        return
+
+    broadcast_id = int(command.args.strip())
+    if await cancel_broadcast(broadcast_id):
+        await message.answer(f"⏹ Рассылка #{broadcast_id} отменена")
+    else:
+        await message.answer(f"Рассылка #{broadcast_id} не найдена или уже завершена")
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, command: CommandObject):
+    """Booking figures per service: /stats [ДД.ММ.ГГГГ [ДД.ММ.ГГГГ]]"""
+    try:
+        since, until = parse_range(command.args)
+    except ValueError:
+        await message.answer(
+            "📊 Итоги по записям:\n"
+            "/stats - за сегодня\n"
+            "/stats 01.10.2026 - за день\n"
+            "/stats 01.10.2026 18.10.2026 - за период (не длиннее года)"
+        )
+        return
+
+    rollups = await load_rollups(since, until)
+    await message.answer(format_rollups(rollups, since, until))
@@ -1,13 +1,21 @@
 from aiogram import Router, F
 from aiogram.filters import Command, StateFilter
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ChatMemberUpdated
+from aiogram.enums import ChatMemberStatus
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramBadRequest
 from database import async_session_maker
 from database.repository import UserRepository, BookingRepository
 from database.models import BookingStatus
+from database.unit_of_work import UnitOfWork
 from services.bukza_client import bukza_client
-from services.scheduler import cancel_scheduled_tasks
+from services.phones import normalize_phone
+from services.scheduler import trigger_sweep
+from handlers import static_replies
+from services.telegram_sender import telegram_sender, Priority
+from datetime import datetime
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,34 +40,14 @@ class LinkBookingStates(StatesGroup):
 
 
 def get_main_menu_keyboard():
-    """Get main menu keyboard with beautiful layout"""
-    # Web App button for booking - direct to Bukza catalog
-    booking_url = "https://app.bukza.com/#/24320/24018/catalog/27083"
-    
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🎯 Записаться", web_app=WebAppInfo(url=booking_url)), KeyboardButton(text="📅 Мои записи")],
-            [KeyboardButton(text="📍 Адрес"), KeyboardButton(text="📞 Контакты")],
-            [KeyboardButton(text="🌐 Наш сайт"), KeyboardButton(text="💬 Написать нам")],
-            [KeyboardButton(text="ℹ️ Помощь")]
-        ],
-        resize_keyboard=True,
-        input_field_placeholder="Выберите действие..."
-    )
-    return keyboard
+    """Get main menu keyboard (built once, see handlers/static_replies.py)"""
+    return static_replies.MAIN_MENU_KEYBOARD
 
 
 @router.message(F.text == "🌐 Наш сайт")
 async def button_website(message: Message):
     """Handle 'Наш сайт' button"""
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🌐 Открыть сайт", url="https://pervoe-mesto102.ru")]
-    ])
-    await message.answer(
-        "🌐 Наш сайт:\n\n"
-        "Узнайте больше о нас, наших услугах и акциях!",
-        reply_markup=keyboard
-    )
+    return static_replies.WEBSITE.answer(message)
 
 
 @router.message(Command("start"))
@@ -108,31 +96,58 @@ async def cmd_start(message: Message, state: FSMContext):
 @router.message(RegistrationStates.waiting_for_phone, F.contact)
 async def process_phone_number(message: Message, state: FSMContext):
     """Process phone number from user"""
-    phone_number = message.contact.phone_number
+    # Only the user's own contact: a forwarded one would hand them
+    # someone else's bookings, reminders and feedback requests
+    if message.contact.user_id != message.from_user.id:
+        keyboard = ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text="📱 Отправить номер телефона", request_contact=True)]],
+            resize_keyboard=True
+        )
+        await message.answer(
+            "⚠️ Это не ваш контакт.\n\n"
+            "Пожалуйста, нажмите кнопку ниже, чтобы отправить свой номер телефона.",
+            reply_markup=keyboard
+        )
+        return
     
-    # Normalize phone number
-    if not phone_number.startswith('+'):
-        phone_number = f"+{phone_number}"
+    # Same canonical form as the client phones of Bukza bookings
+    phone_number = normalize_phone(message.contact.phone_number)
     
-    async with async_session_maker() as session:
-        user_repo = UserRepository(session)
-        user = await user_repo.get_by_telegram_id(message.from_user.id)
+    async with UnitOfWork() as uow:
+        user = await uow.users.get_by_telegram_id(message.from_user.id)
         
         if user:
             # Update existing user
-            user = await user_repo.update_phone(user.id, phone_number)
+            user = await uow.users.update_phone(user.id, phone_number)
         else:
             # Create new user
-            user = await user_repo.create(message.from_user.id, phone_number)
+            user = await uow.users.create(message.from_user.id, phone_number)
         
-        await message.answer(
-            "✅ Регистрация завершена!\n\n"
-            "Теперь вы будете получать уведомления о ваших записях:\n"
-            "• Подтверждение при создании записи\n"
-            "• Напоминание за 24 часа до визита\n"
-            "• Запрос обратной связи после посещения",
-            reply_markup=get_main_menu_keyboard()
-        )
+        # Bookings made in Bukza before the client registered
+        linked = await uow.bookings.link_orphans_by_phone(user.id, phone_number)
+        await uow.commit()
+    
+    now = datetime.now()
+    upcoming = [
+        booking_id for booking_id, booking_datetime, status in linked
+        if status == BookingStatus.ACTIVE and booking_datetime > now
+    ]
+    if linked:
+        logger.info(f"Linked {len(linked)} earlier bookings to user {user.id}, {len(upcoming)} upcoming")
+    if upcoming:
+        # Their reminders are sent by the sweep
+        trigger_sweep()
+    
+    found = f"\n\n📅 Мы нашли ваши записи ({len(upcoming)}) — они уже в разделе «Мои записи»" if upcoming else ""
+    await message.answer(
+        "✅ Регистрация завершена!\n\n"
+        "Теперь вы будете получать уведомления о ваших записях:\n"
+        "• Подтверждение при создании записи\n"
+        "• Напоминание за 24 часа до визита\n"
+        "• Запрос обратной связи после посещения"
+        f"{found}",
+        reply_markup=get_main_menu_keyboard()
+    )
     
     await state.clear()
 
@@ -159,19 +174,19 @@ async def button_contact(message: Message, state: FSMContext):
 @router.message(F.text == "ℹ️ Помощь")
 async def button_help(message: Message):
     """Handle 'Помощь' button"""
-    await cmd_help(message)
+    return await cmd_help(message)
 
 
 @router.message(F.text == "📍 Адрес")
 async def button_address(message: Message):
     """Handle 'Адрес' button"""
-    await cmd_address(message)
+    return await cmd_address(message)
 
 
 @router.message(F.text == "📞 Контакты")
 async def button_contacts(message: Message):
     """Handle 'Контакты' button"""
-    await cmd_contacts(message)
+    return await cmd_contacts(message)
 
 
 @router.message(F.text == "🔗 Привязать запись")
@@ -303,9 +318,94 @@ async def process_rating(message: Message, state: FSMContext):
         await message.answer("Пожалуйста, отправьте число от 1 до 5.")
 
 
+BOOKINGS_PAGE_SIZE = 5
+# Tab order; the first non-empty one is opened by /bookings
+BOOKING_TABS = [
+    (BookingStatus.ACTIVE, "🟢", "Активные"),
+    (BookingStatus.COMPLETED, "✅", "Завершённые"),
+    (BookingStatus.CANCELLED, "❌", "Отменённые"),
+]
+CURSOR_FORMAT = "%Y%m%d%H%M%S"
+
+
+async def render_bookings(
+    session,
+    user_id: int,
+    status: Optional[BookingStatus] = None,
+    cursor: Optional[tuple[datetime, int]] = None,
+    backward: bool = False
+) -> Optional[tuple[str, InlineKeyboardMarkup]]:
+    """
+    Build the /bookings message: per-status counts, one page of bookings
+    with `status` and the tab / cancel / paging keyboard.
+    
+    Returns None if the user has no bookings at all.
+    """
+    booking_repo = BookingRepository(session)
+    counts = await booking_repo.count_by_status(user_id)
+    if not any(counts.values()):
+        return None
+    if status is None:
+        status = next(s for s, _, _ in BOOKING_TABS if counts.get(s))
+    
+    # Upcoming visits soonest first, history newest first
+    descending = status != BookingStatus.ACTIVE
+    # One extra row tells whether there is a page beyond this one
+    page = await booking_repo.get_page_by_user(
+        user_id, status, BOOKINGS_PAGE_SIZE + 1,
+        cursor=cursor, backward=backward, descending=descending
+    )
+    has_more = len(page) > BOOKINGS_PAGE_SIZE
+    if has_more:
+        page = page[1:] if backward else page[:-1]
+    has_next = has_more if not backward else cursor is not None
+    has_prev = has_more if backward else cursor is not None
+    
+    emoji, title = next((e, t) for s, e, t in BOOKING_TABS if s == status)
+    text = "📅 Ваши записи:\n"
+    text += " · ".join(f"{e} {counts.get(s, 0)}" for s, e, _ in BOOKING_TABS) + "\n\n"
+    text += f"{emoji} {title}:\n"
+    if not page:
+        text += "Нет записей\n"
+    for b in page:
+        rating_text = f" (⭐ {b.rating})" if b.rating else ""
+        text += f"• {b.service_name}{rating_text}\n  {b.booking_datetime.strftime('%d.%m.%Y %H:%M')}\n\n"
+    
+    rows = [[
+        InlineKeyboardButton(
+            text=f"{'• ' if s == status else ''}{e} {t} ({counts.get(s, 0)})",
+            callback_data=f"bookings:{s.value}"
+        )
+        for s, e, t in BOOKING_TABS if counts.get(s) or s == status
+    ]]
+    if status == BookingStatus.ACTIVE:
+        for b in page:
+            rows.append([InlineKeyboardButton(
+                text=f"❌ Отменить {b.booking_datetime.strftime('%d.%m %H:%M')}",
+                callback_data=f"cancel_booking:{b.bukza_booking_id}:list"
+            )])
+    nav = []
+    if has_prev:
+        first = page[0]
+        nav.append(InlineKeyboardButton(
+            text="⬅️",
+            callback_data=f"bookings:{status.value}:p:{first.booking_datetime.strftime(CURSOR_FORMAT)}:{first.id}"
+        ))
+    if has_next:
+        last = page[-1]
+        nav.append(InlineKeyboardButton(
+            text="➡️",
+            callback_data=f"bookings:{status.value}:n:{last.booking_datetime.strftime(CURSOR_FORMAT)}:{last.id}"
+        ))
+    if nav:
+        rows.append(nav)
+    
+    return text, InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 @router.message(Command("bookings"))
 async def cmd_bookings(message: Message):
-    """Show user's booking history"""
+    """Show user's bookings as one paginated message"""
     async with async_session_maker() as session:
         user_repo = UserRepository(session)
         user = await user_repo.get_by_telegram_id(message.from_user.id)
@@ -317,55 +417,54 @@ async def cmd_bookings(message: Message):
             )
             return
         
-        booking_repo = BookingRepository(session)
-        bookings = await booking_repo.get_all_by_user(user.id)
-        
-        if not bookings:
-            await message.answer(
-                "У вас пока нет записей.",
-                reply_markup=get_main_menu_keyboard()
-            )
+        view = await render_bookings(session, user.id)
+    
+    if view is None:
+        await message.answer(
+            "У вас пока нет записей.",
+            reply_markup=get_main_menu_keyboard()
+        )
+        return
+    
+    text, keyboard = view
+    await message.answer(text, reply_markup=keyboard)
+
+
+@router.callback_query(F.data.startswith("bookings:"))
+async def callback_bookings_page(callback: CallbackQuery):
+    """Switch tab or page of the /bookings message in place"""
+    parts = callback.data.split(":")
+    try:
+        status = BookingStatus(parts[1])
+        cursor, backward = None, False
+        if len(parts) == 5:
+            backward = parts[2] == "p"
+            cursor = (datetime.strptime(parts[3], CURSOR_FORMAT), int(parts[4]))
+    except ValueError:
+        await callback.answer()
+        return
+    
+    async with async_session_maker() as session:
+        user = await UserRepository(session).get_by_telegram_id(callback.from_user.id)
+        if not user:
+            await callback.answer("❌ Пользователь не найден", show_alert=True)
             return
-        
-        # Group bookings by status
-        active = [b for b in bookings if b.status == BookingStatus.ACTIVE]
-        completed = [b for b in bookings if b.status == BookingStatus.COMPLETED]
-        cancelled = [b for b in bookings if b.status == BookingStatus.CANCELLED]
-        
-        response = "📅 Ваши записи:\n\n"
-        
-        if active:
-            response += "🟢 Активные:\n"
-            for b in active:
-                response += f"• {b.service_name}\n  {b.booking_datetime.strftime('%d.%m.%Y %H:%M')}\n\n"
-            
-            # Send active bookings with cancel buttons
-            await message.answer(response, reply_markup=get_main_menu_keyboard())
-            
-            # Send each active booking with cancel button
-            for b in active:
-                cancel_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="❌ Отменить", callback_data=f"cancel_booking:{b.bukza_booking_id}")]
-                ])
-                await message.answer(
-                    f"🎯 {b.service_name}\n"
-                    f"📅 {b.booking_datetime.strftime('%d.%m.%Y')} в {b.booking_datetime.strftime('%H:%M')}",
-                    reply_markup=cancel_keyboard
-                )
-        else:
-            # No active bookings, show history
-            if completed:
-                response += "✅ Завершённые:\n"
-                for b in completed[:5]:  # Last 5
-                    rating_text = f" (⭐ {b.rating})" if b.rating else ""
-                    response += f"• {b.service_name}{rating_text}\n  {b.booking_datetime.strftime('%d.%m.%Y %H:%M')}\n\n"
-            
-            if cancelled:
-                response += "❌ Отменённые:\n"
-                for b in cancelled[:3]:  # Last 3
-                    response += f"• {b.service_name}\n  {b.booking_datetime.strftime('%d.%m.%Y %H:%M')}\n\n"
-            
-            await message.answer(response, reply_markup=get_main_menu_keyboard())
+        view = await render_bookings(session, user.id, status, cursor, backward)
+    
+    if view is None:
+        await callback.message.edit_text("У вас пока нет записей.", reply_markup=None)
+    else:
+        await _edit_bookings_message(callback.message, *view)
+    await callback.answer()
+
+
+async def _edit_bookings_message(message: Message, text: str, keyboard: InlineKeyboardMarkup):
+    try:
+        await message.edit_text(text, reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        # Double taps re-render the same page
+        if "message is not modified" not in str(e):
+            raise
 
 
 @router.message(Command("contact"))
@@ -406,7 +505,9 @@ async def process_contact_message(message: Message, state: FSMContext):
         try:
             # Send to support channel if configured
             if settings.support_channel_id:
-                await message.bot.send_message(int(settings.support_channel_id), support_text)
+                await telegram_sender.send_message(
+                    message.bot, int(settings.support_channel_id), support_text, priority=Priority.SERVICE
+                )
             
             await message.answer(
                 "✅ Ваше сообщение отправлено!\n\n"
@@ -427,81 +528,34 @@ async def process_contact_message(message: Message, state: FSMContext):
 @router.message(Command("help"))
 async def cmd_help(message: Message):
     """Show help information"""
-    await message.answer(
-        "ℹ️ Помощь\n\n"
-        "Используйте кнопки меню:\n\n"
-        "🎯 Записаться - онлайн-запись на услуги\n"
-        "📅 Мои записи - история бронирований\n"
-        "📍 Адрес - как нас найти\n"
-        "📞 Контакты - связаться с нами\n"
-        "💬 Написать нам - сообщение в поддержку\n"
-        "ℹ️ Помощь - эта справка\n\n"
-        "Автоматические уведомления:\n"
-        "• При создании записи\n"
-        "• Напоминание за 24 часа\n"
-        "• Запрос отзыва после посещения",
-        reply_markup=get_main_menu_keyboard()
-    )
+    return static_replies.HELP.answer(message)
 
 
 @router.message(Command("address"))
 async def cmd_address(message: Message):
     """Show company address"""
-    from config import settings
-    
-    address_text = settings.company_address.replace('\\n', '\n')
-    
-    await message.answer(
-        f"📍 Наш адрес:\n\n"
-        f"{address_text}\n"
-        f"2 этаж\n\n"
-        f"🕐 Режим работы:\n"
-        f"{settings.company_hours}\n\n"
-        f"🗺 Мы на картах:\n"
-        f"• 2ГИС: {settings.link_2gis}\n"
-        f"• Яндекс.Карты: {settings.link_yandex_maps}\n\n"
-        f"🚇 Как добраться:\n"
-        f"Остановка «ТЦ Мега» или «ТКЦ ULTRA»",
-        reply_markup=get_main_menu_keyboard()
-    )
+    return static_replies.ADDRESS.answer(message)
 
 
 @router.message(Command("contacts"))
 async def cmd_contacts(message: Message):
     """Show contact information"""
-    from config import settings
-    
-    await message.answer(
-        f"📞 Контакты:\n\n"
-        f"☎️ Телефон: {settings.company_phone}\n"
-        f"🌐 Сайт: {settings.company_website}\n"
-        f"📱 Instagram: https://www.instagram.com/firstvr.ufa\n"
-        f"📱 ВКонтакте: https://vk.ru/id734925222\n\n"
-        f"💬 Или напишите нам прямо здесь через кнопку\n"
-        f"«Написать нам» - мы ответим в течение часа!\n\n"
-        f"Ждём вас в «Первое место»! 🎯",
-        reply_markup=get_main_menu_keyboard()
-    )
+    return static_replies.CONTACTS.answer(message)
 
 
 @router.message(Command("book"))
 async def cmd_book(message: Message):
     """Show booking link"""
-    from config import settings
-    
-    booking_url = settings.bukza_booking_url or settings.bukza_api_url.replace('/api', '')
-    
-    await message.answer(
-        "🎯 Онлайн-запись в «Первое место»\n\n"
-        "Выберите удобное время и активность:\n"
-        "• VR-игры\n"
-        "• Аренда зала\n"
-        "• Корпоративы\n"
-        "• Детские праздники\n\n"
-        f"👉 Записаться: {booking_url}\n\n"
-        "После записи вы получите уведомление в этом боте!",
-        reply_markup=get_main_menu_keyboard()
-    )
+    return static_replies.BOOK.answer(message)
+
+
+@router.my_chat_member(F.chat.type == "private")
+async def on_bot_blocked_or_unblocked(event: ChatMemberUpdated):
+    """Keep users.is_blocked in sync so broadcasts skip users who blocked the bot"""
+    blocked = event.new_chat_member.status == ChatMemberStatus.KICKED
+    async with async_session_maker() as session:
+        await UserRepository(session).set_blocked([event.from_user.id], blocked)
+    logger.info(f"User {event.from_user.id} {'blocked' if blocked else 'unblocked'} the bot")
 
 
 # Callback handlers for inline buttons
@@ -509,6 +563,8 @@ async def cmd_book(message: Message):
 async def callback_cancel_booking(callback: CallbackQuery):
     """Handle booking cancellation request"""
     booking_code = callback.data.split(":")[1]
+    # Buttons of the /bookings list carry a ":list" suffix through the flow
+    suffix = ":list" if callback.data.endswith(":list") else ""
     
     async with async_session_maker() as session:
         booking_repo = BookingRepository(session)
@@ -539,8 +595,8 @@ async def callback_cancel_booking(callback: CallbackQuery):
         # Show confirmation
         confirm_keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
-                InlineKeyboardButton(text="✅ Да, отменить", callback_data=f"confirm_cancel:{booking_code}"),
-                InlineKeyboardButton(text="❌ Нет", callback_data=f"keep_booking:{booking_code}")
+                InlineKeyboardButton(text="✅ Да, отменить", callback_data=f"confirm_cancel:{booking_code}{suffix}"),
+                InlineKeyboardButton(text="❌ Нет", callback_data=f"keep_booking:{booking_code}{suffix}")
             ]
         ])
         
@@ -577,37 +633,40 @@ async def callback_confirm_cancel(callback: CallbackQuery):
             # Update local status
             await booking_repo.update_status(booking.id, BookingStatus.CANCELLED)
             
-            # Cancel scheduled reminders
-            await cancel_scheduled_tasks(booking.id)
-            
             # Send notification to admin channel
             if settings.support_channel_id:
                 try:
                     username = callback.from_user.username or "нет username"
-                    await callback.bot.send_message(
+                    await telegram_sender.send_message(
+                        callback.bot,
                         int(settings.support_channel_id),
                         f"❌ ОТМЕНА ЗАПИСИ (через бота)\n\n"
-                        f"👤 Клиент: {booking.client_name}\n"
+                        f"👤 Клиент: {booking.client_name or 'Гость'}\n"
                         f"📱 Телефон: {booking.client_phone or 'не указан'}\n"
                         f"🔗 Telegram: @{username}\n"
                         f"🎯 Услуга: {booking.service_name}\n"
                         f"📅 Дата: {booking.booking_datetime.strftime('%d.%m.%Y')}\n"
                         f"🕐 Время: {booking.booking_datetime.strftime('%H:%M')}\n"
                         f"🔖 Код: {booking_code}\n\n"
-                        f"⚠️ Отмените запись в Bukza!"
+                        f"⚠️ Отмените запись в Bukza!",
+                        priority=Priority.SERVICE
                     )
                 except Exception as e:
                     logger.error(f"Failed to send cancellation to channel: {e}")
             
             # Update message
-            await callback.message.edit_text(
-                f"❌ Запись отменена\n\n"
-                f"🎯 Услуга: {booking.service_name}\n"
-                f"📅 Дата: {booking.booking_datetime.strftime('%d.%m.%Y')}\n"
-                f"🕐 Время: {booking.booking_datetime.strftime('%H:%M')}\n\n"
-                f"Будем рады видеть вас снова! 🎮",
-                reply_markup=None
-            )
+            if callback.data.endswith(":list"):
+                view = await render_bookings(session, user.id, BookingStatus.ACTIVE)
+                await _edit_bookings_message(callback.message, *view)
+            else:
+                await callback.message.edit_text(
+                    f"❌ Запись отменена\n\n"
+                    f"🎯 Услуга: {booking.service_name}\n"
+                    f"📅 Дата: {booking.booking_datetime.strftime('%d.%m.%Y')}\n"
+                    f"🕐 Время: {booking.booking_datetime.strftime('%H:%M')}\n\n"
+                    f"Будем рады видеть вас снова! 🎮",
+                    reply_markup=None
+                )
             await callback.answer("✅ Запись отменена")
         else:
             await callback.answer(f"❌ {message}", show_alert=True)
@@ -619,6 +678,15 @@ async def callback_keep_booking(callback: CallbackQuery):
     booking_code = callback.data.split(":")[1]
     
     async with async_session_maker() as session:
+        if callback.data.endswith(":list"):
+            # Back to the /bookings list
+            user = await UserRepository(session).get_by_telegram_id(callback.from_user.id)
+            view = await render_bookings(session, user.id, BookingStatus.ACTIVE) if user else None
+            if view is not None:
+                await _edit_bookings_message(callback.message, *view)
+            await callback.answer("👍 Запись сохранена")
+            return
+        
         booking_repo = BookingRepository(session)
         booking = await booking_repo.get_by_bukza_id(booking_code)
         
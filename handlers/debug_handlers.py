@@ -0,0 +1,70 @@
+import hmac
+import json
+from functools import partial, wraps
+from aiohttp import web
+from config import settings
+from database import sql_instrumentation, pool_monitor, engine_profile, sqlite_writer
+from services.metrics import registry
+
+
+def debug_only(handler):
+    """
+    The /debug endpoints show SQL text and internals: they answer only
+    requests with `Authorization: Bearer <DEBUG_TOKEN>` and do not exist
+    while DEBUG_TOKEN is unset.
+    """
+    @wraps(handler)
+    async def wrapper(request: web.Request) -> web.Response:
+        if not settings.debug_token:
+            raise web.HTTPNotFound()
+        expected = f"Bearer {settings.debug_token}".encode()
+        if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected):
+            raise web.HTTPUnauthorized()
+        return await handler(request)
+    return wrapper
+
+
+@debug_only
+async def handle_sql_stats(request: web.Request) -> web.Response:
+    """
+    SQL statement timings collected by database/instrumentation.py.
+
+    Query parameters: `limit` (default 50) and `order` (total_ms, count,
+    max_ms or slow).
+    """
+    try:
+        limit = int(request.query.get("limit", 50))
+    except ValueError:
+        limit = 50
+    snapshot = sql_instrumentation.snapshot(limit=limit, order_by=request.query.get("order", "total_ms"))
+    return web.json_response(snapshot, dumps=partial(json.dumps, ensure_ascii=False))
+
+
+@debug_only
+async def handle_sql_reset(request: web.Request) -> web.Response:
+    """POST: start a new SQL timing window"""
+    sql_instrumentation.reset()
+    return web.json_response({"reset": True})
+
+
+@debug_only
+async def handle_pool_stats(request: web.Request) -> web.Response:
+    """
+    Connection pool usage, SQLite writer batching and the engine profile in
+    effect (see database/profiles.py).
+    """
+    snapshot = {**pool_monitor.snapshot(), "sqlite_writer": sqlite_writer.stats(), "profile": engine_profile}
+    return web.json_response(snapshot)
+
+
+@debug_only
+async def handle_pool_reset(request: web.Request) -> web.Response:
+    """POST: start a new pool and SQLite writer measurement window"""
+    pool_monitor.reset()
+    sqlite_writer.reset()
+    return web.json_response({"reset": True})
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Prometheus scrape endpoint (see services/metrics.py)"""
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
@@ -0,0 +1,177 @@
+"""
+Replies that never change: /help, /address, /contacts, /book and the
+"🌐 Наш сайт" button.
+
+Their texts and keyboards are rendered once at import, together with the
+JSON body of the `sendMessage` call up to the chat id. Handlers return
+`reply.answer(message)` instead of calling `message.answer(...)`:
+
+- on the webhook path `handle_telegram_webhook` writes the pre-rendered
+  body into the webhook response, and Telegram executes it without an
+  extra HTTPS request from the bot;
+- in polling mode aiogram sends the returned method through the bot as
+  usual.
+"""
+import json
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    KeyboardButton,
+    Message,
+    ReplyKeyboardMarkup,
+    Update,
+    WebAppInfo,
+)
+from aiohttp import web
+from pydantic import PrivateAttr
+
+from config import settings
+
+# Web App button for booking - direct to Bukza catalog
+BOOKING_WEB_APP_URL = "https://app.bukza.com/#/24320/24018/catalog/27083"
+
+MAIN_MENU_KEYBOARD = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="🎯 Записаться", web_app=WebAppInfo(url=BOOKING_WEB_APP_URL)), KeyboardButton(text="📅 Мои записи")],
+        [KeyboardButton(text="📍 Адрес"), KeyboardButton(text="📞 Контакты")],
+        [KeyboardButton(text="🌐 Наш сайт"), KeyboardButton(text="💬 Написать нам")],
+        [KeyboardButton(text="ℹ️ Помощь")]
+    ],
+    resize_keyboard=True,
+    input_field_placeholder="Выберите действие..."
+)
+
+
+class StaticSendMessage(SendMessage):
+    """SendMessage that knows its pre-rendered webhook body"""
+    _reply: "StaticReply" = PrivateAttr()
+
+
+class StaticReply:
+    __slots__ = ("text", "reply_markup", "_body_prefix")
+
+    def __init__(self, text: str, reply_markup):
+        self.text = text
+        self.reply_markup = reply_markup
+        payload = {
+            "method": SendMessage.__api_method__,
+            "text": text,
+            "reply_markup": reply_markup.model_dump(mode="json", exclude_none=True),
+        }
+        # Everything but the chat id, which closes the object
+        self._body_prefix = json.dumps(payload, ensure_ascii=False)[:-1].encode() + b', "chat_id": '
+
+    def answer(self, message: Message) -> StaticSendMessage:
+        method = StaticSendMessage(chat_id=message.chat.id, text=self.text, reply_markup=self.reply_markup)
+        method._reply = self
+        return method
+
+    def webhook_body(self, chat_id: int) -> bytes:
+        return self._body_prefix + str(int(chat_id)).encode() + b"}"
+
+
+HELP = StaticReply(
+    "ℹ️ Помощь\n\n"
+    "Используйте кнопки меню:\n\n"
+    "🎯 Записаться - онлайн-запись на услуги\n"
+    "📅 Мои записи - история бронирований\n"
+    "📍 Адрес - как нас найти\n"
+    "📞 Контакты - связаться с нами\n"
+    "💬 Написать нам - сообщение в поддержку\n"
+    "ℹ️ Помощь - эта справка\n\n"
+    "Автоматические уведомления:\n"
+    "• При создании записи\n"
+    "• Напоминание за 24 часа\n"
+    "• Запрос отзыва после посещения",
+    MAIN_MENU_KEYBOARD
+)
+
+# The address is kept on one line in .env with literal "\n" separators
+_address = settings.company_address.replace("\\n", "\n")
+
+ADDRESS = StaticReply(
+    f"📍 Наш адрес:\n\n"
+    f"{_address}\n"
+    f"2 этаж\n\n"
+    f"🕐 Режим работы:\n"
+    f"{settings.company_hours}\n\n"
+    f"🗺 Мы на картах:\n"
+    f"• 2ГИС: {settings.link_2gis}\n"
+    f"• Яндекс.Карты: {settings.link_yandex_maps}\n\n"
+    f"🚇 Как добраться:\n"
+    f"Остановка «ТЦ Мега» или «ТКЦ ULTRA»",
+    MAIN_MENU_KEYBOARD
+)
+
+CONTACTS = StaticReply(
+    f"📞 Контакты:\n\n"
+    f"☎️ Телефон: {settings.company_phone}\n"
+    f"🌐 Сайт: {settings.company_website}\n"
+    f"📱 Instagram: https://www.instagram.com/firstvr.ufa\n"
+    f"📱 ВКонтакте: https://vk.ru/id734925222\n\n"
+    f"💬 Или напишите нам прямо здесь через кнопку\n"
+    f"«Написать нам» - мы ответим в течение часа!\n\n"
+    f"Ждём вас в «Первое место»! 🎯",
+    MAIN_MENU_KEYBOARD
+)
+
+BOOK = StaticReply(
+    "🎯 Онлайн-запись в «Первое место»\n\n"
+    "Выберите удобное время и активность:\n"
+    "• VR-игры\n"
+    "• Аренда зала\n"
+    "• Корпоративы\n"
+    "• Детские праздники\n\n"
+    f"👉 Записаться: {settings.bukza_booking_url or settings.bukza_api_url.replace('/api', '')}\n\n"
+    "После записи вы получите уведомление в этом боте!",
+    MAIN_MENU_KEYBOARD
+)
+
+WEBSITE = StaticReply(
+    "🌐 Наш сайт:\n\n"
+    "Узнайте больше о нас, наших услугах и акциях!",
+    InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🌐 Открыть сайт", url="https://pervoe-mesto102.ru")]
+    ])
+)
+
+# Message texts answered with one of the replies above
+STATIC_COMMANDS = frozenset({"/help", "/address", "/contacts", "/book"})
+STATIC_BUTTONS = frozenset({"ℹ️ Помощь", "📍 Адрес", "📞 Контакты", "🌐 Наш сайт"})
+
+
+def expects_static_reply(update: Update) -> bool:
+    """
+    Whether the update is likely answered with a static reply.
+
+    Only a hint for the webhook to wait for the handler: the update still
+    goes through the dispatcher, so e.g. a pending FSM state wins.
+    """
+    text = update.message.text if update.message else None
+    if not text:
+        return False
+    if text in STATIC_BUTTONS:
+        return True
+    # "/help", "/help@bot_name" or "/help with arguments"
+    return text.split(maxsplit=1)[0].split("@", 1)[0] in STATIC_COMMANDS
+
+
+async def webhook_reply(bot: Bot, dp, result) -> Optional[web.Response]:
+    """
+    Turn a handler result into the webhook response.
+
+    Static replies go into the response body; any other returned method is
+    sent through the bot, the way polling mode does it.
+    """
+    if isinstance(result, StaticSendMessage):
+        return web.Response(
+            body=result._reply.webhook_body(result.chat_id),
+            content_type="application/json"
+        )
+    if isinstance(result, TelegramMethod):
+        await dp.silent_call_request(bot=bot, result=result)
+    return None
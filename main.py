@@ -1,86 +1,277 @@
+import argparse
 import asyncio
 import logging
+import multiprocessing
+import signal
+import time
+from typing import Optional
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiohttp import web
 from config import settings
-from database import init_db
+from database import init_db, engine, sql_instrumentation, pool_monitor, sqlite_writer
+from database.cache import user_cache
+from database.fsm_storage import SQLStorage
+from handlers.admin_handlers import router as admin_router
 from handlers.bot_handlers import router as bot_router
-from handlers.webhook_handlers import handle_webhook, handle_telegram_webhook
-from services.scheduler import start_scheduler, stop_scheduler
+from handlers.webhook_handlers import handle_webhook, handle_telegram_webhook, process_bukza_event
+from handlers.debug_handlers import handle_sql_stats, handle_sql_reset, handle_pool_stats, handle_pool_reset, handle_metrics
+from services.scheduler import scheduler, start_scheduler, stop_scheduler, schedule_sweeper, schedule_broadcasts, schedule_bukza_sync, schedule_retention, schedule_daily_digest, resume_scheduler, pause_scheduler
+from services.telegram_sender import telegram_sender
+from services.update_dispatcher import update_dispatcher
+from services.webhook_inbox import inbox_processor
+from services.bukza_client import bukza_client
+from services.leader import LeaderElector
+from services.metrics import http_metrics_middleware, BotAPIMetricsMiddleware, register_collectors
+from services.webhook_dedup import webhook_deduplicator
 from bot_setup import setup_bot
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+HOST = '0.0.0.0'
+PORT = 8080
 
-async def on_startup(app: web.Application):
-    """Initialize bot and database on startup"""
-    logger.info("Starting bot...")
-    
+
+async def prepare(bot: Bot):
+    """One-time startup work: database schema, bot settings and Telegram webhook"""
     # Initialize database
     await init_db()
     logger.info("Database initialized")
-    
-    # Start scheduler
-    start_scheduler()
-    logger.info("Scheduler started")
-    
+
     # Setup bot (commands, description, etc.)
-    bot = app['bot']
     await setup_bot(bot)
-    
+
     # Set webhook for Telegram
     telegram_webhook_url = f"{settings.webhook_host}/webhook/telegram"
     await bot.set_webhook(telegram_webhook_url, drop_pending_updates=True)
     logger.info(f"Telegram webhook set to: {telegram_webhook_url}")
 
 
+async def on_startup(app: web.Application):
+    """Initialize bot and database on startup"""
+    logger.info("Starting bot...")
+    bot = app['bot']
+
+    # In multi-worker mode the master process has already done this
+    if app['primary']:
+        await prepare(bot)
+
+    # Start scheduler paused: only the lease holder runs scheduled jobs
+    start_scheduler(paused=True)
+
+    # Start outbound message queue
+    telegram_sender.start()
+
+    # Open pooled HTTP session for Bukza API
+    await bukza_client.start()
+
+    # Periodic reminder / feedback request sweep
+    schedule_sweeper(bot)
+
+    # Queued and interrupted broadcasts
+    schedule_broadcasts(bot)
+
+    # Repair bookings whose Bukza webhooks were lost
+    schedule_bukza_sync()
+
+    # Move old messages and visits to the archive tables
+    schedule_retention()
+
+    # Post the day's booking figures to the support channel
+    schedule_daily_digest(bot)
+
+    # Start Bukza webhook inbox workers
+    inbox_processor.start(bot, process_bukza_event)
+
+    # Process Telegram updates concurrently, in order within a chat
+    update_dispatcher.start(bot, app['dp'])
+
+    # Elect the process that runs scheduled work
+    elector = LeaderElector("scheduler", on_elected=resume_scheduler, on_demoted=pause_scheduler)
+    elector.start()
+    app['leader'] = elector
+
+    # Gauges read from the components above when /metrics is scraped
+    register_collectors(
+        pool_monitor=pool_monitor,
+        scheduler=scheduler,
+        sender=telegram_sender,
+        inbox=inbox_processor,
+        deduplicator=webhook_deduplicator,
+        user_cache=user_cache,
+        bukza=bukza_client,
+        sql_instrumentation=sql_instrumentation,
+        leader=elector,
+        updates=update_dispatcher
+    )
+
+
 async def on_shutdown(app: web.Application):
     """Cleanup on shutdown"""
     logger.info("Shutting down...")
-    
+
+    # Give up leadership so another worker can take over right away
+    await app['leader'].stop()
+
     # Stop scheduler
     stop_scheduler()
-    
+
+    # Finish Telegram updates that are already accepted
+    await update_dispatcher.stop()
+
+    # Stop inbox workers (unfinished events are retried on next start)
+    await inbox_processor.stop()
+
+    # Deliver queued messages before closing the bot session
+    await telegram_sender.stop()
+
+    # Close Bukza HTTP session
+    await bukza_client.close()
+
+    # Flush buffered FSM states
+    await app['dp'].storage.close()
+
+    # Commit writes still queued for the SQLite writer
+    await sqlite_writer.stop()
+
     # Delete webhook and close bot session
     bot = app['bot']
-    await bot.delete_webhook(drop_pending_updates=True)
+    if app['primary']:
+        await bot.delete_webhook(drop_pending_updates=True)
     await bot.session.close()
-    
+
     logger.info("Shutdown complete")
 
 
-def create_app() -> web.Application:
-    """Create and configure the application"""
+def create_app(primary: bool = True, bot: Optional[Bot] = None) -> web.Application:
+    """
+    Create and configure the application.
+
+    `primary=False` is used for forked workers: one-time startup and
+    shutdown work (schema, bot settings, webhook) is left to the master.
+    A preconfigured `bot` (e.g. pointed at a local Bot API server, see
+    benchmarks/) replaces the default one.
+    """
     # Initialize bot and dispatcher
-    bot = Bot(token=settings.bot_token)
-    storage = MemoryStorage()
+    if bot is None:
+        bot = Bot(token=settings.bot_token)
+    bot.session.middleware(BotAPIMetricsMiddleware())
+    # Forked workers get updates of the same chats: no per-process FSM cache
+    storage = SQLStorage(shared=not primary)
     dp = Dispatcher(storage=storage)
-    
+
     # Register handlers
+    dp.include_router(admin_router)
     dp.include_router(bot_router)
-    
+
     # Create web application
-    app = web.Application()
+    app = web.Application(middlewares=[http_metrics_middleware])
     app['bot'] = bot
     app['dp'] = dp
-    
+    app['primary'] = primary
+
     # Register webhook endpoints
     app.router.add_post(settings.webhook_path, handle_webhook)  # Bukza webhook
     app.router.add_post('/webhook/telegram', handle_telegram_webhook)  # Telegram webhook
-    
+    app.router.add_get('/debug/sql', handle_sql_stats)  # SQL timings (DEBUG_TOKEN)
+    app.router.add_post('/debug/sql/reset', handle_sql_reset)
+    app.router.add_get('/debug/pool', handle_pool_stats)  # DB connection pool usage (DEBUG_TOKEN)
+    app.router.add_post('/debug/pool/reset', handle_pool_reset)
+    app.router.add_get('/metrics', handle_metrics)  # Prometheus
+
     # Register startup/shutdown handlers
     app.on_startup.append(on_startup)
     app.on_shutdown.append(on_shutdown)
-    
+
     return app
 
 
+def _run_worker(workers: int):
+    """Entry point of a forked worker process"""
+    # Drop the master's signal handlers; aiohttp installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    # The Bot API global limit is shared by all workers
+    telegram_sender.set_process_share(workers)
+    # Users cached here would not see changes made by the other workers
+    user_cache.set_process_count(workers)
+
+    web.run_app(create_app(primary=False), host=HOST, port=PORT, reuse_port=True)
+
+
+async def _prepare_master():
+    bot = Bot(token=settings.bot_token)
+    try:
+        await prepare(bot)
+    finally:
+        await bot.session.close()
+        # Don't hand pooled connections over to the forked workers
+        await engine.dispose()
+
+
+async def _cleanup_master():
+    bot = Bot(token=settings.bot_token)
+    try:
+        await bot.delete_webhook(drop_pending_updates=True)
+    finally:
+        await bot.session.close()
+
+
+def run_workers(workers: int):
+    """Pre-fork master: run one-time startup, then keep `workers` processes alive"""
+    asyncio.run(_prepare_master())
+
+    context = multiprocessing.get_context("fork")
+    processes: dict[int, multiprocessing.Process] = {}
+    stopping = False
+
+    def spawn(index: int):
+        process = context.Process(target=_run_worker, args=(workers,), name=f"worker-{index}")
+        process.start()
+        processes[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    for index in range(workers):
+        spawn(index)
+
+    while not stopping:
+        time.sleep(1)
+        for index, process in list(processes.items()):
+            if not process.is_alive() and not stopping:
+                logger.warning(f"Worker {index} (pid {process.pid}) exited with {process.exitcode}, restarting")
+                spawn(index)
+
+    logger.info("Stopping workers...")
+    for process in processes.values():
+        if process.is_alive():
+            process.terminate()
+    for process in processes.values():
+        process.join(timeout=70)
+
+    asyncio.run(_cleanup_master())
+    logger.info("Shutdown complete")
+
+
 if __name__ == '__main__':
-    app = create_app()
-    web.run_app(app, host='0.0.0.0', port=8080)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=settings.web_workers,
+                        help='number of worker processes sharing the port')
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        run_workers(args.workers)
+    else:
+        app = create_app()
+        web.run_app(app, host=HOST, port=PORT)
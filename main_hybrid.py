@@ -5,13 +5,19 @@ Use this for local development with ngrok/localtunnel
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiohttp import web
 from config import settings
-from database import init_db
+from database import init_db, pool_monitor, sqlite_writer
+from database.fsm_storage import SQLStorage
+from handlers.admin_handlers import router as admin_router
 from handlers.bot_handlers import router as bot_router
-from handlers.webhook_handlers import handle_webhook
-from services.scheduler import start_scheduler, stop_scheduler
+from handlers.webhook_handlers import handle_webhook, process_bukza_event
+from handlers.debug_handlers import handle_sql_stats, handle_sql_reset, handle_pool_stats, handle_pool_reset, handle_metrics
+from services.metrics import http_metrics_middleware, BotAPIMetricsMiddleware, register_collectors
+from services.scheduler import start_scheduler, stop_scheduler, schedule_sweeper, schedule_broadcasts, schedule_bukza_sync, schedule_retention, schedule_daily_digest
+from services.telegram_sender import telegram_sender
+from services.bukza_client import bukza_client
+from services.webhook_inbox import inbox_processor
 from bot_setup import setup_bot
 
 # Configure logging
@@ -44,24 +50,54 @@ async def main():
     start_scheduler()
     logger.info("Scheduler started")
     
+    # Start outbound message queue
+    telegram_sender.start()
+    
+    # Open pooled HTTP session for Bukza API
+    await bukza_client.start()
+    
     # Initialize bot and dispatcher
     bot = Bot(token=settings.bot_token)
-    storage = MemoryStorage()
+    bot.session.middleware(BotAPIMetricsMiddleware())
+    storage = SQLStorage()
     dp = Dispatcher(storage=storage)
     
     # Register handlers
+    dp.include_router(admin_router)
     dp.include_router(bot_router)
     
+    # Periodic reminder / feedback request sweep
+    schedule_sweeper(bot)
+    
+    # Queued and interrupted broadcasts
+    schedule_broadcasts(bot)
+    
+    # Repair bookings whose Bukza webhooks were lost
+    schedule_bukza_sync()
+    
+    # Move old messages and visits to the archive tables
+    schedule_retention()
+
+    # Post the day's booking figures to the support channel
+    schedule_daily_digest(bot)
+    
     # Setup bot (commands, description)
     await setup_bot(bot)
     
     # Create web app for Bukza webhooks
-    app = web.Application()
+    app = web.Application(middlewares=[http_metrics_middleware])
     app['bot'] = bot
     app['dp'] = dp
     app.router.add_post('/webhook/bukza', handle_webhook)
+    app.router.add_get('/debug/sql', handle_sql_stats)
+    app.router.add_post('/debug/sql/reset', handle_sql_reset)
+    app.router.add_get('/debug/pool', handle_pool_stats)
+    app.router.add_post('/debug/pool/reset', handle_pool_reset)
+    app.router.add_get('/metrics', handle_metrics)
+    register_collectors(pool_monitor=pool_monitor, sender=telegram_sender, inbox=inbox_processor, bukza=bukza_client)
     
-    # Start webhook server
+    # Start Bukza webhook inbox workers and webhook server
+    inbox_processor.start(bot, process_bukza_event)
     await start_webhook_server(app)
     
     logger.info("🤖 Bot started with Telegram polling!")
@@ -72,6 +108,10 @@ async def main():
         await dp.start_polling(bot)
     finally:
         stop_scheduler()
+        await inbox_processor.stop()
+        await telegram_sender.stop()
+        await sqlite_writer.stop()
+        await bukza_client.close()
         await bot.session.close()
         logger.info("Bot stopped")
 
@@ -1,11 +1,14 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from config import settings
-from database import init_db
+from database import init_db, sqlite_writer
+from database.fsm_storage import SQLStorage
+from handlers.admin_handlers import router as admin_router
 from handlers.bot_handlers import router as bot_router
-from services.scheduler import start_scheduler, stop_scheduler
+from services.scheduler import start_scheduler, stop_scheduler, schedule_sweeper, schedule_broadcasts, schedule_bukza_sync, schedule_retention, schedule_daily_digest
+from services.telegram_sender import telegram_sender
+from services.bukza_client import bukza_client
 from bot_setup import setup_bot
 
 # Configure logging
@@ -28,14 +31,36 @@ async def main():
     start_scheduler()
     logger.info("Scheduler started")
     
+    # Start outbound message queue
+    telegram_sender.start()
+    
+    # Open pooled HTTP session for Bukza API
+    await bukza_client.start()
+    
     # Initialize bot and dispatcher
     bot = Bot(token=settings.bot_token)
-    storage = MemoryStorage()
+    storage = SQLStorage()
     dp = Dispatcher(storage=storage)
     
     # Register handlers
+    dp.include_router(admin_router)
     dp.include_router(bot_router)
     
+    # Periodic reminder / feedback request sweep
+    schedule_sweeper(bot)
+    
+    # Queued and interrupted broadcasts
+    schedule_broadcasts(bot)
+    
+    # Repair bookings whose Bukza webhooks were lost
+    schedule_bukza_sync()
+    
+    # Move old messages and visits to the archive tables
+    schedule_retention()
+
+    # Post the day's booking figures to the support channel
+    schedule_daily_digest(bot)
+    
     # Setup bot (commands, description, etc.)
     await setup_bot(bot)
     
@@ -47,6 +72,9 @@ async def main():
     finally:
         # Cleanup
         stop_scheduler()
+        await telegram_sender.stop()
+        await sqlite_writer.stop()
+        await bukza_client.close()
         await bot.session.close()
         logger.info("Bot stopped")
 
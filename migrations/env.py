@@ -0,0 +1,71 @@
+"""
+Alembic environment.
+
+When started from the application (`database.init_db`) an open connection
+is passed in `config.attributes["connection"]`; from the alembic CLI a
+connection to settings.database_url is opened here.
+"""
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import settings
+from database.models import Base
+
+config = context.config
+
+# Only configure logging for CLI runs; the application has its own setup
+if config.config_file_name is not None and "connection" not in config.attributes:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def _configure(**kwargs):
+    context.configure(
+        target_metadata=target_metadata,
+        # Keep each revision in its own transaction: revisions that build
+        # indexes CONCURRENTLY commit the preceding work anyway
+        transaction_per_migration=True,
+        # SQLite can't ALTER most things in place
+        render_as_batch=settings.database_url.startswith("sqlite"),
+        compare_type=True,
+        **kwargs
+    )
+
+
+def run_migrations_offline():
+    _configure(url=settings.database_url, literal_binds=True, dialect_opts={"paramstyle": "named"})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection):
+    _configure(connection=connection)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations():
+    engine = create_async_engine(settings.database_url, poolclass=pool.NullPool)
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await engine.dispose()
+
+
+def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is None:
+        asyncio.run(run_async_migrations())
+    else:
+        do_run_migrations(connection)
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,123 @@
+"""Baseline schema
+
+Databases created by the old `Base.metadata.create_all` start-up already
+have some or all of these tables, so each table is only created when it is
+missing. Afterwards the database is stamped and later revisions apply as
+usual.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+booking_status = sa.Enum('ACTIVE', 'CANCELLED', 'COMPLETED', name='bookingstatus')
+message_type = sa.Enum('BOOKING_CREATED', 'BOOKING_CANCELLED', 'REMINDER', 'FEEDBACK_REQUEST', name='messagetype')
+inbox_status = sa.Enum('PENDING', 'PROCESSING', 'DONE', 'DEAD', name='inboxstatus')
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'users' not in existing:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('telegram_id', sa.BigInteger(), nullable=False),
+            sa.Column('phone_number', sa.String(length=20), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_users_telegram_id', 'users', ['telegram_id'], unique=True)
+        op.create_index('ix_users_phone_number', 'users', ['phone_number'], unique=True)
+
+    if 'bookings' not in existing:
+        op.create_table(
+            'bookings',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('bukza_booking_id', sa.String(length=100), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('service_name', sa.String(length=255), nullable=False),
+            sa.Column('client_name', sa.String(length=255), nullable=True),
+            sa.Column('client_phone', sa.String(length=20), nullable=True),
+            sa.Column('booking_datetime', sa.DateTime(), nullable=False),
+            sa.Column('duration_minutes', sa.Integer(), nullable=False),
+            sa.Column('status', booking_status, nullable=False),
+            sa.Column('rating', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_bookings_bukza_booking_id', 'bookings', ['bukza_booking_id'], unique=True)
+
+    if 'messages' not in existing:
+        op.create_table(
+            'messages',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('booking_id', sa.Integer(), nullable=True),
+            sa.Column('message_type', message_type, nullable=False),
+            sa.Column('sent_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['booking_id'], ['bookings.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if 'webhook_inbox' not in existing:
+        op.create_table(
+            'webhook_inbox',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('booking_code', sa.String(length=100), nullable=False),
+            sa.Column('message_type', sa.String(length=50), nullable=False),
+            sa.Column('payload', sa.Text(), nullable=False),
+            sa.Column('payload_hash', sa.String(length=64), nullable=False),
+            sa.Column('status', inbox_status, nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+            sa.Column('locked_at', sa.DateTime(), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('processed_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('booking_code', 'message_type', 'payload_hash', name='uq_webhook_inbox_dedup'),
+        )
+        op.create_index('ix_webhook_inbox_booking_code', 'webhook_inbox', ['booking_code'])
+        op.create_index('ix_webhook_inbox_status', 'webhook_inbox', ['status'])
+
+    if 'fsm_states' not in existing:
+        op.create_table(
+            'fsm_states',
+            sa.Column('key', sa.String(length=255), nullable=False),
+            sa.Column('state', sa.String(length=255), nullable=True),
+            sa.Column('data', sa.Text(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('key'),
+        )
+        op.create_index('ix_fsm_states_expires_at', 'fsm_states', ['expires_at'])
+
+    if 'leases' not in existing:
+        op.create_table(
+            'leases',
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('holder', sa.String(length=255), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('name'),
+        )
+
+
+def downgrade() -> None:
+    for table in ('leases', 'fsm_states', 'webhook_inbox', 'messages', 'bookings', 'users'):
+        op.drop_table(table)
+    bind = op.get_bind()
+    for enum in (inbox_status, message_type, booking_status):
+        enum.drop(bind, checkfirst=True)
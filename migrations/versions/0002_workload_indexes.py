@@ -0,0 +1,60 @@
+"""Indexes for the hot query paths
+
+- bookings (user_id, status, booking_datetime): get_active_by_user /
+  get_all_by_user filter by user and status and sort by date
+- bookings (client_phone) WHERE user_id IS NULL: finding bookings made
+  before the client registered in the bot, by phone
+- bookings (booking_datetime): reminder / feedback sweeps
+- messages (booking_id, message_type): "already sent?" checks of the sweeper
+
+On PostgreSQL the indexes are built CONCURRENTLY, so writes to the tables
+are not blocked while a large production table is indexed.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_bookings_user_status_datetime', 'bookings', ['user_id', 'status', 'booking_datetime'], None),
+    ('ix_bookings_unlinked_phone', 'bookings', ['client_phone'], sa.text('user_id IS NULL')),
+    ('ix_bookings_booking_datetime', 'bookings', ['booking_datetime'], None),
+    ('ix_messages_booking_type', 'messages', ['booking_id', 'message_type'], None),
+]
+
+
+def upgrade() -> None:
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    if concurrently:
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction
+        with op.get_context().autocommit_block():
+            for name, table, columns, where in INDEXES:
+                op.create_index(
+                    name, table, columns,
+                    postgresql_where=where,
+                    postgresql_concurrently=True,
+                    if_not_exists=True
+                )
+    else:
+        for name, table, columns, where in INDEXES:
+            op.create_index(name, table, columns, sqlite_where=where, if_not_exists=True)
+
+
+def downgrade() -> None:
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    if concurrently:
+        with op.get_context().autocommit_block():
+            for name, table, _, _ in INDEXES:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, table, _, _ in INDEXES:
+            op.drop_index(name, table_name=table, if_exists=True)
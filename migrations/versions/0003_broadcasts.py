@@ -0,0 +1,76 @@
+"""Broadcasts
+
+- broadcasts: announcements to all users with their resume cursor
+- users.is_blocked: users who blocked the bot are skipped by broadcasts
+- messages.broadcast_id: per-recipient delivery record, unique per
+  broadcast and user
+- BROADCAST message type
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+broadcast_status = sa.Enum('PENDING', 'RUNNING', 'DONE', 'CANCELLED', name='broadcaststatus')
+
+
+def upgrade() -> None:
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    if postgresql:
+        # ALTER TYPE ... ADD VALUE can't run inside a transaction before PostgreSQL 12
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE messagetype ADD VALUE IF NOT EXISTS 'BROADCAST'")
+
+    op.create_table(
+        'broadcasts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('status', broadcast_status, nullable=False),
+        sa.Column('created_by', sa.BigInteger(), nullable=True),
+        sa.Column('last_user_id', sa.Integer(), nullable=False),
+        sa.Column('sent', sa.Integer(), nullable=False),
+        sa.Column('failed', sa.Integer(), nullable=False),
+        sa.Column('blocked', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_broadcasts_status', 'broadcasts', ['status'])
+
+    op.add_column('users', sa.Column('is_blocked', sa.Boolean(), server_default=sa.false(), nullable=False))
+    # SQLite can't add a foreign key with ALTER TABLE; batch mode copies the table there
+    with op.batch_alter_table('messages') as batch:
+        batch.add_column(sa.Column('broadcast_id', sa.Integer(), nullable=True))
+        batch.create_foreign_key('messages_broadcast_id_fkey', 'broadcasts', ['broadcast_id'], ['id'])
+
+    if postgresql:
+        with op.get_context().autocommit_block():
+            op.create_index(
+                'uq_messages_broadcast_user', 'messages', ['broadcast_id', 'user_id'],
+                unique=True, postgresql_concurrently=True, if_not_exists=True
+            )
+    else:
+        op.create_index('uq_messages_broadcast_user', 'messages', ['broadcast_id', 'user_id'], unique=True)
+
+
+def downgrade() -> None:
+    # The BROADCAST value stays in the PostgreSQL enum type: values can't be dropped
+    op.drop_index('uq_messages_broadcast_user', table_name='messages')
+    with op.batch_alter_table('messages') as batch:
+        batch.drop_constraint('messages_broadcast_id_fkey', type_='foreignkey')
+        batch.drop_column('broadcast_id')
+    with op.batch_alter_table('users') as batch:
+        batch.drop_column('is_blocked')
+    op.drop_index('ix_broadcasts_status', table_name='broadcasts')
+    op.drop_table('broadcasts')
+    broadcast_status.drop(op.get_bind(), checkfirst=True)
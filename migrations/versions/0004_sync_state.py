@@ -0,0 +1,31 @@
+"""Bukza reconciliation sync state
+
+- sync_state: high-water mark of the periodic "bookings changed since"
+  pull from the Bukza API, one row per sync
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sync_state',
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('cursor', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sync_state')
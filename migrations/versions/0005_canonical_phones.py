@@ -0,0 +1,96 @@
+"""Canonical phone numbers
+
+Registration used to store the Telegram contact phone with only a "+"
+prepended ("+89..." for a contact shared as "89..."), while bookings got
+the +7 form from the Bukza webhook, so the two never matched. Rewrites
+users.phone_number and bookings.client_phone to the canonical form of
+services/phones.py and links unlinked bookings to the user with the same
+phone.
+
+A user whose canonical phone already belongs to another user keeps the
+old value (phone_number is unique) and is reported in the log.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+users = sa.table('users', sa.column('id', sa.Integer), sa.column('phone_number', sa.String))
+bookings = sa.table(
+    'bookings',
+    sa.column('id', sa.Integer),
+    sa.column('user_id', sa.Integer),
+    sa.column('client_phone', sa.String),
+)
+
+
+def _normalize(phone_number):
+    """services.phones.normalize_phone as of this revision"""
+    if not phone_number:
+        return ""
+    digits = ''.join(c for c in phone_number if c.isdigit())
+    if not digits:
+        return ""
+    if digits.startswith('8') and len(digits) == 11:
+        return '+7' + digits[1:]
+    if digits.startswith('7') and len(digits) == 11:
+        return '+' + digits
+    if len(digits) == 10:
+        return '+7' + digits
+    return '+' + digits
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    rows = conn.execute(sa.select(users.c.id, users.c.phone_number).where(users.c.phone_number.isnot(None))).all()
+    taken = {phone for _, phone in rows}
+    for user_id, phone in rows:
+        canonical = _normalize(phone)
+        if not canonical or canonical == phone:
+            continue
+        if canonical in taken:
+            logger.warning(f"User {user_id}: phone {phone} not normalized, {canonical} belongs to another user")
+            continue
+        conn.execute(users.update().where(users.c.id == user_id).values(phone_number=canonical))
+        taken.discard(phone)
+        taken.add(canonical)
+
+    # One UPDATE per distinct stored spelling, not per booking
+    phones = conn.execute(
+        sa.select(bookings.c.client_phone).where(bookings.c.client_phone.isnot(None)).distinct()
+    ).scalars().all()
+    for phone in phones:
+        canonical = _normalize(phone) or None
+        if canonical != phone:
+            conn.execute(
+                bookings.update().where(bookings.c.client_phone == phone).values(client_phone=canonical)
+            )
+
+    # Bookings made before their client registered
+    owner = users.c.phone_number == bookings.c.client_phone
+    conn.execute(
+        bookings.update()
+        .where(bookings.c.user_id.is_(None))
+        .where(sa.exists().where(owner))
+        .values(
+            user_id=sa.select(users.c.id).where(owner).scalar_subquery()
+        )
+    )
+
+
+def downgrade() -> None:
+    # The original spellings are not kept; canonical phones stay as they are
+    pass
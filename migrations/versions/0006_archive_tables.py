@@ -0,0 +1,78 @@
+"""Archive tables for retention
+
+- bookings_archive, messages_archive: rows moved out of bookings and
+  messages by the retention job (services/retention.py), same columns
+  plus archived_at and without foreign keys
+- messages (sent_at): the retention job picks the oldest messages first
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql as pg
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+# The enum types of the live tables are reused on PostgreSQL
+booking_status = pg.ENUM('ACTIVE', 'CANCELLED', 'COMPLETED', name='bookingstatus', create_type=False)
+message_type = pg.ENUM(
+    'BOOKING_CREATED', 'BOOKING_CANCELLED', 'REMINDER', 'FEEDBACK_REQUEST', 'BROADCAST',
+    name='messagetype', create_type=False
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'bookings_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('bukza_booking_id', sa.String(length=100), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('service_name', sa.String(length=255), nullable=False),
+        sa.Column('client_name', sa.String(length=255), nullable=True),
+        sa.Column('client_phone', sa.String(length=20), nullable=True),
+        sa.Column('booking_datetime', sa.DateTime(), nullable=False),
+        sa.Column('duration_minutes', sa.Integer(), nullable=False),
+        sa.Column('status', booking_status, nullable=False),
+        sa.Column('rating', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_bookings_archive_booking_datetime', 'bookings_archive', ['booking_datetime'])
+
+    op.create_table(
+        'messages_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('booking_id', sa.Integer(), nullable=True),
+        sa.Column('broadcast_id', sa.Integer(), nullable=True),
+        sa.Column('message_type', message_type, nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index(
+                'ix_messages_sent_at', 'messages', ['sent_at'],
+                postgresql_concurrently=True, if_not_exists=True
+            )
+    else:
+        op.create_index('ix_messages_sent_at', 'messages', ['sent_at'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    # Archived rows are not moved back
+    op.drop_index('ix_messages_sent_at', table_name='messages', if_exists=True)
+    op.drop_table('messages_archive')
+    op.drop_index('ix_bookings_archive_booking_datetime', table_name='bookings_archive')
+    op.drop_table('bookings_archive')
@@ -0,0 +1,97 @@
+"""Booking price and daily rollups
+
+- bookings.total_sum, bookings_archive.total_sum: price from Bukza
+- daily_rollups: bookings, cancellations, revenue and ratings per visit
+  day and service, filled here from the stored (and archived) bookings
+  and maintained incrementally from then on. Bookings stored before
+  this revision have no price, so their revenue starts at 0.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+daily_rollups = sa.table(
+    'daily_rollups',
+    sa.column('day', sa.Date),
+    sa.column('service_name', sa.String),
+    sa.column('bookings', sa.Integer),
+    sa.column('cancellations', sa.Integer),
+    sa.column('revenue', sa.Numeric),
+    sa.column('rating_sum', sa.Integer),
+    sa.column('rating_count', sa.Integer),
+    sa.column('updated_at', sa.DateTime),
+)
+
+
+def _bookings(name):
+    return sa.table(
+        name,
+        sa.column('service_name', sa.String),
+        sa.column('booking_datetime', sa.DateTime),
+        sa.column('status', sa.String),
+        sa.column('rating', sa.Integer),
+    )
+
+
+def upgrade() -> None:
+    op.add_column('bookings', sa.Column('total_sum', sa.Numeric(12, 2), nullable=True))
+    op.add_column('bookings_archive', sa.Column('total_sum', sa.Numeric(12, 2), nullable=True))
+
+    op.create_table(
+        'daily_rollups',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('service_name', sa.String(length=255), nullable=False),
+        sa.Column('bookings', sa.Integer(), nullable=False),
+        sa.Column('cancellations', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Numeric(12, 2), nullable=False),
+        sa.Column('rating_sum', sa.Integer(), nullable=False),
+        sa.Column('rating_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'service_name'),
+    )
+
+    # status is an enum on PostgreSQL; compare its text
+    rows = sa.union_all(*[
+        sa.select(
+            sa.func.date(table.c.booking_datetime).label('day'),
+            table.c.service_name,
+            sa.case((sa.cast(table.c.status, sa.String) == 'CANCELLED', 1), else_=0).label('cancelled'),
+            table.c.rating,
+        )
+        for table in (_bookings('bookings'), _bookings('bookings_archive'))
+    ]).subquery()
+    op.execute(
+        daily_rollups.insert().from_select(
+            ['day', 'service_name', 'bookings', 'cancellations', 'revenue', 'rating_sum', 'rating_count', 'updated_at'],
+            sa.select(
+                rows.c.day,
+                rows.c.service_name,
+                sa.func.count(),
+                sa.func.sum(rows.c.cancelled),
+                sa.literal(0),
+                sa.func.coalesce(sa.func.sum(rows.c.rating), 0),
+                sa.func.count(rows.c.rating),
+                sa.literal(datetime.utcnow(), sa.DateTime),
+            ).group_by(rows.c.day, rows.c.service_name)
+        )
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('daily_rollups')
+    with op.batch_alter_table('bookings_archive') as batch:
+        batch.drop_column('total_sum')
+    with op.batch_alter_table('bookings') as batch:
+        batch.drop_column('total_sum')
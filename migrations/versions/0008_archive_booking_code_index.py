@@ -0,0 +1,34 @@
+"""Index archived bookings by code
+
+- bookings_archive (bukza_booking_id): the reconciliation sync skips
+  bookings that retention has already archived, instead of inserting
+  them again
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index(
+                'ix_bookings_archive_bukza_booking_id', 'bookings_archive', ['bukza_booking_id'],
+                postgresql_concurrently=True, if_not_exists=True
+            )
+    else:
+        op.create_index(
+            'ix_bookings_archive_bukza_booking_id', 'bookings_archive', ['bukza_booking_id'], if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bookings_archive_bukza_booking_id', table_name='bookings_archive', if_exists=True)
@@ -0,0 +1,252 @@
+"""
+Announcements to all users.
+
+A broadcast is a row in `broadcasts`. The runner walks the users table in
+id order after the broadcast's `last_user_id` cursor and sends through
+`telegram_sender` on the BULK lane, so the global rate limit is respected
+and booking notifications overtake the announcement.
+
+Recipients are read a window at a time through a server-side cursor
+(`yield_per`), so memory does not grow with the number of users, and the
+read transaction ends before the window is sent. Each batch is recorded in
+`messages` and the cursor moved past it in one transaction before it goes
+out: after a crash or restart the broadcast resumes after the last claimed
+batch and nobody gets the announcement twice. Users who blocked the bot
+are marked and skipped by later broadcasts.
+
+Broadcasts are started with /broadcast (admins only) or from the command
+line and run by the scheduler in the leader process:
+
+    python -m services.broadcast "Текст объявления"
+    python -m services.broadcast --file announcement.txt --queue
+    python -m services.broadcast --status
+    python -m services.broadcast --cancel 3
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+
+from database import async_session_maker
+from database.models import Broadcast, BroadcastStatus
+from database.repository import BroadcastRepository, LeaseRepository, UserRepository
+from services.telegram_sender import telegram_sender, Priority
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_LEASE = "broadcast"
+
+
+class BroadcastRunner:
+    def __init__(
+        self,
+        window_size: int = 1000,
+        batch_size: int = 50,
+        lease_ttl: timedelta = timedelta(minutes=2)
+    ):
+        self.window_size = window_size
+        self.batch_size = batch_size
+        self.lease_ttl = lease_ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def _acquire_lease(self) -> bool:
+        """Only one process runs broadcasts; renewed after every batch"""
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            return await LeaseRepository(session).try_acquire(
+                BROADCAST_LEASE, self.holder, now + self.lease_ttl, now
+            )
+
+    async def _release_lease(self):
+        async with async_session_maker() as session:
+            await LeaseRepository(session).release(BROADCAST_LEASE, self.holder)
+
+    async def run_pending(self, bot: Bot) -> int:
+        """Run pending and interrupted broadcasts one after another; returns how many finished"""
+        if not await self._acquire_lease():
+            logger.info("Broadcasts are being sent by another process")
+            return 0
+        finished = 0
+        try:
+            while True:
+                async with async_session_maker() as session:
+                    broadcast = await BroadcastRepository(session).get_next_runnable()
+                if broadcast is None:
+                    return finished
+                status = await self._run(bot, broadcast)
+                if status is None:
+                    return finished
+                finished += 1
+        finally:
+            await self._release_lease()
+
+    async def _run(self, bot: Bot, broadcast: Broadcast) -> Optional[BroadcastStatus]:
+        """Send one broadcast to the end; None if the lease was lost"""
+        if broadcast.status == BroadcastStatus.PENDING:
+            async with async_session_maker() as session:
+                await BroadcastRepository(session).set_status(
+                    broadcast.id, BroadcastStatus.RUNNING, started_at=datetime.utcnow()
+                )
+            logger.info(f"Broadcast {broadcast.id} started")
+        else:
+            logger.info(f"Broadcast {broadcast.id} resumed after user {broadcast.last_user_id}")
+
+        cursor = broadcast.last_user_id
+        while True:
+            async with async_session_maker() as session:
+                repo = BroadcastRepository(session)
+                batches = [
+                    batch async for batch in repo.stream_recipients(
+                        broadcast.id, cursor, self.window_size, self.batch_size
+                    )
+                ]
+            if not batches:
+                break
+
+            for batch in batches:
+                async with async_session_maker() as session:
+                    current = await BroadcastRepository(session).get(broadcast.id)
+                if current.status == BroadcastStatus.CANCELLED:
+                    logger.info(f"Broadcast {broadcast.id} cancelled")
+                    return BroadcastStatus.CANCELLED
+                if not await self._acquire_lease():
+                    logger.warning(f"Lost the broadcast lease, broadcast {broadcast.id} paused")
+                    return None
+                await self._send_batch(bot, broadcast, batch)
+                cursor = batch[-1][0]
+
+        async with async_session_maker() as session:
+            repo = BroadcastRepository(session)
+            await repo.set_status(broadcast.id, BroadcastStatus.DONE, finished_at=datetime.utcnow())
+            done = await repo.get(broadcast.id)
+        logger.info(
+            f"Broadcast {broadcast.id} done: {done.sent} sent, {done.blocked} blocked, {done.failed} failed"
+        )
+        return BroadcastStatus.DONE
+
+    async def _send_batch(self, bot: Bot, broadcast: Broadcast, batch: list[tuple[int, int]]):
+        user_ids = [user_id for user_id, _ in batch]
+        async with async_session_maker() as session:
+            await BroadcastRepository(session).claim_batch(broadcast.id, user_ids, user_ids[-1])
+
+        results = await asyncio.gather(*[
+            telegram_sender.send_message(bot, telegram_id, broadcast.text, priority=Priority.BULK)
+            for _, telegram_id in batch
+        ], return_exceptions=True)
+
+        sent = failed = 0
+        blocked_telegram_ids = []
+        undelivered = []
+        for (user_id, telegram_id), result in zip(batch, results):
+            if not isinstance(result, BaseException):
+                sent += 1
+                continue
+            undelivered.append(user_id)
+            if isinstance(result, TelegramForbiddenError):
+                blocked_telegram_ids.append(telegram_id)
+            else:
+                failed += 1
+                logger.warning(f"Broadcast {broadcast.id} to user {user_id} failed: {result}")
+
+        async with async_session_maker() as session:
+            await UserRepository(session).set_blocked(blocked_telegram_ids)
+            await BroadcastRepository(session).record_results(
+                broadcast.id, sent, failed, len(blocked_telegram_ids), undelivered
+            )
+
+
+broadcast_runner = BroadcastRunner()
+
+
+async def create_broadcast(text: str, created_by: Optional[int] = None) -> tuple[Broadcast, int]:
+    """Queue a broadcast; returns it with the number of users it will reach"""
+    async with async_session_maker() as session:
+        broadcast = await BroadcastRepository(session).create(text, created_by)
+        recipients = await UserRepository(session).count_reachable()
+    logger.info(f"Broadcast {broadcast.id} queued for {recipients} users")
+    return broadcast, recipients
+
+
+async def cancel_broadcast(broadcast_id: int) -> bool:
+    async with async_session_maker() as session:
+        repo = BroadcastRepository(session)
+        broadcast = await repo.get(broadcast_id)
+        if broadcast is None or broadcast.status in (BroadcastStatus.DONE, BroadcastStatus.CANCELLED):
+            return False
+        await repo.set_status(broadcast_id, BroadcastStatus.CANCELLED, finished_at=datetime.utcnow())
+    return True
+
+
+def describe(broadcast: Broadcast) -> str:
+    return (
+        f"#{broadcast.id} {broadcast.status.value}: "
+        f"{broadcast.sent} sent, {broadcast.blocked} blocked, {broadcast.failed} failed"
+    )
+
+
+async def _cli(args) -> int:
+    from config import settings
+    from database import init_db
+
+    await init_db()
+
+    if args.status:
+        async with async_session_maker() as session:
+            for broadcast in await BroadcastRepository(session).get_recent(10):
+                print(describe(broadcast))
+        return 0
+
+    if args.cancel is not None:
+        if await cancel_broadcast(args.cancel):
+            print(f"Broadcast {args.cancel} cancelled")
+            return 0
+        print(f"Broadcast {args.cancel} is not running", file=sys.stderr)
+        return 1
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            text = f.read().strip()
+    else:
+        text = args.text
+    if text:
+        broadcast, recipients = await create_broadcast(text)
+        print(f"Broadcast {broadcast.id} queued for {recipients} users")
+        if args.queue:
+            return 0
+
+    bot = Bot(token=settings.bot_token)
+    # The bot process keeps sending its own traffic meanwhile
+    telegram_sender.set_process_share(2)
+    telegram_sender.start()
+    try:
+        finished = await broadcast_runner.run_pending(bot)
+        print(f"{finished} broadcasts finished")
+    finally:
+        await telegram_sender.stop()
+        await bot.session.close()
+    return 0
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Send an announcement to all users")
+    parser.add_argument("text", nargs="?", help="announcement text")
+    parser.add_argument("--file", help="read the announcement text from a file")
+    parser.add_argument("--queue", action="store_true", help="only queue it for the running bot")
+    parser.add_argument("--status", action="store_true", help="show recent broadcasts")
+    parser.add_argument("--cancel", type=int, metavar="ID", help="cancel a broadcast")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_cli(args)))
+
+
+if __name__ == "__main__":
+    main()
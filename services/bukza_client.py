@@ -1,67 +1,259 @@
+import asyncio
 import aiohttp
-from typing import Optional, List, Dict, Any, Tuple
+import json
+import time
+from datetime import datetime
+from typing import AsyncIterator, Optional, List, Dict, Any, Tuple
 from config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class CircuitOpenError(Exception):
+    """Raised instead of calling Bukza while the circuit breaker is open"""
+
+
+class BukzaAPIError(Exception):
+    """Bukza answered with an unexpected HTTP status"""
+    def __init__(self, status: int, body: str):
+        super().__init__(f"Bukza API error: {status} - {body[:200]}")
+        self.status = status
+
+
+class CircuitBreaker:
+    """
+    Простой circuit breaker: после `failure_threshold` ошибок подряд
+    запросы не отправляются `reset_timeout` секунд, затем пропускается
+    один пробный запрос.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Bukza circuit breaker opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+    def end_probe(self):
+        """Пропустить следующий пробный запрос, чем бы ни закончился этот (в т.ч. отменой)"""
+        self._probe_in_flight = False
+
+
+class EndpointStats:
+    """Счётчики запросов, ошибок и задержки для одного эндпоинта"""
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency: float, error: bool):
+        self.requests += 1
+        self.errors += int(error)
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self) -> Dict[str, Any]:
+        avg = self.total_latency / self.requests if self.requests else 0.0
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_latency_ms": round(avg * 1000, 2),
+            "max_latency_ms": round(self.max_latency * 1000, 2),
+        }
+
+
 class BukzaClient:
     """
     Клиент для работы с Bukza API.
-    
+
     Примечание: Bukza работает в основном через вебхуки.
     Этот клиент используется для дополнительных запросов, если API доступен.
+
+    Одна долгоживущая HTTP-сессия создаётся в `start()` (хук запуска
+    приложения) и закрывается в `close()`.
     """
     def __init__(self):
         self.api_url = settings.bukza_api_url
         self.api_key = settings.bukza_api_key
-    
+        self.breaker = CircuitBreaker()
+        self.endpoint_stats: Dict[str, EndpointStats] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        """Create the shared HTTP session (connection pool, keep-alive, DNS cache)"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=settings.bukza_pool_size,
+            limit_per_host=settings.bukza_pool_size,
+            ttl_dns_cache=300,
+            keepalive_timeout=30
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=settings.bukza_timeout,
+                connect=min(5.0, settings.bukza_timeout)
+            ),
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+        )
+        logger.info("Bukza HTTP session opened")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("Bukza HTTP session closed")
+        self._session = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.state,
+            "endpoints": {name: s.as_dict() for name, s in self.endpoint_stats.items()},
+        }
+
+    async def _request(self, endpoint: str, method: str, path: str, **kwargs) -> Tuple[int, str]:
+        """
+        Выполнить запрос через общую сессию.
+
+        Returns:
+            Tuple[int, str]: (HTTP статус, тело ответа)
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("Bukza API is unavailable (circuit open)")
+        stats = self.endpoint_stats.setdefault(endpoint, EndpointStats())
+        started = time.monotonic()
+        try:
+            if self._session is None or self._session.closed:
+                await self.start()
+            async with self._session.request(method, f"{self.api_url}{path}", **kwargs) as response:
+                body = await response.text()
+        except Exception:
+            # Сетевые ошибки, таймауты и всё неожиданное (например, тело,
+            # которое не декодируется) считаются сбоем; отмена - нет
+            stats.record(time.monotonic() - started, error=True)
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.breaker.end_probe()
+
+        server_error = response.status >= 500
+        stats.record(time.monotonic() - started, error=response.status >= 400)
+        if server_error:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response.status, body
+
     async def cancel_booking(self, booking_code: str) -> Tuple[bool, str]:
         """
         Отменить бронирование в Bukza.
-        
+
         Returns:
             Tuple[bool, str]: (успех, сообщение)
         """
         logger.info(f"Attempting to cancel booking {booking_code} via Bukza API")
-        
+
         # Bukza API для отмены бронирования
         # Документация: https://bukza.com/api
-        async with aiohttp.ClientSession() as session:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            try:
-                # Попытка отмены через API Bukza
-                # Формат URL может отличаться в зависимости от версии API
-                cancel_url = f"{self.api_url}/bookings/{booking_code}/cancel"
-                
-                async with session.post(cancel_url, headers=headers) as response:
-                    if response.status == 200:
-                        logger.info(f"Booking {booking_code} cancelled successfully via API")
-                        return True, "Запись успешно отменена"
-                    elif response.status == 404:
-                        logger.warning(f"Booking {booking_code} not found in Bukza")
-                        return False, "Запись не найдена в системе"
-                    elif response.status == 403:
-                        logger.warning(f"Cannot cancel booking {booking_code} - forbidden")
-                        return False, "Отмена невозможна (истёк срок или запись уже отменена)"
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Bukza API error: {response.status} - {error_text}")
-                        return False, "Ошибка при отмене записи"
-                        
-            except aiohttp.ClientError as e:
-                logger.error(f"Network error cancelling booking: {e}")
-                # Если API недоступен, отмечаем локально
-                return True, "Запись отменена (локально)"
-            except Exception as e:
-                logger.error(f"Error cancelling booking via Bukza: {e}")
-                return False, f"Ошибка: {str(e)}"
-    
+        try:
+            # Попытка отмены через API Bukza
+            # Формат URL может отличаться в зависимости от версии API
+            status, error_text = await self._request(
+                "cancel_booking", "POST", f"/bookings/{booking_code}/cancel"
+            )
+
+            if status == 200:
+                logger.info(f"Booking {booking_code} cancelled successfully via API")
+                return True, "Запись успешно отменена"
+            elif status == 404:
+                logger.warning(f"Booking {booking_code} not found in Bukza")
+                return False, "Запись не найдена в системе"
+            elif status == 403:
+                logger.warning(f"Cannot cancel booking {booking_code} - forbidden")
+                return False, "Отмена невозможна (истёк срок или запись уже отменена)"
+            else:
+                logger.error(f"Bukza API error: {status} - {error_text}")
+                return False, "Ошибка при отмене записи"
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            logger.error(f"Network error cancelling booking: {e!r}")
+            # Если API недоступен, отмечаем локально
+            return True, "Запись отменена (локально)"
+        except Exception as e:
+            logger.error(f"Error cancelling booking via Bukza: {e}")
+            return False, f"Ошибка: {str(e)}"
+
+    async def iter_changed_bookings(
+        self,
+        since: datetime,
+        page_size: int = 200
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Брони, созданные или изменённые после `since`, по страницам.
+
+        GET /bookings/changes?since=<ISO>&limit=<n>[&cursor=<token>]
+        -> {"items": [...], "next_cursor": "<token>" | null}
+
+        Элемент - данные брони в формате вебхука (code, resource, start,
+        end, name, phone / fields, total_sum) плюс "status" ("active" /
+        "cancelled") и "updated_at" (ISO). Элементы упорядочены по
+        updated_at. Следующая страница запрашивается только после того,
+        как вызывающий обработал текущую.
+
+        Raises:
+            BukzaAPIError: ответ не 200
+        """
+        cursor = None
+        while True:
+            params = {"since": since.isoformat(timespec="seconds"), "limit": str(page_size)}
+            if cursor:
+                params["cursor"] = cursor
+            status, body = await self._request("changed_bookings", "GET", "/bookings/changes", params=params)
+            if status != 200:
+                raise BukzaAPIError(status, body)
+
+            page = json.loads(body)
+            items = page.get("items") or []
+            if items:
+                yield items
+            cursor = page.get("next_cursor")
+            if not cursor:
+                return
+
     async def send_feedback(self, booking_code: str, rating: int) -> bool:
         """
         Отправить обратную связь в Bukza (если API поддерживает).
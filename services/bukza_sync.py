@@ -0,0 +1,182 @@
+"""
+Reconciliation sync with the Bukza API.
+
+Webhooks are the main source of bookings, but a webhook lost while the
+bot was down never reaches `bookings`. This job periodically pulls the
+bookings changed since its last run (`BukzaClient.iter_changed_bookings`)
+and applies them:
+
+- missing bookings are inserted and linked to the registered user with
+  the same phone (a name Bukza does not have is stored as NULL);
+- existing ones get the new time, service and status. A visit already
+  COMPLETED locally stays completed and a linked user is never replaced;
+- visits already moved to `bookings_archive` by retention stay there;
+- nothing is sent. Reminders for synced bookings come from the sweeper,
+  which only looks at the tables, so no client is notified twice.
+
+Pages are applied one at a time, each in one transaction of a handful of
+statements (user ids by phone, archived codes, the stored versions, one
+upsert of all its bookings, the daily rollups, the cursor; see
+`BookingRepository.upsert_many`), so a run over thousands of bookings
+holds a single page in memory. The cursor is the largest `updated_at`
+applied; the next run asks for changes since the cursor minus
+SYNC_OVERLAP, so changes that became visible on the Bukza side out of
+order are not missed.
+Applying a change twice is a no-op.
+
+Runs in the leader process every `bukza_sync_interval` seconds, or once
+from the command line:
+
+    python -m services.bukza_sync
+    python -m services.bukza_sync --days 90     # look back 90 days, ignoring the cursor
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import aiohttp
+
+from config import settings
+from database.models import BookingStatus
+from database.unit_of_work import UnitOfWork
+from services.bukza_client import bukza_client, BukzaAPIError, CircuitOpenError
+from services.metrics import bukza_sync_bookings
+from services.money import parse_amount
+from services.phones import find_phone, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+SYNC_NAME = "bukza_bookings"
+SYNC_OVERLAP = timedelta(minutes=10)
+BUKZA_DATETIME_FORMAT = "%d.%m.%Y %H:%M"
+# Name placeholders Bukza sends when the client left the field empty
+EMPTY_NAMES = {"", "-", "Не указано", "{client_name}"}
+
+
+def _parse_updated_at(value: str) -> datetime:
+    """ISO timestamp as naive UTC, like the rest of the database"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_item(item: dict) -> tuple[dict, datetime]:
+    """
+    Booking columns and change time of one changes item. Name, phone and
+    price are None when Bukza has none. Raises KeyError / TypeError / ValueError
+    on malformed items.
+    """
+    start = datetime.strptime(item["start"], BUKZA_DATETIME_FORMAT)
+    end = datetime.strptime(item["end"], BUKZA_DATETIME_FORMAT)
+    name = (item.get("name") or "").strip()
+    values = {
+        "bukza_booking_id": str(item["code"]),
+        "service_name": item["resource"],
+        "client_name": None if name in EMPTY_NAMES else name,
+        "client_phone": normalize_phone(find_phone(item)) or None,
+        "booking_datetime": start,
+        "duration_minutes": int((end - start).total_seconds() / 60),
+        "status": BookingStatus.CANCELLED if item.get("status") == "cancelled" else BookingStatus.ACTIVE,
+        "total_sum": parse_amount(item.get("total_sum")),
+    }
+    return values, _parse_updated_at(item["updated_at"])
+
+
+async def _apply_page(items: list[dict], cursor: Optional[datetime], counts: Counter) -> Optional[datetime]:
+    """Apply one page and advance the cursor in the same transaction; returns the new cursor"""
+    pulled: dict[str, dict] = {}
+    high_water = cursor
+    for item in items:
+        try:
+            values, updated_at = parse_item(item)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping malformed Bukza booking {item.get('code')!r}: {e!r}")
+            counts["invalid"] += 1
+            continue
+        # Items come in change order: the last version of a booking wins
+        pulled[values["bukza_booking_id"]] = values
+        high_water = updated_at if high_water is None else max(high_water, updated_at)
+
+    async with UnitOfWork() as uow:
+        phones = list({values["client_phone"] for values in pulled.values() if values["client_phone"]})
+        user_ids = await uow.users.get_ids_by_phones(phones)
+        # The merge rules (no relinking, COMPLETED kept, ...) are part of the statement
+        saved = await uow.bookings.upsert_many([
+            {**values, "user_id": user_ids.get(values["client_phone"])} for values in pulled.values()
+        ])
+        if high_water is not None and high_water != cursor:
+            await uow.sync_state.save_cursor(SYNC_NAME, high_water)
+        await uow.commit()
+
+    inserted = sum(saved.values())
+    counts["inserted"] += inserted
+    counts["updated"] += len(saved) - inserted
+    counts["unchanged"] += len(pulled) - len(saved)
+    return high_water
+
+
+async def sync_bookings(since: Optional[datetime] = None) -> dict[str, int]:
+    """
+    Pull and apply the bookings changed since the saved cursor (or `since`).
+    Pages applied before an API error stay applied; the next run continues
+    from there.
+    """
+    async with UnitOfWork() as uow:
+        cursor = await uow.sync_state.get_cursor(SYNC_NAME)
+    if since is None:
+        if cursor is not None:
+            since = cursor - SYNC_OVERLAP
+        else:
+            since = datetime.utcnow() - timedelta(days=settings.bukza_sync_initial_days)
+
+    counts: Counter = Counter()
+    started = datetime.utcnow()
+    try:
+        async for items in bukza_client.iter_changed_bookings(since, settings.bukza_sync_page_size):
+            counts["pages"] += 1
+            cursor = await _apply_page(items, cursor, counts)
+    except (BukzaAPIError, CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logger.error(f"Bukza sync stopped after {counts['pages']} pages: {e!r}")
+        counts["errors"] += 1
+
+    for result in ("inserted", "updated", "unchanged", "invalid"):
+        if counts[result]:
+            bukza_sync_bookings.inc(result, amount=counts[result])
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    logger.info(
+        f"Bukza sync since {since:%Y-%m-%d %H:%M}: {counts['inserted']} inserted, "
+        f"{counts['updated']} updated, {counts['unchanged']} unchanged in {elapsed:.1f}s"
+    )
+    return dict(counts)
+
+
+async def _cli(args) -> int:
+    from database import init_db
+
+    await init_db()
+    await bukza_client.start()
+    try:
+        since = datetime.utcnow() - timedelta(days=args.days) if args.days is not None else None
+        counts = await sync_bookings(since)
+    finally:
+        await bukza_client.close()
+    print(", ".join(f"{name}: {count}" for name, count in sorted(counts.items())) or "no changes")
+    return 1 if counts.get("errors") else 0
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Pull changed bookings from the Bukza API")
+    parser.add_argument("--days", type=int, help="look back this many days instead of using the saved cursor")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_cli(args)))
+
+
+if __name__ == "__main__":
+    main()
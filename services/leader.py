@@ -0,0 +1,88 @@
+"""
+Leader election through a lease row in the database.
+
+Every worker process runs a `LeaderElector`; the one holding the lease runs
+scheduled work. The leader renews the lease every `renew_interval`; if it
+dies, the lease expires after `ttl` and another worker takes over.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from database import async_session_maker
+from database.repository import LeaseRepository
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElector:
+    def __init__(
+        self,
+        name: str,
+        on_elected: Callable[[], None],
+        on_demoted: Callable[[], None],
+        ttl: timedelta = timedelta(seconds=30),
+        renew_interval: timedelta = timedelta(seconds=10)
+    ):
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.is_leader = False
+        self._renewed_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"leader-{self.name}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            self._set_leader(False)
+            try:
+                async with async_session_maker() as session:
+                    await LeaseRepository(session).release(self.name, self.holder)
+            except Exception as e:
+                logger.warning(f"Failed to release lease {self.name}: {e}")
+
+    def _set_leader(self, value: bool):
+        if value == self.is_leader:
+            return
+        self.is_leader = value
+        if value:
+            logger.info(f"{self.holder} is now the leader for '{self.name}'")
+            self.on_elected()
+        else:
+            logger.warning(f"{self.holder} lost leadership for '{self.name}'")
+            self.on_demoted()
+
+    async def _run(self):
+        while True:
+            now = datetime.utcnow()
+            try:
+                async with async_session_maker() as session:
+                    acquired = await LeaseRepository(session).try_acquire(
+                        self.name, self.holder, now + self.ttl, now
+                    )
+                if acquired:
+                    self._renewed_at = now
+                self._set_leader(acquired)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lease '{self.name}' check failed: {e}")
+                # Step down before the lease can expire and be taken over
+                deadline = self.ttl - self.renew_interval
+                if self._renewed_at is None or datetime.utcnow() - self._renewed_at >= deadline:
+                    self._set_leader(False)
+            await asyncio.sleep(self.renew_interval.total_seconds())
@@ -0,0 +1,371 @@
+"""
+Prometheus metrics in the text exposition format, served at /metrics.
+
+Counters and histograms are plain in-process objects updated on the hot
+path (a dict lookup and an addition per observation). Values that other
+components already track (queue depths, cache sizes, pool usage) are read
+by collector callbacks only when /metrics is scraped.
+
+With several worker processes (`--workers`) every process reports its own
+values; scrape each process or aggregate in Prometheus.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiohttp import web
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Reminder lateness is measured against a one-minute sweep
+LATENESS_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 900, 3600, 6 * 3600, 24 * 3600)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), series):
+                cumulative += count
+                bucket_labels = _format_labels((*self.labelnames, "le"), (*labels, _format_value(bound)))
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(series[-1])}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class GaugeCollector:
+    """
+    Gauge (or counter) whose samples come from a callback at scrape time.
+
+    The callback returns a number, or a dict of label tuples to numbers.
+    """
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], object],
+        labelnames: Tuple[str, ...] = (),
+        type: str = "gauge"
+    ):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labelnames = labelnames
+        self.type = type
+
+    def expose(self) -> Iterable[str]:
+        try:
+            samples = self.callback()
+        except Exception:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        if not isinstance(samples, dict):
+            samples = {(): samples}
+        for labels, value in samples.items():
+            if value is None:
+                continue
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge_callback(self, name: str, help: str, callback: Callable[[], object],
+                       labelnames: Tuple[str, ...] = (), type: str = "gauge") -> GaugeCollector:
+        return self._register(GaugeCollector(name, help, callback, labelnames, type))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "bot_http_request_duration_seconds",
+    "Time spent in aiohttp handlers",
+    ("handler", "status")
+)
+telegram_api_duration = registry.histogram(
+    "bot_telegram_api_request_duration_seconds",
+    "Bot API call latency",
+    ("method",)
+)
+telegram_api_errors = registry.counter(
+    "bot_telegram_api_errors_total",
+    "Failed Bot API calls",
+    ("method", "error")
+)
+bukza_webhooks = registry.counter(
+    "bot_bukza_webhooks_total",
+    "Bukza webhooks received",
+    ("message", "result")
+)
+bukza_sync_bookings = registry.counter(
+    "bot_bukza_sync_bookings_total",
+    "Bookings pulled by the Bukza reconciliation sync",
+    ("result",)
+)
+retention_rows = registry.counter(
+    "bot_retention_rows_total",
+    "Rows completed or moved to the archive tables by the retention job",
+    ("table",)
+)
+reminder_lateness = registry.histogram(
+    "bot_reminder_lateness_seconds",
+    "Delay between the moment a reminder / feedback request was due and its delivery",
+    ("type",),
+    buckets=LATENESS_BUCKETS
+)
+
+
+@web.middleware
+async def http_metrics_middleware(request: web.Request, handler):
+    """Observe handler latency, labelled by the handler function name"""
+    started = time.perf_counter()
+    status = "500"
+    try:
+        response = await handler(request)
+        status = str(response.status)
+        return response
+    except web.HTTPException as e:
+        status = str(e.status)
+        raise
+    finally:
+        route = request.match_info.route
+        name = getattr(route.handler, "__name__", "unknown") if route.resource else "not_found"
+        http_request_duration.observe(time.perf_counter() - started, name, status)
+
+
+class BotAPIMetricsMiddleware(BaseRequestMiddleware):
+    """aiogram session middleware timing every Bot API request"""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            telegram_api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            telegram_api_duration.observe(time.perf_counter() - started, name)
+
+
+def register_collectors(
+    pool_monitor=None,
+    scheduler=None,
+    sender=None,
+    inbox=None,
+    deduplicator=None,
+    user_cache=None,
+    bukza=None,
+    sql_instrumentation=None,
+    leader=None,
+    updates=None
+):
+    """Expose stats of already existing components; read only on scrape"""
+    if pool_monitor is not None:
+        registry.gauge_callback(
+            "bot_db_pool_connections", "Database connection pool usage",
+            lambda: {
+                ("checked_out",): pool_monitor.checked_out,
+                ("peak",): pool_monitor.peak,
+                ("capacity",): pool_monitor.capacity or 0,
+            },
+            ("state",)
+        )
+        registry.gauge_callback(
+            "bot_db_pool_events_total", "Database connection pool events",
+            lambda: {
+                ("checkout",): pool_monitor.checkouts,
+                ("connect",): pool_monitor.connects,
+                ("invalidate",): pool_monitor.invalidations,
+            },
+            ("event",), type="counter"
+        )
+        registry.gauge_callback(
+            "bot_db_pool_saturated_seconds_total", "Time all pool connections were in use",
+            lambda: pool_monitor.snapshot()["saturated_s"], type="counter"
+        )
+
+    if sql_instrumentation is not None:
+        registry.gauge_callback(
+            "bot_db_statements_total", "SQL statements executed",
+            lambda: sum(s.count for s in sql_instrumentation.statements.values()), type="counter"
+        )
+        registry.gauge_callback(
+            "bot_db_slow_statements_total", "SQL statements slower than the slow query threshold",
+            lambda: sum(s.slow for s in sql_instrumentation.statements.values()), type="counter"
+        )
+
+    if scheduler is not None:
+        registry.gauge_callback("bot_scheduler_jobs", "Jobs registered in the scheduler",
+                                lambda: len(scheduler.get_jobs()))
+
+    if leader is not None:
+        registry.gauge_callback("bot_scheduler_leader", "1 if this process runs scheduled jobs",
+                                lambda: int(leader.is_leader))
+
+    if sender is not None:
+        registry.gauge_callback("bot_telegram_queue_depth", "Messages waiting in the send queue",
+                                lambda: sender.queue_depth())
+        registry.gauge_callback(
+            "bot_telegram_messages_total", "Messages handled by the send queue",
+            lambda: {("sent",): sender.sent, ("failed",): sender.failed, ("retried",): sender.retried},
+            ("result",), type="counter"
+        )
+
+    if updates is not None:
+        def update_gauges():
+            stats = updates.stats()
+            return {(key,): stats[key] for key in ("backlog", "in_flight")}
+
+        def update_counters():
+            stats = updates.stats()
+            return {(key,): stats[key] for key in ("processed", "failed", "rejected")}
+
+        registry.gauge_callback("bot_telegram_updates", "Telegram updates waiting for or holding a handler slot",
+                                update_gauges, ("state",))
+        registry.gauge_callback("bot_telegram_updates_total", "Telegram updates handled",
+                                update_counters, ("result",), type="counter")
+
+    if inbox is not None:
+        def inbox_gauges():
+            stats = inbox.stats()
+            return {("queued",): stats["queued"], ("active",): stats["active"]}
+
+        def inbox_counters():
+            stats = inbox.stats()
+            return {(key,): stats[key] for key in ("processed", "failed", "dead")}
+
+        registry.gauge_callback("bot_inbox_events", "Bukza inbox events in this process",
+                                inbox_gauges, ("state",))
+        registry.gauge_callback("bot_inbox_events_total", "Bukza inbox events handled",
+                                inbox_counters, ("result",), type="counter")
+
+    if deduplicator is not None:
+        registry.gauge_callback(
+            "bot_webhook_duplicates_total", "Duplicate Bukza webhooks dropped",
+            lambda: {("cache",): deduplicator.cache_hits, ("db",): deduplicator.db_hits},
+            ("source",), type="counter"
+        )
+
+    if user_cache is not None:
+        registry.gauge_callback("bot_user_cache_size", "Entries in the user cache",
+                                lambda: user_cache.stats()["size"])
+        registry.gauge_callback(
+            "bot_user_cache_requests_total", "User cache lookups",
+            lambda: {("hit",): user_cache.stats()["hits"], ("miss",): user_cache.stats()["misses"]},
+            ("result",), type="counter"
+        )
+
+    if bukza is not None:
+        registry.gauge_callback(
+            "bot_bukza_circuit_open", "1 while the Bukza API circuit breaker is open",
+            lambda: int(bukza.breaker.state != "closed")
+        )
+        registry.gauge_callback(
+            "bot_bukza_requests_total", "Bukza API requests",
+            lambda: {(name,): s.requests for name, s in bukza.endpoint_stats.items()},
+            ("endpoint",), type="counter"
+        )
+        registry.gauge_callback(
+            "bot_bukza_errors_total", "Failed Bukza API requests",
+            lambda: {(name,): s.errors for name, s in bukza.endpoint_stats.items()},
+            ("endpoint",), type="counter"
+        )
+
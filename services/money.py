@@ -0,0 +1,28 @@
+"""
+Booking prices. Bukza sends `total_sum` as text ("2500", "2 500,00");
+it is stored as Decimal rubles in bookings.total_sum.
+"""
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+
+def parse_amount(value) -> Optional[Decimal]:
+    """Decimal rubles, None for an empty value, a placeholder or garbage"""
+    if value is None:
+        return None
+    text = str(value).replace("\u00a0", "").replace(" ", "").replace(",", ".")
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        return None
+    # Numeric(12, 2) holds up to 10 digits before the point
+    if not amount.is_finite() or amount < 0 or amount >= 10 ** 10:
+        return None
+    return amount.quantize(Decimal("0.01"))
+
+
+def format_amount(amount: Decimal) -> str:
+    """12 500 ₽ (kopecks only when there are any)"""
+    if amount == amount.to_integral_value():
+        return f"{int(amount):,} ₽".replace(",", " ")
+    return f"{amount:,.2f} ₽".replace(",", " ")
@@ -0,0 +1,43 @@
+"""
+Phone numbers from Bukza payloads and Telegram contacts.
+
+`normalize_phone` gives the canonical form (+7XXXXXXXXXX for Russian
+numbers) stored in users.phone_number and bookings.client_phone, so a
+booking and the client who registers with the same number always meet
+on the same index key.
+"""
+from typing import Optional
+
+
+def find_phone(data: dict, phone_number: str = "") -> str:
+    """
+    Client phone of a Bukza booking: `phone_number` (e.g. from the webhook
+    URL), a phone field or the form field named like one.
+    """
+    phone_number = phone_number or data.get("phone") or data.get("client_phone") or ""
+
+    # Check in fields array if phone not found
+    if not phone_number or phone_number == "{client_phone}":
+        phone_number = ""
+        for field in data.get("fields") or []:
+            field_name = (field.get("name") or "").lower()
+            if "телефон" in field_name or "phone" in field_name:
+                phone_number = field.get("value") or ""
+                break
+    return phone_number
+
+
+def normalize_phone(phone_number: Optional[str]) -> str:
+    """Remove all non-digits and convert to +7 format; empty string if there are no digits"""
+    if not phone_number:
+        return ""
+    digits = ''.join(c for c in phone_number if c.isdigit())
+    if not digits:
+        return ""
+    if digits.startswith('8') and len(digits) == 11:
+        return '+7' + digits[1:]
+    if digits.startswith('7') and len(digits) == 11:
+        return '+' + digits
+    if len(digits) == 10:
+        return '+7' + digits
+    return '+' + digits
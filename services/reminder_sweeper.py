@@ -0,0 +1,157 @@
+"""
+Reminder / feedback sweeper.
+
+Instead of one timer per booking, a single periodic job queries the bookings
+that are due in the current window (indexed by `booking_datetime`), loads
+each booking together with its user in one joined query and sends the batch
+spread over the sweep interval. Every send is recorded in `messages` before
+it goes out, and due bookings are selected only if they have no such record,
+so a reminder is never sent twice and memory does not grow with the number
+of future bookings.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from database import async_session_maker
+from database.models import Booking, User, Message, BookingStatus, MessageType
+from database.repository import BookingRepository, MessageRepository
+from services.telegram_sender import telegram_sender, Priority
+from services.metrics import reminder_lateness
+
+logger = logging.getLogger(__name__)
+
+SWEEP_INTERVAL = timedelta(seconds=60)
+# Sends of one batch are spread over this part of the interval
+SWEEP_JITTER = SWEEP_INTERVAL * 0.8
+SWEEP_BATCH_SIZE = 200
+
+REMINDER_LEAD = timedelta(hours=24)
+# Catch-up policy: a reminder that came due while we were down is still
+# sent until 1 hour before the visit; a feedback request up to 12 hours
+# after the visit ended.
+REMINDER_GRACE = timedelta(hours=23)
+FEEDBACK_GRACE = timedelta(hours=12)
+# Upper bound for a visit length, used to find visits that have just ended
+MAX_DURATION = timedelta(hours=24)
+
+
+async def send_reminder(bot: Bot, booking: Booking, user: User):
+    """Send reminder to user"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🗺 Открыть в 2ГИС", url="https://2gis.ru/ufa/firm/70000001092498553")]
+    ])
+
+    await telegram_sender.send_message(
+        bot,
+        user.telegram_id,
+        f"⏰ Напоминание!\n\n"
+        f"Через 1 час ваша запись:\n"
+        f"━━━━━━━━━━━━━━━━━━━━\n"
+        f"🎯 {booking.service_name}\n"
+        f"🕐 {booking.booking_datetime.strftime('%H:%M')}\n"
+        f"━━━━━━━━━━━━━━━━━━━━\n\n"
+        f"📍 ТКЦ ULTRA, Бакалинская 27\n"
+        f"2 этаж, вход со стороны парковки\n\n"
+        f"Ждём вас! 🎮",
+        priority=Priority.REMINDER,
+        reply_markup=keyboard
+    )
+
+
+async def send_feedback_request(bot: Bot, booking: Booking, user: User):
+    """Send feedback request to user"""
+    await telegram_sender.send_message(
+        bot,
+        user.telegram_id,
+        f"Спасибо, что посетили нас! 💐\n\n"
+        f"Пожалуйста, оцените услугу '{booking.service_name}' от 1 до 5:",
+        priority=Priority.REMINDER
+    )
+
+
+async def _find_due_reminders(now: datetime) -> list[tuple[Booking, User]]:
+    async with async_session_maker() as session:
+        return await BookingRepository(session).get_due_without_message(
+            now + REMINDER_LEAD - REMINDER_GRACE,
+            now + REMINDER_LEAD,
+            MessageType.REMINDER,
+            limit=SWEEP_BATCH_SIZE,
+            # Bookings made less than 24 hours ahead never get a reminder
+            made_ahead=REMINDER_LEAD
+        )
+
+
+async def _find_due_feedback(now: datetime) -> list[tuple[Booking, User]]:
+    async with async_session_maker() as session:
+        return await BookingRepository(session).get_due_without_message(
+            now - FEEDBACK_GRACE - MAX_DURATION,
+            now,
+            MessageType.FEEDBACK_REQUEST,
+            statuses=(BookingStatus.ACTIVE, BookingStatus.COMPLETED),
+            limit=SWEEP_BATCH_SIZE,
+            ending_in=(now - FEEDBACK_GRACE, now)
+        )
+
+
+def _due_at(booking: Booking, message_type: MessageType) -> datetime:
+    if message_type == MessageType.REMINDER:
+        return booking.booking_datetime - REMINDER_LEAD
+    return booking.booking_datetime + timedelta(minutes=booking.duration_minutes)
+
+
+async def _deliver(bot: Bot, booking: Booking, user: User, record: Message, send, delay: float):
+    await asyncio.sleep(delay)
+    try:
+        await send(bot, booking, user)
+        logger.info(f"{record.message_type.value} sent for booking {booking.bukza_booking_id}")
+        lateness = datetime.now() - _due_at(booking, record.message_type)
+        reminder_lateness.observe(max(0.0, lateness.total_seconds()), record.message_type.value)
+    except (TelegramForbiddenError, TelegramBadRequest) as e:
+        # Permanent failure (bot blocked, chat not found): keep the record
+        logger.warning(f"Cannot send {record.message_type.value} to user {user.id}: {e}")
+    except Exception as e:
+        # Transient failure: drop the record so the next sweep retries
+        logger.error(f"Failed to send {record.message_type.value} for booking {booking.id}: {e}")
+        async with async_session_maker() as session:
+            await MessageRepository(session).delete(record.id)
+
+
+async def _dispatch(bot: Bot, due: list[tuple[Booking, User]], message_type: MessageType, send):
+    if not due:
+        return
+
+    # Record the sends first so an overlapping sweep can't pick them up again
+    records = [
+        Message(user_id=user.id, booking_id=booking.id, message_type=message_type)
+        for booking, user in due
+    ]
+    async with async_session_maker() as session:
+        await MessageRepository(session).create_many(records)
+
+    jitter = SWEEP_JITTER.total_seconds()
+    await asyncio.gather(*[
+        _deliver(bot, booking, user, record, send, random.uniform(0, jitter))
+        for (booking, user), record in zip(due, records)
+    ])
+
+
+async def sweep(bot: Bot):
+    """Send all reminders and feedback requests that are due now"""
+    # Visit times are the local clock (see database/clock.py)
+    now = datetime.now()
+    reminders = await _find_due_reminders(now)
+    feedback = await _find_due_feedback(now)
+
+    if reminders or feedback:
+        logger.info(f"Sweep: {len(reminders)} reminders, {len(feedback)} feedback requests due")
+
+    await asyncio.gather(
+        _dispatch(bot, reminders, MessageType.REMINDER, send_reminder),
+        _dispatch(bot, feedback, MessageType.FEEDBACK_REQUEST, send_feedback_request)
+    )
@@ -0,0 +1,123 @@
+"""
+Retention: moves old rows out of the hot tables.
+
+`messages` gets a row for every notification and `bookings` keeps every
+visit, so both (and their indexes) would grow forever. Each run applies
+these policies:
+
+- ACTIVE bookings that started more than MAX_DURATION + FEEDBACK_GRACE
+  ago become COMPLETED. The visit is over and its feedback request is
+  out of the sweeper's window; nothing else marks visits done;
+- COMPLETED and CANCELLED bookings that started more than
+  `retention_bookings_days` ago go to `bookings_archive`, together with
+  their messages;
+- messages older than `retention_messages_days` go to
+  `messages_archive`, except those of bookings that have not started by
+  then and the delivery records of unfinished broadcasts.
+
+Rows are moved in batches of `retention_batch_size`, each batch a short
+transaction of its own (see `ArchiveRepository`) with a pause before the
+next, so the bot's own writes are never blocked for long. Archived
+visits drop out of /bookings, but ratings stay queryable with
+`BookingRepository.rating_counts`, which reads both tables.
+
+Runs in the leader process every `retention_interval` seconds, or once
+from the command line:
+
+    python -m services.retention
+"""
+import asyncio
+import logging
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+
+from config import settings
+from database import async_session_maker
+from database.clock import utc_to_local
+from database.repository import ArchiveRepository
+from services.metrics import retention_rows
+from services.reminder_sweeper import MAX_DURATION, FEEDBACK_GRACE
+
+logger = logging.getLogger(__name__)
+
+COMPLETE_AFTER = MAX_DURATION + FEEDBACK_GRACE
+# Pause between batches, lets queued writes of the bot go first
+BATCH_PAUSE = 0.1
+
+
+async def _complete_past(started_before: datetime, batch_size: int, counts: Counter):
+    while True:
+        async with async_session_maker() as session:
+            completed = await ArchiveRepository(session).complete_past(started_before, batch_size)
+        counts["bookings_completed"] += completed
+        if completed < batch_size:
+            return
+        await asyncio.sleep(BATCH_PAUSE)
+
+
+async def _archive_bookings(started_before: datetime, batch_size: int, counts: Counter):
+    while True:
+        async with async_session_maker() as session:
+            bookings, messages = await ArchiveRepository(session).archive_bookings(started_before, batch_size)
+        counts["bookings"] += bookings
+        counts["messages"] += messages
+        if bookings < batch_size:
+            return
+        await asyncio.sleep(BATCH_PAUSE)
+
+
+async def _archive_messages(sent_before: datetime, batch_size: int, counts: Counter):
+    while True:
+        async with async_session_maker() as session:
+            moved = await ArchiveRepository(session).archive_messages(sent_before, batch_size)
+        counts["messages"] += moved
+        if moved < batch_size:
+            return
+        await asyncio.sleep(BATCH_PAUSE)
+
+
+async def run_retention(now: Optional[datetime] = None) -> dict[str, int]:
+    """
+    Apply the retention policies; returns rows completed / moved per table.
+    `now` is UTC; visit times are compared on the local clock.
+    """
+    now = now or datetime.utcnow()
+    local_now = utc_to_local(now)
+    batch_size = settings.retention_batch_size
+    counts: Counter = Counter()
+    started = datetime.utcnow()
+
+    await _complete_past(local_now - COMPLETE_AFTER, batch_size, counts)
+    # Bookings first: their messages go with them, whatever their age
+    await _archive_bookings(local_now - timedelta(days=settings.retention_bookings_days), batch_size, counts)
+    await _archive_messages(now - timedelta(days=settings.retention_messages_days), batch_size, counts)
+
+    for table, count in counts.items():
+        if count:
+            retention_rows.inc(table, amount=count)
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    logger.info(
+        f"Retention: {counts['bookings_completed']} bookings completed, {counts['bookings']} bookings "
+        f"and {counts['messages']} messages archived in {elapsed:.1f}s"
+    )
+    return dict(counts)
+
+
+async def _cli() -> int:
+    from database import init_db
+
+    await init_db()
+    counts = await run_retention()
+    print(", ".join(f"{name}: {count}" for name, count in sorted(counts.items()) if count) or "nothing to do")
+    return 0
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_cli()))
+
+
+if __name__ == "__main__":
+    main()
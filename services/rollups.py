@@ -0,0 +1,130 @@
+"""
+Daily booking figures for the admin channel and /stats.
+
+`daily_rollups` holds, per visit day and service, the number of bookings
+and cancellations, the revenue of the bookings that are not cancelled
+and the ratings. BookingRepository updates the rows with every booking
+write (webhook, sync, cancellation, rating) in the same transaction, so
+a report over any range reads a few rows instead of scanning bookings,
+and archived bookings stay counted.
+
+A digest of today's figures is posted to SUPPORT_CHANNEL_ID every day at
+DAILY_DIGEST_HOUR by the leader; admins get any range with /stats. From
+the command line:
+
+    python -m services.rollups                          # today
+    python -m services.rollups 01.10.2026 18.10.2026
+"""
+import asyncio
+import logging
+import sys
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+
+from aiogram import Bot
+
+from config import settings
+from database import async_session_maker
+from database.models import DailyRollup
+from database.repository import RollupRepository
+from services.money import format_amount
+from services.telegram_sender import telegram_sender, Priority
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = "%d.%m.%Y"
+# Longest range /stats accepts, keeps the reply within one message
+MAX_RANGE_DAYS = 366
+
+
+def parse_range(args: Optional[str]) -> tuple[date, date]:
+    """
+    "" -> today, "01.10.2026" -> that day, "01.10.2026 18.10.2026" -> the
+    range. Raises ValueError on anything else.
+    """
+    parts = (args or "").split()
+    if len(parts) > 2:
+        raise ValueError("expected at most two dates")
+    days = [datetime.strptime(part, DATE_FORMAT).date() for part in parts] or [date.today()]
+    since, until = days[0], days[-1]
+    if since > until:
+        since, until = until, since
+    if (until - since).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"range longer than {MAX_RANGE_DAYS} days")
+    return since, until
+
+
+async def load_rollups(since: date, until: date) -> list[DailyRollup]:
+    async with async_session_maker() as session:
+        return await RollupRepository(session).get_range(since, until)
+
+
+def _figures(bookings: int, cancellations: int, revenue: Decimal, rating_sum: int, rating_count: int) -> str:
+    line = f"Записей: {bookings} · отмен: {cancellations} · выручка: {format_amount(revenue)}"
+    if rating_count:
+        line += f" · ⭐ {rating_sum / rating_count:.1f} ({rating_count})"
+    return line
+
+
+def format_rollups(rollups: list[DailyRollup], since: date, until: date) -> str:
+    """Figures per service and in total over the range"""
+    period = since.strftime(DATE_FORMAT)
+    if until != since:
+        period += f" — {until.strftime(DATE_FORMAT)}"
+    text = f"📊 Итоги за {period}\n\n"
+    if not rollups:
+        return text + "Записей нет"
+
+    by_service = defaultdict(lambda: [0, 0, Decimal(0), 0, 0])
+    for rollup in rollups:
+        figures = by_service[rollup.service_name]
+        figures[0] += rollup.bookings
+        figures[1] += rollup.cancellations
+        figures[2] += rollup.revenue
+        figures[3] += rollup.rating_sum
+        figures[4] += rollup.rating_count
+
+    for service_name, figures in sorted(by_service.items()):
+        text += f"🎯 {service_name}\n{_figures(*figures)}\n\n"
+    totals = [sum(figures[i] for figures in by_service.values()) for i in range(5)]
+    text += f"Всего\n{_figures(*totals)}"
+    return text
+
+
+async def send_daily_digest(bot: Bot):
+    """Post today's figures to the admin channel"""
+    if not settings.support_channel_id:
+        return
+    today = date.today()
+    rollups = await load_rollups(today, today)
+    try:
+        await telegram_sender.send_message(
+            bot, int(settings.support_channel_id), format_rollups(rollups, today, today), priority=Priority.SERVICE
+        )
+        logger.info(f"Daily digest for {today} sent to {settings.support_channel_id}")
+    except Exception as e:
+        logger.error(f"Failed to send the daily digest: {e}")
+
+
+async def _cli(args: list[str]) -> int:
+    from database import init_db
+
+    try:
+        since, until = parse_range(" ".join(args))
+    except ValueError as e:
+        print(f"Expected [DD.MM.YYYY [DD.MM.YYYY]]: {e}")
+        return 2
+    await init_db()
+    print(format_rollups(await load_rollups(since, until), since, until))
+    return 0
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_cli(sys.argv[1:])))
+
+
+if __name__ == "__main__":
+    main()
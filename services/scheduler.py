@@ -1,69 +1,158 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from aiogram import Bot
 from datetime import datetime, timedelta
-from typing import Optional
+from config import settings
+from services.reminder_sweeper import sweep, SWEEP_INTERVAL
+from services.broadcast import broadcast_runner
+from services.bukza_sync import sync_bookings
+from services.retention import run_retention
+from services.rollups import send_daily_digest
 import logging
 
 logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
 
+SWEEPER_JOB_ID = "reminder_sweeper"
+BROADCAST_JOB_ID = "broadcasts"
+BROADCAST_POLL_INTERVAL = 30
+BUKZA_SYNC_JOB_ID = "bukza_sync"
+RETENTION_JOB_ID = "retention"
+# Leave the busy first minutes after a restart to the sweeper and the sync
+RETENTION_START_DELAY = timedelta(minutes=5)
+DAILY_DIGEST_JOB_ID = "daily_digest"
 
-async def schedule_reminder(booking_id: int, booking_datetime: datetime, callback):
-    """Schedule a reminder 24 hours before booking"""
-    reminder_time = booking_datetime - timedelta(hours=24)
-    
-    if reminder_time > datetime.now():
-        job_id = f"reminder_{booking_id}"
-        scheduler.add_job(
-            callback,
-            trigger=DateTrigger(run_date=reminder_time),
-            args=[booking_id],
-            id=job_id,
-            replace_existing=True
-        )
-        logger.info(f"Scheduled reminder for booking {booking_id} at {reminder_time}")
-
-
-async def schedule_feedback_request(
-    booking_id: int,
-    booking_datetime: datetime,
-    duration_minutes: int,
-    callback
-):
-    """Schedule feedback request after booking completion"""
-    feedback_time = booking_datetime + timedelta(minutes=duration_minutes)
-    
-    if feedback_time > datetime.now():
-        job_id = f"feedback_{booking_id}"
-        scheduler.add_job(
-            callback,
-            trigger=DateTrigger(run_date=feedback_time),
-            args=[booking_id],
-            id=job_id,
-            replace_existing=True
-        )
-        logger.info(f"Scheduled feedback request for booking {booking_id} at {feedback_time}")
-
-
-async def cancel_scheduled_tasks(booking_id: int):
-    """Cancel all scheduled tasks for a booking"""
-    reminder_job_id = f"reminder_{booking_id}"
-    feedback_job_id = f"feedback_{booking_id}"
-    
-    for job_id in [reminder_job_id, feedback_job_id]:
-        try:
-            scheduler.remove_job(job_id)
-            logger.info(f"Cancelled scheduled task {job_id}")
-        except Exception as e:
-            logger.debug(f"Job {job_id} not found or already executed: {e}")
-
-
-def start_scheduler():
-    """Start the scheduler"""
+
+def schedule_sweeper(bot: Bot):
+    """
+    Register the periodic reminder/feedback sweep.
+
+    Reminders are derived from the bookings and messages tables on every
+    sweep, so nothing is lost on restart: bookings that came due while the
+    process was down are picked up by the first sweep.
+    """
+    scheduler.add_job(
+        sweep,
+        trigger=IntervalTrigger(seconds=int(SWEEP_INTERVAL.total_seconds())),
+        args=[bot],
+        id=SWEEPER_JOB_ID,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now()
+    )
+    logger.info(f"Reminder sweeper scheduled every {SWEEP_INTERVAL}")
+
+
+def schedule_broadcasts(bot: Bot):
+    """
+    Register the job that runs queued broadcasts.
+
+    A broadcast interrupted by a restart is still RUNNING in the database
+    and is resumed by the first run after its cursor.
+    """
+    scheduler.add_job(
+        broadcast_runner.run_pending,
+        trigger=IntervalTrigger(seconds=BROADCAST_POLL_INTERVAL),
+        args=[bot],
+        id=BROADCAST_JOB_ID,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now()
+    )
+    logger.info(f"Broadcasts checked every {BROADCAST_POLL_INTERVAL}s")
+
+
+def schedule_bukza_sync():
+    """
+    Register the periodic reconciliation pull from the Bukza API.
+
+    The first run starts with the leader, so bookings whose webhooks were
+    lost while the bot was down are repaired right after a restart.
+    """
+    if settings.bukza_sync_interval <= 0:
+        logger.info("Bukza sync disabled")
+        return
+    scheduler.add_job(
+        sync_bookings,
+        trigger=IntervalTrigger(seconds=settings.bukza_sync_interval),
+        id=BUKZA_SYNC_JOB_ID,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now()
+    )
+    logger.info(f"Bukza sync scheduled every {settings.bukza_sync_interval}s")
+
+
+def schedule_retention():
+    """Register the periodic archival of old messages and bookings"""
+    if settings.retention_interval <= 0:
+        logger.info("Retention disabled")
+        return
+    scheduler.add_job(
+        run_retention,
+        trigger=IntervalTrigger(seconds=settings.retention_interval),
+        id=RETENTION_JOB_ID,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now() + RETENTION_START_DELAY
+    )
+    logger.info(f"Retention scheduled every {settings.retention_interval}s")
+
+
+def schedule_daily_digest(bot: Bot):
+    """Register the daily post of the day's booking figures to the support channel"""
+    if settings.daily_digest_hour < 0 or not settings.support_channel_id:
+        logger.info("Daily digest disabled")
+        return
+    scheduler.add_job(
+        send_daily_digest,
+        trigger=CronTrigger(hour=settings.daily_digest_hour),
+        args=[bot],
+        id=DAILY_DIGEST_JOB_ID,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    logger.info(f"Daily digest scheduled at {settings.daily_digest_hour}:00")
+
+
+def trigger_sweep():
+    """Run the reminder sweep now, e.g. after bookings were linked to a new user"""
+    if scheduler.get_job(SWEEPER_JOB_ID) is not None:
+        scheduler.modify_job(SWEEPER_JOB_ID, next_run_time=datetime.now())
+
+
+def trigger_broadcasts():
+    """Run the broadcast job now instead of at its next interval"""
+    if scheduler.get_job(BROADCAST_JOB_ID) is not None:
+        scheduler.modify_job(BROADCAST_JOB_ID, next_run_time=datetime.now())
+
+
+def start_scheduler(paused: bool = False):
+    """Start the scheduler (paused schedulers keep jobs but do not run them)"""
     if not scheduler.running:
-        scheduler.start()
-        logger.info("Scheduler started")
+        scheduler.start(paused=paused)
+        logger.info("Scheduler started" + (" (paused)" if paused else ""))
+
+
+def resume_scheduler():
+    """Run scheduled jobs in this process (called when elected leader)"""
+    if scheduler.running:
+        scheduler.resume()
+        logger.info("Scheduler resumed")
+
+
+def pause_scheduler():
+    """Stop running scheduled jobs in this process (leadership lost)"""
+    if scheduler.running:
+        scheduler.pause()
+        logger.info("Scheduler paused")
 
 
 def stop_scheduler():
@@ -0,0 +1,326 @@
+"""
+Central outbound queue for Telegram messages.
+
+All notifications go through `telegram_sender` instead of calling
+`bot.send_message` directly, so Bot API limits are respected in one place:
+a global token bucket, one bucket per private chat and a slower bucket per
+group/channel. Messages are served by priority, so confirmations and
+cancellations overtake reminders and bulk traffic.
+"""
+import asyncio
+import enum
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Optional, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+
+class Priority(enum.IntEnum):
+    """Send lanes, lower value is served first"""
+    TRANSACTIONAL = 0  # booking confirmations and cancellations
+    SERVICE = 1        # admin channel posts, support messages
+    REMINDER = 2       # reminders and feedback requests
+    BULK = 3           # announcements and other marketing traffic
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block_for(self, seconds: float):
+        """Stop handing out tokens for `seconds` (used for retry_after)"""
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+        self.updated_at = now
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+@dataclass
+class _SendJob:
+    bot: Bot
+    chat_id: ChatId
+    text: str
+    kwargs: dict
+    priority: Priority
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+def _is_channel(chat_id: ChatId) -> bool:
+    """Groups and channels have negative ids (or are addressed by @username)"""
+    if isinstance(chat_id, str):
+        return chat_id.startswith(('@', '-'))
+    return chat_id < 0
+
+
+class TelegramSender:
+    """Rate-limited priority queue in front of `Bot.send_message`"""
+
+    MAX_BUCKETS = 10_000
+
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        channel_rate_per_minute: float,
+        max_in_flight: int = 10,
+        max_retries: int = 5
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.channel_rate = channel_rate_per_minute / 60
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._buckets: dict[ChatId, TokenBucket] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._max_in_flight = max_in_flight
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._in_flight: set[asyncio.Task] = set()
+        # Jobs waiting for their chat bucket, by the timer that requeues them
+        self._parked: dict[asyncio.TimerHandle, _SendJob] = {}
+
+        # Metrics
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._send_latency: deque[float] = deque(maxlen=1024)
+        self._queue_wait: deque[float] = deque(maxlen=1024)
+
+    def set_process_share(self, processes: int):
+        """Split the global limit between `processes` processes sending for the same bot"""
+        rate = self.global_rate / max(1, processes)
+        self._global = TokenBucket(rate, max(1.0, rate))
+
+    @property
+    def running(self) -> bool:
+        return self._dispatcher is not None and not self._dispatcher.done()
+
+    def start(self):
+        """Start the dispatcher task on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._slots = asyncio.Semaphore(self._max_in_flight)
+        self._dispatcher = asyncio.create_task(self._run(), name="telegram-sender")
+        logger.info("Telegram sender started")
+
+    async def stop(self, timeout: float = 10.0):
+        """Drain queued messages (up to `timeout` seconds) and stop"""
+        if not self.running:
+            return
+        deadline = time.monotonic() + timeout
+        while self.queue_depth() or self._in_flight:
+            if time.monotonic() >= deadline:
+                logger.warning(f"Telegram sender stopped with {self.queue_depth()} messages queued")
+                break
+            await asyncio.sleep(0.1)
+
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+
+        for handle in self._parked:
+            handle.cancel()
+        leftover = list(self._parked.values())
+        self._parked.clear()
+        while not self._queue.empty():
+            _, _, job = self._queue.get_nowait()
+            leftover.append(job)
+        for job in leftover:
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Telegram sender stopped"))
+        logger.info("Telegram sender stopped")
+
+    def enqueue(
+        self,
+        bot: Bot,
+        chat_id: ChatId,
+        text: str,
+        priority: Priority = Priority.TRANSACTIONAL,
+        **kwargs: Any
+    ) -> asyncio.Future:
+        """Queue a message and return a future resolved with the sent Message"""
+        if not self.running:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        job = _SendJob(bot, chat_id, text, kwargs, priority, future)
+        self._queue.put_nowait((priority, next(self._seq), job))
+        return future
+
+    async def send_message(
+        self,
+        bot: Bot,
+        chat_id: ChatId,
+        text: str,
+        priority: Priority = Priority.TRANSACTIONAL,
+        **kwargs: Any
+    ) -> Message:
+        """Queue a message and wait until it is delivered (or fails)"""
+        return await self.enqueue(bot, chat_id, text, priority, **kwargs)
+
+    def queue_depth(self) -> int:
+        queued = self._queue.qsize() if self._queue else 0
+        return queued + len(self._parked)
+
+    def stats(self) -> dict:
+        """Queue depth, throughput counters and latency percentiles (ms)"""
+        return {
+            "queue_depth": self.queue_depth(),
+            "in_flight": len(self._in_flight),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "send_latency_ms": _percentiles(self._send_latency),
+            "queue_wait_ms": _percentiles(self._queue_wait),
+        }
+
+    def _bucket_for(self, chat_id: ChatId) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_BUCKETS:
+                self._prune_buckets()
+            if _is_channel(chat_id):
+                bucket = TokenBucket(self.channel_rate, 3)
+            else:
+                bucket = TokenBucket(self.chat_rate, 1)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_buckets(self):
+        now = time.monotonic()
+        for chat_id in [c for c, b in self._buckets.items() if b.is_idle(now)]:
+            del self._buckets[chat_id]
+
+    def _park(self, job: _SendJob, delay: float, seq: int):
+        """Put a job aside until its chat bucket has a token again"""
+        if not self.running:
+            # A send still in flight when stop() gave up: nothing would requeue it
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Telegram sender stopped"))
+            return
+
+        def requeue():
+            del self._parked[handle]
+            self._queue.put_nowait((job.priority, seq, job))
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._parked[handle] = job
+
+    async def _run(self):
+        while True:
+            priority, seq, job = await self._queue.get()
+            if job.future.done():
+                continue
+
+            chat_bucket = self._bucket_for(job.chat_id)
+            wait = chat_bucket.delay(time.monotonic())
+            if wait > 0:
+                self._park(job, wait, seq)
+                continue
+
+            wait = self._global.delay(time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            now = time.monotonic()
+            self._global.consume(now)
+            chat_bucket.consume(now)
+
+            await self._slots.acquire()
+            task = asyncio.create_task(self._deliver(job, seq))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _deliver(self, job: _SendJob, seq: int):
+        started = time.monotonic()
+        if job.attempts == 0:
+            self._queue_wait.append(started - job.enqueued_at)
+        try:
+            result = await job.bot.send_message(job.chat_id, job.text, **job.kwargs)
+        except TelegramRetryAfter as e:
+            job.attempts += 1
+            self._bucket_for(job.chat_id).block_for(e.retry_after)
+            if job.attempts > self.max_retries:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.retried += 1
+                logger.warning(
+                    f"Flood control for chat {job.chat_id}: retry in {e.retry_after}s "
+                    f"(attempt {job.attempts})"
+                )
+                self._park(job, e.retry_after, seq)
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            self._send_latency.append(time.monotonic() - started)
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._slots.release()
+
+
+def _percentiles(samples) -> dict:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        name: round(ordered[min(last, int(last * q))] * 1000, 2)
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+    }
+
+
+telegram_sender = TelegramSender(
+    global_rate=settings.telegram_global_rate,
+    chat_rate=settings.telegram_chat_rate,
+    channel_rate_per_minute=settings.telegram_channel_rate_per_minute
+)
@@ -0,0 +1,163 @@
+"""
+Concurrent, per-chat-ordered processing of Telegram webhook updates.
+
+`handle_telegram_webhook` hands an update to `submit()` and acknowledges
+it right away. Updates of the same chat are processed strictly in arrival
+order by one task per chat; different chats run in parallel, with at most
+`max_in_flight` handlers executing at a time. Updates waiting for a slot
+form the backlog; once it reaches `max_backlog` new updates are refused
+and Telegram redelivers them later.
+
+For an update expected to get a static reply in a chat with nothing else
+queued, the webhook handler waits up to `telegram_inline_reply_timeout`
+for the result and returns it in the webhook response body (see
+handlers/static_replies.py). A method returned after the webhook has been
+answered is sent through the bot instead.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Hashable, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update: Update) -> Hashable:
+    """Chat the update belongs to; updates without one are not ordered"""
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        # Callback queries carry the chat on the message they belong to
+        chat = getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    return ("update", update.update_id)
+
+
+class UpdateDispatcher:
+    def __init__(self, max_in_flight: int = 64, max_backlog: int = 10000, stop_timeout: float = 10.0):
+        self.max_in_flight = max_in_flight
+        self.max_backlog = max_backlog
+        self.stop_timeout = stop_timeout
+
+        self._bot: Optional[Bot] = None
+        self._dp: Optional[Dispatcher] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._chats: Dict[Hashable, Deque[Tuple[Update, asyncio.Future]]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+        self.backlog = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self, bot: Bot, dp: Dispatcher):
+        self._bot = bot
+        self._dp = dp
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        logger.info(f"Update dispatcher started, up to {self.max_in_flight} updates in flight")
+
+    async def stop(self):
+        """Let queued updates finish within `stop_timeout`, then cancel the rest"""
+        if self._tasks:
+            done, pending = await asyncio.wait(set(self._tasks), timeout=self.stop_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if pending:
+                logger.warning(f"Update dispatcher stopped with {len(pending)} chats unfinished")
+        self._chats.clear()
+        logger.info("Update dispatcher stopped")
+
+    def stats(self) -> dict:
+        return {
+            "backlog": self.backlog,
+            "in_flight": self.in_flight,
+            "chats": len(self._chats),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def is_busy(self, update: Update) -> bool:
+        """Whether earlier updates of the same chat are queued or running"""
+        return chat_key(update) in self._chats
+
+    def submit(self, update: Update) -> Optional[asyncio.Future]:
+        """
+        Queue an update behind earlier updates of its chat.
+
+        Returns a future resolved with the handler result, or None if the
+        backlog is full. Cancelling the future (the webhook was answered
+        without the result) hands a returned Telegram method to the bot.
+        """
+        if self.backlog >= self.max_backlog:
+            self.rejected += 1
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        key = chat_key(update)
+        queue = self._chats.get(key)
+        self.backlog += 1
+        if queue is not None:
+            queue.append((update, future))
+            return future
+
+        self._chats[key] = deque([(update, future)])
+        task = asyncio.create_task(self._run_chat(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return future
+
+    async def _run_chat(self, key: Hashable):
+        queue = self._chats[key]
+        try:
+            while queue:
+                update, future = queue[0]
+                async with self._semaphore:
+                    self.backlog -= 1
+                    self.in_flight += 1
+                    try:
+                        await self._process(update, future)
+                    finally:
+                        self.in_flight -= 1
+                        queue.popleft()
+        finally:
+            self._chats.pop(key, None)
+            # Updates still queued when the task was cancelled
+            self.backlog -= len(queue)
+            for _, future in queue:
+                future.cancel()
+
+    async def _process(self, update: Update, future: asyncio.Future):
+        try:
+            result = await self._dp.feed_update(self._bot, update)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Error processing Telegram update {update.update_id}: {e}", exc_info=True)
+            if not future.done():
+                future.set_result(None)
+            return
+
+        self.processed += 1
+        if not future.done():
+            future.set_result(result)
+        elif isinstance(result, TelegramMethod):
+            # The webhook has already been answered
+            await self._dp.silent_call_request(bot=self._bot, result=result)
+
+
+update_dispatcher = UpdateDispatcher(
+    max_in_flight=settings.telegram_updates_in_flight,
+    max_backlog=settings.telegram_updates_backlog
+)
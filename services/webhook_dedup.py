@@ -0,0 +1,77 @@
+"""
+De-duplication of retried Bukza webhooks.
+
+A webhook is identified by (booking code, `message` type, payload hash).
+A bounded in-process LRU answers repeated deliveries without touching the
+database; the unique constraint on `webhook_inbox` is the source of truth,
+so a duplicate that misses the LRU (another worker, a restart) is still
+rejected by the inbox insert and never processed twice.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+
+from config import settings
+
+DedupKey = tuple[str, str, str]
+
+
+def payload_fingerprint(payload: dict) -> str:
+    """Stable hash of a webhook payload (key order does not matter)"""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LRUSet:
+    """Set with a size limit that forgets the least recently seen keys"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        if key in self._items:
+            self._items.move_to_end(key)
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, key):
+        self._items[key] = None
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+
+class WebhookDeduplicator:
+    def __init__(self, maxsize: int):
+        self._seen = LRUSet(maxsize)
+        self.cache_hits = 0
+        self.db_hits = 0
+
+    def key(self, booking_code: str, message_type: str, payload: dict) -> DedupKey:
+        return booking_code, message_type, payload_fingerprint(payload)
+
+    def is_duplicate(self, key: DedupKey) -> bool:
+        """Hot path: answer from memory only"""
+        if key in self._seen:
+            self.cache_hits += 1
+            return True
+        return False
+
+    def remember(self, key: DedupKey, duplicate_in_db: bool = False):
+        if duplicate_in_db:
+            self.db_hits += 1
+        self._seen.add(key)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._seen),
+            "cache_hits": self.cache_hits,
+            "db_hits": self.db_hits,
+        }
+
+
+webhook_deduplicator = WebhookDeduplicator(maxsize=settings.webhook_dedup_cache_size)
@@ -0,0 +1,208 @@
+"""
+Durable inbox for Bukza webhooks.
+
+The HTTP endpoint only validates a webhook and stores it with a single
+insert; a pool of background workers drains the inbox. Events for the same
+booking code are processed strictly in arrival order (a `cancel` never
+overtakes its `newrega`), events for different bookings run concurrently.
+Failed events are retried with exponential backoff and end up in the DEAD
+state after `max_attempts`.
+
+A claimed event is PROCESSING with `locked_at` set. The process holding
+it renews `locked_at` while the event waits or runs (a handler may sit
+behind a long Telegram send queue), so only events of a process that
+died are released as stale and processed again.
+"""
+import asyncio
+import json
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot
+
+from database import async_session_maker
+from database.models import WebhookInbox
+from database.repository import InboxRepository
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+EventHandler = Callable[[Bot, dict], Awaitable[None]]
+
+
+class InboxProcessor:
+    def __init__(
+        self,
+        workers: int,
+        batch_size: int = 50,
+        poll_interval: float = 1.0,
+        max_attempts: int = 8,
+        base_backoff: float = 5.0,
+        max_backoff: float = 3600.0,
+        stale_after: timedelta = timedelta(minutes=5)
+    ):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.stale_after = stale_after
+
+        self._bot: Optional[Bot] = None
+        self._handler: Optional[EventHandler] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._active_codes: set[str] = set()
+        # Ids of the events claimed by this process and not finished yet
+        self._claimed: set[int] = set()
+
+        self.processed = 0
+        self.failed = 0
+        self.dead = 0
+
+    async def enqueue(
+        self,
+        booking_code: str,
+        message_type: str,
+        payload: dict,
+        payload_hash: str
+    ) -> Optional[int]:
+        """
+        Store a webhook in the inbox (single insert) and wake the workers.
+        Returns None if the same webhook has already been stored.
+        """
+        async with async_session_maker() as session:
+            event_id = await InboxRepository(session).add(
+                booking_code, message_type, json.dumps(payload, ensure_ascii=False), payload_hash
+            )
+        if event_id is not None:
+            self.notify()
+        return event_id
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, bot: Bot, handler: EventHandler):
+        if self._tasks:
+            return
+        self._bot = bot
+        self._handler = handler
+        self._wakeup = asyncio.Event()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._dispatch_loop(), name="inbox-dispatcher")]
+        self._tasks += [
+            asyncio.create_task(self._worker(), name=f"inbox-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Webhook inbox started with {self.workers} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._claimed.clear()
+        # Events that were claimed but not processed are picked up again
+        # by the next start once they are considered stale.
+        logger.info("Webhook inbox stopped")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "active": len(self._active_codes),
+            "processed": self.processed,
+            "failed": self.failed,
+            "dead": self.dead,
+        }
+
+    def _backoff(self, attempts: int) -> timedelta:
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    async def _dispatch_loop(self):
+        last_stale_check = datetime.min
+        last_renewal = datetime.utcnow()
+        while True:
+            try:
+                now = datetime.utcnow()
+                async with async_session_maker() as session:
+                    repo = InboxRepository(session)
+                    # Well within stale_after, so live claims are never released
+                    if now - last_renewal > self.stale_after / 3:
+                        await repo.renew_claims(list(self._claimed), now)
+                        last_renewal = now
+                    if now - last_stale_check > self.stale_after:
+                        released = await repo.release_stale(now - self.stale_after)
+                        if released:
+                            logger.warning(f"Released {released} stale inbox events")
+                        last_stale_check = now
+
+                    capacity = self.workers * 2 - self._queue.qsize()
+                    events = []
+                    if capacity > 0:
+                        events = await repo.claim_ready(
+                            now, min(capacity, self.batch_size), self._active_codes
+                        )
+
+                for event in events:
+                    self._active_codes.add(event.booking_code)
+                    self._claimed.add(event.id)
+                    self._queue.put_nowait(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Inbox dispatcher error: {e}", exc_info=True)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _worker(self):
+        while True:
+            event: WebhookInbox = await self._queue.get()
+            try:
+                await self._process(event)
+            finally:
+                self._active_codes.discard(event.booking_code)
+                self._claimed.discard(event.id)
+                self._queue.task_done()
+                # The next event of this booking may be ready now
+                self.notify()
+
+    async def _process(self, event: WebhookInbox):
+        try:
+            await self._handler(self._bot, json.loads(event.payload))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            if event.attempts >= self.max_attempts:
+                self.dead += 1
+                next_attempt_at = None
+                logger.error(
+                    f"Inbox event {event.id} ({event.message_type} {event.booking_code}) "
+                    f"moved to DEAD after {event.attempts} attempts: {e}",
+                    exc_info=True
+                )
+            else:
+                next_attempt_at = datetime.utcnow() + self._backoff(event.attempts)
+                logger.warning(
+                    f"Inbox event {event.id} failed (attempt {event.attempts}), "
+                    f"retry at {next_attempt_at}: {e}"
+                )
+            async with async_session_maker() as session:
+                await InboxRepository(session).mark_failed(event.id, repr(e), next_attempt_at)
+        else:
+            self.processed += 1
+            async with async_session_maker() as session:
+                await InboxRepository(session).mark_done(event.id)
+
+
+inbox_processor = InboxProcessor(workers=settings.inbox_workers)
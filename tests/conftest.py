@@ -0,0 +1,46 @@
+"""
+Tests run against a throwaway SQLite database. The environment is set
+here, before the application modules read the settings.
+"""
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bot-tests-"), "test.db")
+os.environ["DATABASE_PROFILE"] = "default"
+for name, value in {
+    "BOT_TOKEN": "123456:TEST",
+    "BUKZA_API_URL": "http://127.0.0.1:9",
+    "BUKZA_API_KEY": "test",
+    "WEBHOOK_HOST": "localhost",
+    "WEBHOOK_PATH": "/webhook/bukza",
+    "LINK_2GIS": "https://2gis.ru",
+    "LINK_YANDEX_MAPS": "https://yandex.ru/maps",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def database():
+    """Migrated database, emptied again after the test"""
+    from database import engine, init_db
+    from database.cache import user_cache
+    from database.models import Base
+
+    async def prepare():
+        await init_db()
+        await engine.dispose()
+
+    async def clean():
+        async with engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                await conn.execute(table.delete())
+        await engine.dispose()
+
+    asyncio.run(prepare())
+    user_cache.clear()
+    yield
+    asyncio.run(clean())
+    user_cache.clear()
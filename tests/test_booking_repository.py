@@ -0,0 +1,92 @@
+"""Booking upserts and their daily rollups (database/repository.py)"""
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from database import async_session_maker, engine
+from database.models import Booking, DailyRollup, User
+from database.repository import BookingRepository
+
+VISIT = datetime(2030, 12, 1, 10, 0)
+
+
+def run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+async def upsert(code: str, user_id: int = None, booking_datetime: datetime = VISIT) -> Booking:
+    async with async_session_maker() as session:
+        return await BookingRepository(session).upsert(
+            bukza_booking_id=code,
+            service_name="VR Арена",
+            booking_datetime=booking_datetime,
+            duration_minutes=60,
+            user_id=user_id,
+            total_sum=Decimal("1500")
+        )
+
+
+async def upsert_many(*rows: tuple[str, datetime]) -> dict[str, bool]:
+    async with async_session_maker() as session:
+        return await BookingRepository(session).upsert_many([
+            {"bukza_booking_id": code, "service_name": "VR Арена", "booking_datetime": visit,
+             "duration_minutes": 60, "total_sum": Decimal("1500")}
+            for code, visit in rows
+        ])
+
+
+async def add_users(count: int) -> list[int]:
+    async with async_session_maker() as session:
+        users = [User(telegram_id=100 + i, phone_number=f"+7900000000{i}") for i in range(count)]
+        session.add_all(users)
+        await session.commit()
+        return [user.id for user in users]
+
+
+async def rollups() -> dict[date, tuple[int, Decimal]]:
+    async with async_session_maker() as session:
+        result = await session.execute(select(DailyRollup))
+        return {r.day: (r.bookings, r.revenue) for r in result.scalars() if r.bookings}
+
+
+async def stored_bookings() -> list[Booking]:
+    async with async_session_maker() as session:
+        return list((await session.execute(select(Booking))).scalars())
+
+
+def test_concurrent_deliveries_insert_and_count_once(database):
+    async def scenario():
+        return await asyncio.gather(*[upsert("A1") for _ in range(5)])
+
+    bookings = run(scenario())
+
+    assert len({booking.id for booking in bookings}) == 1
+    assert [booking.bukza_booking_id for booking in run(stored_bookings())] == ["A1"]
+    assert run(rollups()) == {VISIT.date(): (1, Decimal("1500"))}
+
+
+def test_upsert_links_the_user_on_conflict_but_never_replaces_one(database):
+    first, second = run(add_users(2))
+
+    assert run(upsert("A1")).user_id is None
+    assert run(upsert("A1", user_id=first)).user_id == first
+    assert run(upsert("A1", user_id=second)).user_id == first
+    assert run(rollups()) == {VISIT.date(): (1, Decimal("1500"))}
+
+
+def test_upsert_many_reports_inserted_and_changed_bookings(database):
+    moved = datetime(2030, 12, 2, 10, 0)
+
+    assert run(upsert_many(("A1", VISIT), ("B2", VISIT))) == {"A1": True, "B2": True}
+    # A1 unchanged, B2 moved to the next day, C3 new
+    assert run(upsert_many(("A1", VISIT), ("B2", moved), ("C3", VISIT))) == {"B2": False, "C3": True}
+    assert run(upsert_many(("A1", VISIT), ("B2", moved))) == {}
+
+    assert run(rollups()) == {VISIT.date(): (2, Decimal("3000")), moved.date(): (1, Decimal("1500"))}
@@ -0,0 +1,190 @@
+"""Reconciliation sync (services/bukza_sync.py) against the local Bukza stand-in"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from benchmarks.fake_bukza import FakeBukzaAPI
+from config import settings
+from database import async_session_maker, engine
+from database.models import Booking, BookingStatus, DailyRollup, Message
+from database.repository import ArchiveRepository, BookingRepository, SyncStateRepository, UserRepository
+from handlers.webhook_handlers import process_bukza_event
+from services import bukza_sync
+from services.bukza_client import bukza_client
+from services.telegram_sender import telegram_sender
+
+PHONE = "+79000000001"
+
+
+def item(code: str, start: str = "01.12.2030 10:00", end: str = "01.12.2030 11:00") -> dict:
+    """A booking in the format of the changes feed (webhook fields)"""
+    return {
+        "code": code, "resource": "VR Арена", "start": start, "end": end, "name": "Иван",
+        "fields": [{"name": "Телефон", "value": "8" + PHONE[2:]}], "total_sum": "1500",
+    }
+
+
+@pytest.fixture
+def requested_since(monkeypatch):
+    """`since` of every changes request; no Telegram sends allowed"""
+    requested = []
+    iter_changed_bookings = bukza_client.iter_changed_bookings
+
+    def recording(since, page_size):
+        requested.append(since)
+        return iter_changed_bookings(since, page_size)
+
+    def no_sends(*args, **kwargs):
+        raise AssertionError("the sync must not notify clients")
+
+    monkeypatch.setattr(bukza_client, "iter_changed_bookings", recording)
+    monkeypatch.setattr(telegram_sender, "enqueue", no_sends)
+    monkeypatch.setattr(settings, "bukza_sync_page_size", 2)
+    return requested
+
+
+def run(scenario):
+    """Run `scenario(api)` with the client pointed at a fresh fake Bukza API"""
+    async def main():
+        api = FakeBukzaAPI()
+        await api.start()
+        api_url, bukza_client.api_url = bukza_client.api_url, api.url
+        try:
+            await scenario(api)
+        finally:
+            bukza_client.api_url = api_url
+            await bukza_client.close()
+            await api.stop()
+            await engine.dispose()
+    asyncio.run(main())
+
+
+async def stored_bookings() -> dict[str, Booking]:
+    async with async_session_maker() as session:
+        return {b.bukza_booking_id: b for b in (await session.execute(select(Booking))).scalars()}
+
+
+async def saved_cursor() -> datetime:
+    async with async_session_maker() as session:
+        return await SyncStateRepository(session).get_cursor(bukza_sync.SYNC_NAME)
+
+
+def latest_change(api: FakeBukzaAPI) -> datetime:
+    return max(bukza_sync._parse_updated_at(b["updated_at"]) for b in api.bookings.values())
+
+
+def test_cursor_advances_and_next_run_overlaps(database, requested_since):
+    async def scenario(api):
+        for i in range(5):
+            api.put(item(f"N{i}"))
+
+        counts = await bukza_sync.sync_bookings()
+        assert counts["pages"] == 3
+        assert counts["inserted"] == 5
+        cursor = await saved_cursor()
+        assert cursor == latest_change(api)
+
+        # Nothing changed: the overlap window is read again and applied as a no-op
+        counts = await bukza_sync.sync_bookings()
+        assert requested_since[-1] == cursor - bukza_sync.SYNC_OVERLAP
+        assert counts.get("inserted", 0) == counts.get("updated", 0) == 0
+        assert await saved_cursor() == cursor
+
+        api.put(item("N5"))
+        await bukza_sync.sync_bookings()
+        assert await saved_cursor() == latest_change(api) > cursor
+
+    run(scenario)
+
+
+def test_new_and_changed_bookings_are_upserted(database, requested_since):
+    async def scenario(api):
+        async with async_session_maker() as session:
+            user = await UserRepository(session).create(111, PHONE)
+            bookings = BookingRepository(session)
+            await bookings.create("MOVED", "VR Арена", datetime(2030, 12, 1, 10), 60, client_phone=PHONE)
+            await bookings.create("CANCELLED", "VR Арена", datetime(2030, 12, 2, 10), 60, client_phone=PHONE)
+
+        api.put(item("MOVED", start="03.12.2030 18:00", end="03.12.2030 19:30"))
+        api.put(item("CANCELLED", start="02.12.2030 10:00", end="02.12.2030 11:00"))
+        api.cancel("CANCELLED")
+        api.put(item("NEW"))
+
+        counts = await bukza_sync.sync_bookings()
+        assert counts["inserted"] == 1
+        assert counts["updated"] == 2
+
+        stored = await stored_bookings()
+        assert stored["MOVED"].booking_datetime == datetime(2030, 12, 3, 18)
+        assert stored["MOVED"].duration_minutes == 90
+        assert stored["CANCELLED"].status == BookingStatus.CANCELLED
+        assert stored["NEW"].status == BookingStatus.ACTIVE
+        # Linked by the canonical phone
+        assert stored["NEW"].user_id == user.id
+        assert stored["NEW"].client_phone == PHONE
+
+    run(scenario)
+
+
+def test_archived_bookings_are_not_inserted_again(database, requested_since):
+    async def scenario(api):
+        async with async_session_maker() as session:
+            bookings = BookingRepository(session)
+            booking = await bookings.create("OLD", "VR Арена", datetime(2020, 6, 1, 10), 60, client_phone=PHONE)
+            await bookings.update_status(booking.id, BookingStatus.COMPLETED)
+            assert await ArchiveRepository(session).archive_bookings(datetime(2021, 1, 1), 100) == (1, 0)
+
+        api.put(item("OLD", start="01.06.2020 10:00", end="01.06.2020 12:00"))
+        counts = await bukza_sync.sync_bookings()
+        assert counts.get("inserted", 0) == counts.get("updated", 0) == 0
+
+        assert "OLD" not in await stored_bookings()
+        async with async_session_maker() as session:
+            rollup = await session.get(DailyRollup, (datetime(2020, 6, 1).date(), "VR Арена"))
+        assert rollup.bookings == 1
+
+    run(scenario)
+
+
+def test_archived_bookings_are_ignored_by_webhooks(database, requested_since, monkeypatch):
+    monkeypatch.setattr(settings, "support_channel_id", "-100123")
+
+    async def scenario(api):
+        async with async_session_maker() as session:
+            await UserRepository(session).create(111, PHONE)
+            bookings = BookingRepository(session)
+            booking = await bookings.create("OLD", "VR Арена", datetime(2020, 6, 1, 10), 60, client_phone=PHONE)
+            await bookings.update_status(booking.id, BookingStatus.COMPLETED)
+            await ArchiveRepository(session).archive_bookings(datetime(2021, 1, 1), 100)
+
+        # A late redelivery: nothing stored, counted or sent (enqueue raises)
+        payload = {"query": {"message": "newrega"}, "data": item("OLD", start="01.06.2020 10:00", end="01.06.2020 12:00")}
+        await process_bukza_event(None, payload)
+
+        assert "OLD" not in await stored_bookings()
+        async with async_session_maker() as session:
+            assert await session.scalar(select(func.count()).select_from(Message)) == 0
+            rollup = await session.get(DailyRollup, (datetime(2020, 6, 1).date(), "VR Арена"))
+        assert rollup.bookings == 1
+
+    run(scenario)
+
+
+def test_sync_sends_nothing(database, requested_since):
+    async def scenario(api):
+        async with async_session_maker() as session:
+            await UserRepository(session).create(111, PHONE)
+        for i in range(3):
+            api.put(item(f"N{i}"))
+        api.cancel("N1")
+
+        await bukza_sync.sync_bookings()
+
+        # telegram_sender.enqueue raises if called; no message records either
+        async with async_session_maker() as session:
+            assert await session.scalar(select(func.count()).select_from(Message)) == 0
+        assert len(await stored_bookings()) == 3
+
+    run(scenario)
@@ -0,0 +1,62 @@
+"""Access to the /debug endpoints (handlers/debug_handlers.py)"""
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from config import settings
+from database import sql_instrumentation
+from database.instrumentation import StatementStats
+from handlers.debug_handlers import handle_pool_reset, handle_pool_stats, handle_sql_reset, handle_sql_stats
+
+TOKEN = "s3cret"
+
+
+def request(method: str, path: str, token: str = None) -> int:
+    """Status of one request to an app with the debug routes"""
+    async def main():
+        app = web.Application()
+        app.router.add_get('/debug/sql', handle_sql_stats)
+        app.router.add_post('/debug/sql/reset', handle_sql_reset)
+        app.router.add_get('/debug/pool', handle_pool_stats)
+        app.router.add_post('/debug/pool/reset', handle_pool_reset)
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        async with TestClient(TestServer(app)) as client:
+            response = await client.request(method, path, headers=headers)
+            return response.status
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("path", ["/debug/sql", "/debug/pool"])
+def test_debug_endpoints_do_not_exist_without_a_token(monkeypatch, path):
+    monkeypatch.setattr(settings, "debug_token", None)
+    assert request("GET", path) == 404
+    assert request("GET", path, token="anything") == 404
+
+
+@pytest.mark.parametrize("path", ["/debug/sql", "/debug/pool"])
+@pytest.mark.parametrize("token", [None, "wrong"])
+def test_debug_endpoints_need_the_token(monkeypatch, path, token):
+    monkeypatch.setattr(settings, "debug_token", TOKEN)
+    assert request("GET", path, token=token) == 401
+    assert request("POST", f"{path}/reset", token=token) == 401
+    assert request("GET", path, token=TOKEN) == 200
+
+
+def test_reset_is_a_post(monkeypatch):
+    monkeypatch.setattr(settings, "debug_token", TOKEN)
+    sql_instrumentation.statements["SELECT ?"] = StatementStats()
+
+    assert request("GET", "/debug/sql?reset=1", token=TOKEN) == 200
+    assert "SELECT ?" in sql_instrumentation.statements
+    assert request("GET", "/debug/sql/reset", token=TOKEN) == 405
+
+    assert request("POST", "/debug/sql/reset", token=TOKEN) == 200
+    assert sql_instrumentation.statements == {}
+
+
+def test_pool_reset_is_a_post(monkeypatch):
+    monkeypatch.setattr(settings, "debug_token", TOKEN)
+    assert request("GET", "/debug/pool/reset", token=TOKEN) == 405
+    assert request("POST", "/debug/pool/reset", token=TOKEN) == 200
@@ -0,0 +1,15 @@
+"""Every repository query is served by an index (database/query_plans.py)"""
+import asyncio
+
+from database import engine
+from database.query_plans import check
+
+
+def test_repository_queries_use_indexes(database):
+    async def main():
+        try:
+            return await check()
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(main()) == []
@@ -0,0 +1,72 @@
+"""Due reminders and feedback requests (services/reminder_sweeper.py)"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import async_session_maker, engine
+from database.models import Booking, User
+from services import reminder_sweeper
+
+
+@pytest.fixture
+def moscow_time(monkeypatch):
+    """Run with the local clock at UTC+3, like the venue"""
+    monkeypatch.setenv("TZ", "Etc/GMT-3")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+async def add_bookings(*bookings: dict):
+    async with async_session_maker() as session:
+        user = User(telegram_id=111, phone_number="+79000000001")
+        session.add(user)
+        await session.flush()
+        session.add_all(Booking(user_id=user.id, service_name="VR Арена", duration_minutes=60, **b) for b in bookings)
+        await session.commit()
+
+
+def test_reminder_needs_a_day_of_notice_on_the_local_clock(database, moscow_time):
+    now = datetime.now()
+    visit = now + timedelta(hours=23, minutes=30)
+    run(add_bookings(
+        # Made 23.5 hours before the visit: no reminder, though 26.5 hours in UTC terms
+        {"bukza_booking_id": "SHORT", "booking_datetime": visit, "created_at": datetime.utcnow()},
+        {"bukza_booking_id": "AHEAD", "booking_datetime": visit, "created_at": datetime.utcnow() - timedelta(hours=2)},
+    ))
+
+    due = run(reminder_sweeper._find_due_reminders(now))
+
+    assert [booking.bukza_booking_id for booking, _ in due] == ["AHEAD"]
+
+
+def test_unsendable_bookings_do_not_use_up_the_batch(database, monkeypatch):
+    monkeypatch.setattr(reminder_sweeper, "SWEEP_BATCH_SIZE", 5)
+    now = datetime.now()
+    made = datetime.utcnow() - timedelta(days=3)
+    run(add_bookings(
+        *[{"bukza_booking_id": f"SHORT{i}", "booking_datetime": now + timedelta(hours=23),
+           "created_at": datetime.utcnow()} for i in range(10)],
+        *[{"bukza_booking_id": f"OVER{i}", "booking_datetime": now - timedelta(hours=30),
+           "created_at": made} for i in range(10)],
+        {"bukza_booking_id": "REMIND", "booking_datetime": now + timedelta(hours=23, minutes=30), "created_at": made},
+        {"bukza_booking_id": "FEEDBACK", "booking_datetime": now - timedelta(hours=2), "created_at": made},
+    ))
+
+    reminders = run(reminder_sweeper._find_due_reminders(now))
+    feedback = run(reminder_sweeper._find_due_feedback(now))
+
+    assert [booking.bukza_booking_id for booking, _ in reminders] == ["REMIND"]
+    assert [booking.bukza_booking_id for booking, _ in feedback] == ["FEEDBACK"]
@@ -0,0 +1,49 @@
+"""Batching of standalone writes (database/sqlite_writer.py)"""
+import asyncio
+
+from sqlalchemy import select
+
+from database import async_session_maker, engine
+from database.models import User
+from database.sqlite_writer import SQLiteWriter
+
+
+def add_user(telegram_id: int, fail: bool = False):
+    async def job(session):
+        session.add(User(telegram_id=telegram_id))
+        await session.flush()
+        if fail:
+            raise ValueError(f"job {telegram_id} failed")
+        return telegram_id
+    return job
+
+
+async def stored_users() -> list[int]:
+    async with async_session_maker() as session:
+        return sorted((await session.execute(select(User.telegram_id))).scalars())
+
+
+def test_failed_batch_is_rolled_back_and_only_the_failing_caller_gets_the_error(database):
+    writer = SQLiteWriter(async_session_maker, enabled=True)
+
+    async def scenario():
+        try:
+            # Queued together, so they share the writer's first transaction
+            results = await asyncio.gather(
+                writer.run(add_user(1)), writer.run(add_user(2, fail=True)), writer.run(add_user(3)),
+                return_exceptions=True
+            )
+            return results, await stored_users()
+        finally:
+            await writer.stop()
+            await engine.dispose()
+
+    (first, failed, third), users = asyncio.run(scenario())
+
+    # The batch was rolled back and its jobs retried one by one
+    assert (first, third) == (1, 3)
+    assert isinstance(failed, ValueError) and str(failed) == "job 2 failed"
+    assert users == [1, 3]
+    stats = writer.stats()
+    assert (stats["isolated_batches"], stats["failed_writes"], stats["batches"], stats["writes"]) == (1, 1, 2, 2)
+
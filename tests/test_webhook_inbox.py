@@ -0,0 +1,124 @@
+"""Ordering and claims of the webhook inbox (services/webhook_inbox.py)"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from database import async_session_maker, engine
+from database.models import InboxStatus, WebhookInbox
+from database.repository import InboxRepository
+from services.webhook_inbox import InboxProcessor
+
+
+def run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+async def add(code: str, message_type: str) -> int:
+    async with async_session_maker() as session:
+        return await InboxRepository(session).add(code, message_type, json.dumps({"code": code}), message_type)
+
+
+async def claim(now: datetime, exclude_codes: set[str] = frozenset()) -> list[tuple[str, str]]:
+    async with async_session_maker() as session:
+        events = await InboxRepository(session).claim_ready(now, 10, set(exclude_codes))
+    return [(event.booking_code, event.message_type) for event in events]
+
+
+async def statuses() -> dict[int, InboxStatus]:
+    async with async_session_maker() as session:
+        result = await session.execute(select(WebhookInbox.id, WebhookInbox.status))
+        return dict(result.all())
+
+
+def test_later_event_waits_for_earlier_event_of_the_booking(database):
+    async def scenario():
+        new_a = await add("A", "newrega")
+        await add("A", "cancel")
+        await add("B", "newrega")
+        now = datetime.utcnow()
+
+        # PENDING earlier event: only the first event of each booking is ready
+        assert await claim(now, {"A"}) == [("B", "newrega")]
+        # PROCESSING earlier event: the cancel still waits
+        assert await claim(now) == [("A", "newrega")]
+        assert await claim(now) == []
+
+        async with async_session_maker() as session:
+            await InboxRepository(session).mark_done(new_a)
+        assert await claim(now) == [("A", "cancel")]
+
+    run(scenario())
+
+
+def test_dead_event_unblocks_the_next_one(database):
+    async def scenario():
+        new_a = await add("A", "newrega")
+        await add("A", "cancel")
+        now = datetime.utcnow()
+        assert await claim(now) == [("A", "newrega")]
+
+        async with async_session_maker() as session:
+            await InboxRepository(session).mark_failed(new_a, "boom", now + timedelta(hours=1))
+        # A retry scheduled later still blocks the booking
+        assert await claim(now) == []
+
+        await claim(now + timedelta(hours=2))
+        async with async_session_maker() as session:
+            await InboxRepository(session).mark_failed(new_a, "boom", None)
+        assert await claim(now + timedelta(hours=2)) == [("A", "cancel")]
+        assert (await statuses())[new_a] == InboxStatus.DEAD
+
+    run(scenario())
+
+
+def test_release_stale_returns_only_unrenewed_claims(database):
+    async def scenario():
+        lost = await add("A", "newrega")
+        renewed = await add("B", "newrega")
+        claimed_at = datetime.utcnow()
+        await claim(claimed_at)
+
+        # Ten minutes later only one claim was renewed
+        now = claimed_at + timedelta(minutes=10)
+        async with async_session_maker() as session:
+            repo = InboxRepository(session)
+            await repo.renew_claims([renewed], now)
+            assert await repo.release_stale(now - timedelta(minutes=5)) == 1
+
+        assert await statuses() == {lost: InboxStatus.PENDING, renewed: InboxStatus.PROCESSING}
+        assert await claim(now) == [("A", "newrega")]
+
+    run(scenario())
+
+
+def test_slow_event_is_not_taken_over_by_another_process(database):
+    handled = []
+
+    async def slow_handler(bot, payload):
+        handled.append(payload["code"])
+        await asyncio.sleep(1.5)
+
+    async def scenario():
+        processors = [
+            InboxProcessor(workers=1, poll_interval=0.1, stale_after=timedelta(seconds=0.6))
+            for _ in range(2)
+        ]
+        for processor in processors:
+            processor.start(None, slow_handler)
+        try:
+            await processors[0].enqueue("A", "newrega", {"code": "A"}, "newrega")
+            await asyncio.sleep(2.5)
+        finally:
+            for processor in processors:
+                await processor.stop()
+        assert list((await statuses()).values()) == [InboxStatus.DONE]
+
+    run(scenario())
+    assert handled == ["A"]